@@ -25,25 +25,100 @@ THE SOFTWARE.
 """
 
 from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+import atexit
 import os
+import pipes
 import re
 import socket
 import time
-import urllib
-import urllib2
 import base64
-import csv
 import sys
-import random
-import ssl
-import httplib
+import tempfile
 import json
+import threading
+import Queue
+import sqlite3
+import zlib
 
 import boto
 import boto.ec2
+import boto.vpc
 import paramiko
 
+from beegeeswithmachineguns import history
+from beegeeswithmachineguns import ramp
+from beegeeswithmachineguns.live import LiveView
+from beegeeswithmachineguns.local import LocalBackend
+from beegeeswithmachineguns import shards
+from beegeeswithmachineguns.results import SwarmResults
+from beegeeswithmachineguns.tracing import Traced, tracer
+
 STATE_FILENAME = os.path.expanduser('~/.beegees')
+ROSTER_VERSION = 1
+# how long cached hostnames and states are trusted before asking EC2 again
+ROSTER_TTL = 15 * 60
+
+CHECKIN_TEST_REPO = 'https://github.com/NewSpring/ops-checkin-test'
+
+# beegees hand the installed checkin-test to each other over HTTP on this
+# port, so it needs to be open between members of the security group
+BUNDLE_PORT = 8642
+BUNDLE_FILENAME = 'beegees-bundle.tgz'
+BUNDLE_MARKER = '.beegees-bundle'
+# a fetch gives up on a source it cannot connect to in BUNDLE_CONNECT_TIMEOUT seconds, or that takes longer than BUNDLE_FETCH_TIMEOUT
+BUNDLE_CONNECT_TIMEOUT = 5
+BUNDLE_FETCH_TIMEOUT = 600
+
+# seconds between arming the swarm and the shared moment it opens fire
+START_LEAD = 2
+START_MARKER = 'BEEGEES_START'
+
+# a beegee's clock is read this many times when she is armed, the quickest round trip is trusted
+CLOCK_SAMPLES = 8
+# prints the beegee's time for every line it is sent, from bash itself where it can
+CLOCK_COMMAND = 'export LC_ALL=C; while read line; do echo ${EPOCHREALTIME:-$(date +%s.%N)}; done'
+
+# the HTTP engine is copied to each beegee's home and writes its results next to it
+ENGINE_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'engine.py')
+ENGINE_FILENAME = 'beegees-engine.py'
+ENGINE_RESULTS = 'beegees-engine.json'
+
+# the engine can fail thousands of requests, only this many are listed by name
+MAX_PRINTED_FAILURES = 50
+
+# beegees gzip their results at the fastest level, mocha's JSON is repetitive enough to shrink several times over
+DETAILS_GZIP = 'gzip -1'
+
+# each beegee notes the attack's process id, so it can be called off, and
+# writes her live snapshots (see live.py) to a file named for the attack
+ATTACK_PIDFILE = 'beegees-attack.pid'
+# in her home directory, as the suite reads the path after changing into checkin-test
+LIVE_FILENAME = '$HOME/beegees-live-%i.jsonl'
+
+# with a deadline, a beegee's results get this many seconds of their own to come back once she has finished firing
+DETAILS_DEADLINE = 300
+
+# EC2 can take a while to describe an instance it has just launched, it is asked this many times
+NEW_INSTANCE_ATTEMPTS = 5
+
+# a beegee that will not take SSH is retried this many times, waiting
+# CONNECT_BACKOFF seconds and doubling that after every attempt
+CONNECT_RETRIES = 3
+CONNECT_BACKOFF = 1
+
+# EC2 errors meaning a zone or instance type has no room for more beegees, so try the next one
+CAPACITY_ERRORS = ('InsufficientInstanceCapacity', 'InstanceLimitExceeded', 'InsufficientFreeAddressesInSubnet',
+                   'MaxSpotInstanceCountExceeded', 'Unsupported')
+
+# beegees spend their time blocked on SSH, so threads are the default. Threads
+# also share the pooled SSH transports, processes each open their own.
+EXECUTORS = {
+    'thread': ThreadPool,
+    'process': Pool,
+}
+
+_executor = {'kind': 'thread', 'workers': 64}
 
 class bcolors:
     HEADER = '\033[95m'
@@ -57,29 +132,133 @@ class bcolors:
 
 # Utilities
 
-def _read_server_list():
-    instance_ids = []
-
+def _read_roster():
+    """
+    Load the roster from the state file, or None if no swarm is mobilized.
+    """
     if not os.path.isfile(STATE_FILENAME):
-        return (None, None, None, None)
+        return None
 
     with open(STATE_FILENAME, 'r') as f:
-        username = f.readline().strip()
-        key_name = f.readline().strip()
-        zone = f.readline().strip()
         text = f.read()
-        instance_ids = [i for i in text.split('\n') if i != '']
 
-        print 'Read %i beegees from the roster.' % len(instance_ids)
+    if text.startswith('{'):
+        roster = json.loads(text)
+        if roster.get('version', 0) > ROSTER_VERSION:
+            raise Exception('The roster at %s was written by a newer version of beegees.' % STATE_FILENAME)
+        return roster
+
+    # the original roster was the user, key and zone on a line each followed by the instance ids
+    lines = text.split('\n')
+    return {
+        'version': 0,
+        'username': lines[0].strip(),
+        'key_name': lines[1].strip(),
+        'zone': lines[2].strip(),
+        'updated': 0,
+        'bees': [{'id': i.strip()} for i in lines[3:] if i.strip() != '']
+    }
+
+def _write_roster(roster):
+    """
+    Atomically replace the state file with the given roster.
+    """
+    roster['version'] = ROSTER_VERSION
+
+    fd, temp_path = tempfile.mkstemp(prefix='.beegees-', dir=os.path.dirname(STATE_FILENAME))
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(roster, f, indent=1, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(temp_path, STATE_FILENAME)
+    except:
+        os.remove(temp_path)
+        raise
+
+def _instance_to_bee(instance):
+    return {
+        'id': instance.id,
+        'state': instance.state,
+        'public_dns_name': instance.public_dns_name or '',
+        'private_dns_name': instance.private_dns_name or '',
+        'private_ip_address': instance.private_ip_address,
+        'zone': instance.placement
+    }
+
+def _read_server_list():
+    roster = _read_roster()
+
+    if roster is None:
+        return (None, None, None, None)
+
+    instance_ids = [bee['id'] for bee in roster['bees']]
+
+    print 'Read %i beegees from the roster.' % len(instance_ids)
 
-    return (username, key_name, zone, instance_ids)
+    return (roster['username'], roster['key_name'], roster['zone'], instance_ids)
 
 def _write_server_list(username, key_name, zone, instances):
-    with open(STATE_FILENAME, 'w') as f:
-        f.write('%s\n' % username)
-        f.write('%s\n' % key_name)
-        f.write('%s\n' % zone)
-        f.write('\n'.join([instance.id for instance in instances]))
+    _write_roster({
+        'username': username,
+        'key_name': key_name,
+        'zone': zone,
+        'updated': time.time(),
+        'bees': [_instance_to_bee(instance) for instance in instances]
+    })
+
+def _get_zone(roster, bee):
+    """
+    The zone a beegee is in. Rosters from before fleets name one zone for the whole swarm.
+    """
+    return bee.get('zone') or roster['zone'].split(',')[0]
+
+def _roster_is_fresh(roster):
+    if time.time() - roster.get('updated', 0) > ROSTER_TTL:
+        return False
+
+    return all(bee.get('state') == 'running' and _get_hostname(bee) for bee in roster['bees'])
+
+def _get_bees(refresh=False):
+    """
+    Return the roster with every beegee's hostname and state filled in.
+
+    The cached roster is used while it is fresh; otherwise, or when refresh is
+    set, the hive is asked and the roster rewritten.
+    """
+    roster = _read_roster()
+
+    if roster is None or not roster['bees']:
+        return None
+
+    print 'Read %i beegees from the roster.' % len(roster['bees'])
+
+    if not refresh and _roster_is_fresh(roster):
+        return roster
+
+    roster['bees'] = _get_backend(roster).refresh(roster)
+    roster['updated'] = time.time()
+
+    _write_roster(roster)
+
+    return roster
+
+def _get_hostname(bee):
+    return bee.get('private_dns_name') if not bee.get('public_dns_name') else bee['public_dns_name']
+
+def _bee_to_params(i, bee, username, key_name, backend='ec2'):
+    return {
+        'i': i,
+        'instance_id': bee['id'],
+        'instance_name': _get_hostname(bee),
+        'private_address': bee.get('private_ip_address') or bee.get('private_dns_name'),
+        'username': username,
+        'key_name': key_name,
+        'backend': backend
+    }
+
+def _get_bee_params(roster):
+    return [_bee_to_params(i, bee, roster['username'], roster['key_name'], roster.get('backend', 'ec2')) for i, bee in enumerate(roster['bees'])]
 
 def _delete_server_list():
     os.remove(STATE_FILENAME)
@@ -87,33 +266,492 @@ def _delete_server_list():
 def _get_pem_path(key):
     return os.path.expanduser('~/.ssh/%s.pem' % key)
 
+def set_executor(kind='thread', workers=64):
+    """
+    Choose how per-beegee work is fanned out and how many beegees are handled at once.
+
+    A workers value of 0 or less means one worker per beegee.
+    """
+    if kind not in EXECUTORS:
+        raise ValueError('Unknown executor %r, expected one of: %s' % (kind, ', '.join(sorted(EXECUTORS))))
+
+    _executor['kind'] = kind
+    _executor['workers'] = workers
+
+def _get_pool(size, all_at_once=False):
+    """
+    A worker pool for size beegees, capped at the configured number of workers
+    unless every beegee has to be worked on at the same time.
+    """
+    workers = _executor['workers']
+    if all_at_once or workers <= 0 or workers > size:
+        workers = size
+    return EXECUTORS[_executor['kind']](max(workers, 1))
+
+def _in_worker(func):
+    """
+    func as a pool should run it, bringing home the spans recorded in worker processes.
+    """
+    if _executor['kind'] == 'process' and tracer.enabled:
+        return Traced(func)
+    return func
+
+def _fan_out(func, params):
+    """
+    Call func once per beegee on a bounded worker pool and return the results in order.
+    """
+    if not params:
+        return []
+
+    pool = _get_pool(len(params))
+    try:
+        return [tracer.receive(result) for result in pool.map(_in_worker(func), params)]
+    finally:
+        pool.close()
+        pool.join()
+
+def _ssh_connect(host, username, key_name, bee=None):
+    client = paramiko.SSHClient()
+    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+
+    with tracer.span('ssh.connect', bee, host=host):
+        sock = socket.create_connection((host, 22), timeout=30)
+
+    pem_path = key_name and _get_pem_path(key_name) or None
+    if not pem_path or not os.path.isfile(pem_path):
+        client.load_system_host_keys()
+        client.connect(host, username=username, sock=sock)
+    else:
+        client.connect(
+            host,
+            username=username,
+            key_filename=pem_path,
+            sock=sock)
+
+    client.get_transport().set_keepalive(30)
+
+    return client
+
+class SSHSessionPool(object):
+    """
+    Keeps one authenticated SSH transport per beegee for the whole command.
+
+    Every command runs on its own channel of that transport, so the handshake
+    is paid once per beegee no matter how many phases or commands use it.
+
+    Beegees are reached through their backend's connect, unless a connect
+    function is given for all of them.
+    """
+    def __init__(self, connect=None, retries=CONNECT_RETRIES, backoff=CONNECT_BACKOFF):
+        self.connect = connect
+        self.retries = retries
+        self.backoff = backoff
+        self.clients = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def get(self, params):
+        key = (params['instance_name'], params['username'])
+
+        with self.lock:
+            host_lock = self.locks.setdefault(key, threading.Lock())
+
+        # only one thread handshakes with a given beegee, the rest wait for it
+        with host_lock:
+            client = self.clients.get(key)
+            transport = client and client.get_transport()
+            if transport is None or not transport.is_active():
+                with tracer.span('ssh.handshake', params.get('i'), host=params['instance_name']):
+                    client = self._connect(params)
+                self.clients[key] = client
+            return client
+
+    def _connect(self, params):
+        connect = self.connect or BACKENDS[params.get('backend', 'ec2')].connect
+        for attempt in range(self.retries + 1):
+            try:
+                return connect(params['instance_name'], params['username'], params.get('key_name'), bee=params.get('i'))
+            except paramiko.AuthenticationException:
+                # the wrong key stays wrong however often it is tried
+                raise
+            except (socket.error, paramiko.SSHException):
+                if attempt == self.retries:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def open(self, params, command):
+        """
+        Start command on a fresh channel and return the channel.
+        """
+        client = self.get(params)
+        with tracer.span('ssh.exec', params.get('i'), command=command):
+            channel = client.get_transport().open_session()
+            channel.exec_command(command)
+        return channel
+
+    def close(self):
+        with self.lock:
+            clients, self.clients = self.clients.values(), {}
+        for client in clients:
+            client.close()
+
+_ssh_sessions = SSHSessionPool()
+atexit.register(_ssh_sessions.close)
+
+def _ssh_exec_many(params, commands):
+    """
+    Run commands side by side on parallel channels of the beegee's transport.
+
+    Returns a (stdout, stderr) pair per command.
+    """
+    channels = [_ssh_sessions.open(params, command) for command in commands]
+
+    results = []
+    for channel in channels:
+        stdout = channel.makefile('rb').read()
+        stderr = channel.makefile_stderr('rb').read()
+        channel.close()
+        results.append((stdout, stderr))
+
+    return results
+
+def _ssh_exec(params, command):
+    return _ssh_exec_many(params, [command])[0]
+
+class DeadlineExceeded(socket.timeout):
+    """
+    A beegee took longer than she was given.
+    """
+
+class DetailsDeadlineExceeded(DeadlineExceeded):
+    """
+    A beegee was still sending her results DETAILS_DEADLINE seconds after her attack.
+    """
+
+class CalledOff(socket.error):
+    """
+    The attack was called off before a beegee opened fire.
+    """
+
+def _iter_channel(channel, size=32768, stats=None, deadline=None):
+    """
+    Yield a channel's stdout as it arrives, throwing stderr away so it cannot stall the remote command.
+
+    The number of bytes read is added up in stats['bytes'] when given. Raises
+    DeadlineExceeded once the time.time() given as deadline has passed.
+    """
+    channel.settimeout(1)
+    while True:
+        if deadline is not None and time.time() > deadline:
+            raise DeadlineExceeded('still going at the deadline')
+
+        try:
+            chunk = channel.recv(size)
+        except socket.timeout:
+            chunk = None
+
+        while channel.recv_stderr_ready():
+            channel.recv_stderr(size)
+
+        if chunk is None:
+            continue
+        if not chunk:
+            break
+
+        if stats is not None:
+            stats['bytes'] = stats.get('bytes', 0) + len(chunk)
+
+        yield chunk
+
+def _compressed(command):
+    """
+    Have a beegee gzip what command prints, if she has gzip.
+    """
+    return 'if command -v gzip > /dev/null; then (%s) | %s; else %s; fi' % (command, DETAILS_GZIP, command)
+
+def _iter_gunzipped(chunks, stats=None):
+    """
+    Decompress a stream of chunks as it arrives if it is gzipped, passing it on untouched if not.
+
+    The number of bytes after decompression is added up in stats['raw_bytes'] when given.
+    """
+    decompressor = None
+    head = ''
+
+    for chunk in chunks:
+        if head is not None:
+            # the first two bytes tell gzip from plain text
+            head += chunk
+            if len(head) < 2:
+                continue
+            if head.startswith('\x1f\x8b'):
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            chunk, head = head, None
+
+        if decompressor is not None:
+            chunk = decompressor.decompress(chunk)
+
+        if stats is not None:
+            stats['raw_bytes'] = stats.get('raw_bytes', 0) + len(chunk)
+
+        if chunk:
+            yield chunk
+
+    tail = decompressor.flush() if decompressor is not None else head or ''
+
+    if stats is not None:
+        stats['raw_bytes'] = stats.get('raw_bytes', 0) + len(tail)
+
+    if tail:
+        yield tail
+
 def _get_region(zone):
     return zone if 'gov' in zone else zone[:-1] # chop off the "d" in the "us-east-1d" to get the "Region"
 
+# EC2 connections by region, kept for the rest of the command
+_ec2_connections = {}
+
+def _connect_to_region(zone):
+    """
+    Connect to EC2 in the zone's region. Benchmarks swap this for a fake.
+    """
+    region = _get_region(zone)
+    if region not in _ec2_connections:
+        _ec2_connections[region] = boto.ec2.connect_to_region(region)
+    return _ec2_connections[region]
+
+# security group ids by region, names and whether they are for a VPC, which do not change during a run
+_security_group_ids = {}
+
 def _get_security_group_ids(connection, security_group_names, subnet):
+    region = getattr(getattr(connection, 'region', None), 'name', None)
+    key = (region, tuple(security_group_names), subnet is None)
+
+    if key in _security_group_ids:
+        return _security_group_ids[key]
+
     ids = []
     # Since we cannot get security groups in a vpc by name, we get all security groups and parse them by name later
-    security_groups = connection.get_all_security_groups()
+    with tracer.span('ec2.describe_security_groups'):
+        security_groups = connection.get_all_security_groups()
 
-    # Parse the name of each security group and add the id of any match to the group list
+    # Parse the name of each security group and add the id of any match to the group list,
+    # classic groups for classic instances and VPC groups for instances in a subnet
     for group in security_groups:
-        for name in security_group_names:
-            if group.name == name:
-                if subnet == None:
-                    if group.vpc_id == None:
-                        ids.append(group.id)
-                    elif group.vpc_id != None:
-                        ids.append(group.id)
+        if group.name in security_group_names and (group.vpc_id is None) == (subnet is None):
+            ids.append(group.id)
 
-        return ids
+    _security_group_ids[key] = ids
 
-# Methods
+    return ids
 
-def up(count, group, zone, image_id, instance_type, username, key_name, subnet, bid = None):
+# the zone of every subnet, by region and then subnet id, looked up once per run
+_subnet_zones = {}
+
+def forget_ec2_state():
     """
-    Startup the load testing server.
+    Drop the EC2 connections and the security groups and subnets they were
+    asked about, which the daemon does before every command.
+    """
+    _ec2_connections.clear()
+    _security_group_ids.clear()
+    _subnet_zones.clear()
+
+def _pick_subnet(zone, subnets, look_up):
+    """
+    The first of the subnets that is in the zone, or None if none of them are.
+
+    Unless look_up is set a lone subnet is taken to be in the zone, as it
+    was before beegees could be called up across zones.
+    """
+    if not subnets:
+        return None
+
+    if len(subnets) == 1 and not look_up:
+        return subnets[0]
+
+    region = _get_region(zone)
+
+    if region not in _subnet_zones:
+        with tracer.span('ec2.describe_subnets'):
+            found = boto.vpc.connect_to_region(region).get_all_subnets()
+        _subnet_zones[region] = dict((subnet.id, subnet.availability_zone) for subnet in found)
+
+    for subnet in subnets:
+        if _subnet_zones[region].get(subnet) == zone:
+            return subnet
+
+    return None
+
+def _get_image_id(image_id, zone):
+    """
+    The AMI to call up beegees from in the zone, or None if there is none.
+
+    AMIs belong to a region, so for a swarm across regions image_id is
+    REGION=AMI pairs separated by commas.
+    """
+    if '=' not in image_id:
+        return image_id
+
+    images = dict(pair.split('=', 1) for pair in image_id.split(','))
+
+    return images.get(_get_region(zone))
+
+def _group_by_region(roster):
+    """
+    The roster's beegees as (a zone in the region, beegees) pairs, a pair per region.
+    """
+    groups = []
+    regions = {}
+
+    for bee in roster['bees']:
+        zone = _get_zone(roster, bee)
+        region = _get_region(zone)
+        if region not in regions:
+            regions[region] = len(groups)
+            groups.append((zone, []))
+        groups[regions[region]][1].append(bee)
+
+    return groups
+
+def _group_by_connection(instances, default):
+    """
+    The instances as (connection, instances) pairs, a pair per connection they came from.
+    """
+    groups = []
+
+    for instance in instances:
+        connection = getattr(instance, 'connection', None) or default
+        for group_connection, group in groups:
+            if group_connection is connection:
+                group.append(instance)
+                break
+        else:
+            groups.append((connection, [instance]))
+
+    return groups
+
+def _per_region(func, jobs):
+    """
+    map func over jobs, a job per region, all of them at once.
+    """
+    if len(jobs) <= 1:
+        return map(func, jobs)
+
+    # EC2 calls only wait on the network, so threads will do whatever the executor
+    pool = ThreadPool(len(jobs))
+    try:
+        return pool.map(func, jobs)
+    finally:
+        pool.close()
+
+def _merge(iterators, stop=None):
+    """
+    Yield from every iterator at once, in the order their items come in.
+
+    The first error any of them raised is raised once they have all finished.
+    Once stop, a threading.Event, is set no more items are taken from them.
+    """
+    if len(iterators) == 1:
+        for item in iterators[0]:
+            yield item
+        return
+
+    merged = Queue.Queue()
+
+    def drain(iterator):
+        try:
+            for item in iterator:
+                if stop is not None and stop.is_set():
+                    return
+                merged.put(('item', item))
+            merged.put(('done', None))
+        except Exception as e:
+            merged.put(('error', e))
+
+    for iterator in iterators:
+        thread = threading.Thread(target=drain, args=(iterator,))
+        thread.daemon = True
+        thread.start()
+
+    error = None
+    finished = 0
+
+    while finished < len(iterators):
+        kind, value = merged.get()
+        if kind == 'item':
+            yield value
+        else:
+            finished += 1
+            error = error or value
+
+    if error is not None:
+        raise error
+
+def _describe_instances(roster):
+    """
+    The roster's instances as EC2 has them now, asking every region at once.
+    """
+    def describe(job):
+        zone, bees = job
+        with tracer.span('ec2.describe_instances', count=len(bees), region=_get_region(zone)):
+            reservations = _connect_to_region(zone).get_all_instances(instance_ids=[bee['id'] for bee in bees])
+        return [instance for reservation in reservations for instance in reservation.instances]
+
+    return sum(_per_region(describe, _group_by_region(roster)), [])
+
+class EC2Backend(object):
+    """
+    Beegees as EC2 instances, reached over SSH.
+
+    Calling them up is left to up() and deploy(), which know about spot
+    requests and quorums; the other backends call up beegees with launch().
+    """
+    name = 'ec2'
+
+    def refresh(self, roster):
+        """
+        The roster's beegees with their hostnames and states as EC2 has them now.
+        """
+        print 'Connecting to the hive.'
+
+        return [_instance_to_bee(instance) for instance in _describe_instances(roster)]
+
+    def terminate(self, roster):
+        """
+        Terminate the roster's instances, returning the ids of those stood down.
+        """
+        print 'Connecting to the hive.'
+
+        print 'Calling off the swarm.'
+
+        def stand_down(job):
+            zone, bees = job
+            with tracer.span('ec2.terminate_instances', count=len(bees), region=_get_region(zone)):
+                return _connect_to_region(zone).terminate_instances(instance_ids=[bee['id'] for bee in bees])
+
+        return sum(_per_region(stand_down, _group_by_region(roster)), [])
+
+    def connect(self, host, username, key_name, bee=None):
+        return _ssh_connect(host, username, key_name, bee)
+
+# where beegees can be called up, a roster names the one its beegees are from
+BACKENDS = {
+    'ec2': EC2Backend(),
+    'local': LocalBackend(),
+}
+
+def _get_backend(roster):
+    return BACKENDS[roster.get('backend', 'ec2')]
+
+# Methods
+
+def _muster(count, zone, username, key_name):
     """
+    Work out how many more beegees to call up, standing down a roster that cannot be reused.
 
+    Returns the number still to call up and the ids of the beegees already on the roster.
+    """
     existing_username, existing_key_name, existing_zone, instance_ids = _read_server_list()
 
     count = int(count)
@@ -121,20 +759,23 @@ def up(count, group, zone, image_id, instance_type, username, key_name, subnet,
         # User, key and zone match existing values and instance ids are found on state file
         if count <= len(instance_ids):
             # Count is less than the amount of existing instances. No need to create new ones.
-            print 'BeeGees are already assembled and awaiting orders.'
-            return
+            return 0, instance_ids
         else:
             # Count is greater than the amount of existing instances. Need to create the only the extra instances.
-            count -= len(instance_ids)
+            return count - len(instance_ids), instance_ids
     elif instance_ids:
         # Instances found on state file but user, key and/or zone not matching existing value.
         # State file only stores one user/key/zone config combination so instances are unusable.
         print 'Taking down {} unusable beegees.'.format(len(instance_ids))
         # Redirect prints in down() to devnull to avoid duplicate messages
         _redirect_stdout('/dev/null', down)
-        # down() deletes existing state file so _read_server_list() returns a blank state
-        existing_username, existing_key_name, existing_zone, instance_ids = _read_server_list()
 
+    return count, []
+
+def _connect_to_hive(zone, key_name):
+    """
+    Connect to EC2 in the zone's region, returning the exception if that fails.
+    """
     pem_path = _get_pem_path(key_name)
 
     if not os.path.isfile(pem_path):
@@ -143,7 +784,7 @@ def up(count, group, zone, image_id, instance_type, username, key_name, subnet,
     print 'Connecting to the hive.'
 
     try:
-        ec2_connection = boto.ec2.connect_to_region(_get_region(zone))
+        ec2_connection = _connect_to_region(zone)
     except boto.exception.NoAuthHandlerFound as e:
         print "Authenciation config error, perhaps you do not have a ~/.boto file with correct permissions?"
         print e.message
@@ -156,151 +797,316 @@ def up(count, group, zone, image_id, instance_type, username, key_name, subnet,
     if ec2_connection == None:
         raise Exception("Invalid zone specified? Unable to connect to region using zone name")
 
+    return ec2_connection
+
+def _call_up(ec2_connection, count, group, zone, image_id, instance_type, key_name, subnet, bid, spot_interval, spot_deadline, quiet=False):
+    """
+    Ask EC2 for count new beegees.
+
+    Returns the new instances, or for spot beegees an iterator yielding them as
+    their requests are fulfilled. Returns the exception if EC2 refuses, which
+    is printed unless quiet is set.
+    """
     if bid:
-        print 'Attempting to call up %i spot beegees, this can take a while...' % count
-
-        spot_requests = ec2_connection.request_spot_instances(
-            image_id=image_id,
-            price=bid,
-            count=count,
-            key_name=key_name,
-            security_groups=[group] if subnet is None else _get_security_group_ids(ec2_connection, [group], subnet),
-            instance_type=instance_type,
-            placement=None if 'gov' in zone else zone,
-            subnet_id=subnet)
-
-        # it can take a few seconds before the spot requests are fully processed
-        time.sleep(5)
-
-        instances = _wait_for_spot_request_fulfillment(ec2_connection, spot_requests)
-    else:
-        print 'Attempting to call up %i beegees.' % count
+        if not quiet:
+            print 'Attempting to call up %i spot beegees, this can take a while...' % count
 
-        try:
-            reservation = ec2_connection.run_instances(
+        with tracer.span('ec2.request_spot_instances', count=count):
+            spot_requests = ec2_connection.request_spot_instances(
                 image_id=image_id,
-                min_count=count,
-                max_count=count,
+                price=bid,
+                count=count,
                 key_name=key_name,
                 security_groups=[group] if subnet is None else _get_security_group_ids(ec2_connection, [group], subnet),
                 instance_type=instance_type,
                 placement=None if 'gov' in zone else zone,
                 subnet_id=subnet)
+
+        return _iter_spot_instances(ec2_connection, spot_requests, spot_interval, spot_deadline)
+    else:
+        if not quiet:
+            print 'Attempting to call up %i beegees.' % count
+
+        try:
+            with tracer.span('ec2.run_instances', count=count):
+                reservation = ec2_connection.run_instances(
+                    image_id=image_id,
+                    min_count=count,
+                    max_count=count,
+                    key_name=key_name,
+                    security_groups=[group] if subnet is None else _get_security_group_ids(ec2_connection, [group], subnet),
+                    instance_type=instance_type,
+                    placement=None if 'gov' in zone else zone,
+                    subnet_id=subnet)
         except boto.exception.EC2ResponseError as e:
-            print "Unable to call beegees:", e.message
+            if not quiet:
+                print "Unable to call beegees:", e.message
             return e
 
-        instances = reservation.instances
+        return reservation.instances
 
-    if instance_ids:
-        existing_reservations = ec2_connection.get_all_instances(instance_ids=instance_ids)
-        existing_instances = [r.instances[0] for r in existing_reservations]
-        map(instances.append, existing_instances)
+def _call_up_fleet(connections, count, group, zones, image_id, instance_types, key_name, subnets, bid, spot_interval, spot_deadline, chunk):
+    """
+    Ask EC2 for count new beegees chunk at a time, all chunks at once.
 
-    print 'Waiting for beegees to load their machine guns...'
+    Every pairing of a zone and an instance type is an option, in order of
+    instance type preference. Chunks start in successive zones with the
+    first instance type so the swarm is spread over the zones, and a chunk
+    EC2 has no room for moves on to the next option; an option that ran out
+    is not tried again. connections holds a connection per region and is added
+    to as regions are called on.
 
-    instance_ids = instance_ids or []
+    Returns an iterator yielding the new instances as their chunks come in.
+    """
+    options = [(zone, instance_type) for instance_type in instance_types for zone in zones]
+    sizes = [chunk] * (count // chunk) + ([count % chunk] if count % chunk else [])
+    exhausted = set()
+    lock = threading.Lock()
+
+    def say(message):
+        # a line in one write, so chunks calling up at once do not garble each other
+        sys.stdout.write(message + '\n')
 
-    for instance in filter(lambda i: i.state == 'pending', instances):
-        instance.update()
-        while instance.state != 'running':
-            print '.'
-            time.sleep(5)
-            instance.update()
+    def connect(zone):
+        with lock:
+            region = _get_region(zone)
+            if region not in connections:
+                connections[region] = _connect_to_region(zone)
+            return connections[region]
 
-        instance_ids.append(instance.id)
+    def fill(index, size):
+        landed = 0
+
+        try:
+            for attempt in range(len(options)):
+                option = options[(index % len(zones) + attempt) % len(options)]
+                if option in exhausted:
+                    continue
 
-        print 'BeeGee %s is ready for the attack.' % instance.id
+                zone, instance_type = option
+                zone_image_id = _get_image_id(image_id, zone)
+                subnet = _pick_subnet(zone, subnets, len(zones) > 1)
 
-    ec2_connection.create_tags(instance_ids, { "Name": "a bee!" })
+                if zone_image_id is None or (subnets and subnet is None):
+                    say('No %s given for %s, skipping it.' % ('AMI' if zone_image_id is None else 'subnet', zone))
+                    exhausted.add(option)
+                    continue
+
+                say('Attempting to call up %i %s%s beegees in %s.' % (size, 'spot ' if bid else '', instance_type, zone))
+
+                try:
+                    called_up = _call_up(connect(zone), size, group, zone, zone_image_id, instance_type, key_name, subnet, bid, spot_interval, spot_deadline, quiet=True)
+                    if isinstance(called_up, Exception):
+                        raise called_up
+
+                    for instance in called_up:
+                        landed += 1
+                        yield instance
+
+                    return
+                except boto.exception.EC2ResponseError as e:
+                    # once some have landed trying elsewhere would call up the chunk twice
+                    if e.error_code not in CAPACITY_ERRORS or landed:
+                        say('Unable to call up %i beegees in %s: %s' % (size - landed, zone, e.message))
+                        return
+
+                    say('No room for %i %s beegees in %s (%s), trying elsewhere.' % (size, instance_type, zone, e.error_code))
+                    exhausted.add(option)
+
+            say('Nowhere left to call up %i beegees.' % size)
+        except Exception as e:
+            # one chunk failing must not lose the beegees the others called up
+            say('Unable to call up %i beegees: %s' % (size - landed, e))
+
+    return _merge([fill(index, size) for index, size in enumerate(sizes)])
+
+def up(count, group, zone, image_id, instance_type, username, key_name, subnet, bid = None, quorum = None, spot_interval = 10, spot_deadline = None, backend = 'ec2', chunk = None):
+    """
+    Startup the load testing server.
+
+    If quorum is given, return as soon as that many beegees are running. Spot
+    requests are polled every spot_interval seconds; once spot_deadline seconds
+    have passed the swarm goes ahead with whichever spot beegees have landed.
+
+    zone, instance_type and subnet may each be several, separated by commas.
+    Then, or when chunk is given, beegees are called up chunk at a time
+    across the zones and instance types (see _call_up_fleet), by default an
+    even share per zone.
+
+    With a backend other than ec2 the beegees are called up by that backend
+    and the EC2 options are ignored.
+    """
+    if backend != 'ec2':
+        return _launch(BACKENDS[backend], count)
+
+    count, instance_ids = _muster(count, zone, username, key_name)
+
+    if not count:
+        print 'BeeGees are already assembled and awaiting orders.'
+        return
+
+    zones = zone.split(',')
+    instance_types = instance_type.split(',')
+
+    ec2_connection = _connect_to_hive(zones[0], key_name)
+
+    if isinstance(ec2_connection, Exception):
+        return ec2_connection
+
+    connections = {_get_region(zones[0]): ec2_connection}
+
+    if len(zones) > 1 or len(instance_types) > 1 or chunk:
+        # every region a chunk may land in is connected up front, so its beegees can be waited on as they land
+        for fleet_zone in zones:
+            if _get_region(fleet_zone) not in connections:
+                connections[_get_region(fleet_zone)] = _connect_to_region(fleet_zone)
+        new_instances = _call_up_fleet(connections, count, group, zones, image_id, instance_types,
+                                       key_name, subnet.split(',') if subnet else [], bid, spot_interval, spot_deadline,
+                                       chunk or -(-count // len(zones)))
+    else:
+        new_instances = _call_up(ec2_connection, count, group, zone, _get_image_id(image_id, zone), instance_type, key_name, subnet, bid, spot_interval, spot_deadline)
+
+    if isinstance(new_instances, Exception):
+        return new_instances
+
+    existing = _describe_instances(_read_roster()) if instance_ids else []
+    landed = []
+    arrivals = Queue.Queue()
+
+    def land():
+        # spot beegees land over time, so they are waited on as they do
+        try:
+            for instance in new_instances:
+                landed.append(instance)
+                arrivals.put(instance)
+        except Exception as e:
+            # the beegees that did land must still make the roster
+            print 'Unable to call up the rest of the beegees: %s' % e
+        finally:
+            arrivals.put(None)
+
+    lander = threading.Thread(target=land)
+    lander.daemon = True
+    lander.start()
+
+    print 'Waiting for beegees to load their machine guns...'
+
+    with tracer.span('ec2.wait_running', count=count + len(existing)):
+        ready = _wait_for_instances(ec2_connection, existing, quorum, arrivals=arrivals,
+                                    connections=connections.values(), total=count + len(existing))
+
+    # requests still open are resolved before the roster is written, so no beegee is left off it
+    while lander.is_alive():
+        # a timeout keeps the wait interruptible with Ctrl-C
+        lander.join(1)
+    instances = landed + existing
+
+    if not landed and not existing:
+        print 'No beegees answered the call.'
+        return
+
+    with tracer.span('ec2.create_tags'):
+        for connection, tagged in _group_by_connection(instances, ec2_connection):
+            connection.create_tags([instance.id for instance in tagged], { "Name": "a bee!" })
 
     _write_server_list(username, key_name, zone, instances)
 
-    print 'The swarm has assembled %i beegees.' % len(instances)
+    if len(ready) < len(instances):
+        print 'The swarm has assembled %i of %i beegees, the rest will join shortly.' % (len(ready), len(instances))
+    else:
+        print 'The swarm has assembled %i beegees.' % len(instances)
 
-def report():
+def _launch(backend, count):
     """
-    Report the status of the load testing servers.
+    Call up beegees with a backend that launches them itself.
     """
-    username, key_name, zone, instance_ids = _read_server_list()
+    username = backend.username()
+    count, instance_ids = _muster(count, backend.name, username, None)
 
-    if not instance_ids:
-        print 'No beegees have been mobilized.'
+    if not count:
+        print 'BeeGees are already assembled and awaiting orders.'
         return
 
-    ec2_connection = boto.ec2.connect_to_region(_get_region(zone))
+    roster = _read_roster() if instance_ids else None
 
-    reservations = ec2_connection.get_all_instances(instance_ids=instance_ids)
+    print 'Attempting to call up %i beegees.' % count
 
-    instances = []
+    with tracer.span('%s.launch' % backend.name, count=count):
+        bees = backend.launch(count, roster)
 
-    for reservation in reservations:
-        instances.extend(reservation.instances)
+    _write_roster({
+        'backend': backend.name,
+        'username': username,
+        'key_name': None,
+        'zone': backend.name,
+        'updated': time.time(),
+        'bees': (roster['bees'] if roster else []) + bees
+    })
 
-    for instance in instances:
-        print 'BeeGee %s: %s @ %s' % (instance.id, instance.state, instance.private_ip_address)
+    print 'The swarm has assembled %i beegees.' % (len(bees) + len(instance_ids))
 
-def down():
+def report(refresh=False):
     """
-    Shutdown the load testing server.
+    Report the status of the load testing servers.
     """
-    username, key_name, zone, instance_ids = _read_server_list()
+    roster = _get_bees(refresh)
 
-    if not instance_ids:
+    if not roster:
         print 'No beegees have been mobilized.'
         return
 
-    print 'Connecting to the hive.'
+    for bee in roster['bees']:
+        print 'BeeGee %s: %s @ %s' % (bee['id'], bee['state'], bee['private_ip_address'])
 
-    ec2_connection = boto.ec2.connect_to_region(_get_region(zone))
+def down():
+    """
+    Shutdown the load testing server.
+    """
+    roster = _read_roster()
 
-    print 'Calling off the swarm.'
+    if not roster or not roster['bees']:
+        print 'No beegees have been mobilized.'
+        return
 
-    terminated_instance_ids = ec2_connection.terminate_instances(
-        instance_ids=instance_ids)
+    print 'Read %i beegees from the roster.' % len(roster['bees'])
+
+    terminated_instance_ids = _get_backend(roster).terminate(roster)
 
     print 'Stood down %i beegees.' % len(terminated_instance_ids)
 
     _delete_server_list()
 
-def init():
+    # a daemon would otherwise hold on to their sessions until it stops
+    _ssh_sessions.close()
+
+def init(refresh=False, bundle=False, fanout=4):
     """
     Initalize the servers.
+
+    With bundle set, checkin-test is installed once and the result handed from
+    beegee to beegee, skipping any that already hold that bundle.
     """
     print 'Training the beegees.'
 
-    username, key_name, zone, instance_ids = _read_server_list()
+    roster = _get_bees(refresh)
 
-    if not instance_ids:
+    if not roster:
         print 'No beegees are ready to attack.'
         return
 
-    print 'Connecting to the hive.'
-
-    ec2_connection = boto.ec2.connect_to_region(_get_region(zone))
-
     print 'Assembling beegees.'
 
-    reservations = ec2_connection.get_all_instances(instance_ids=instance_ids)
-
-    instances = []
-
-    for reservation in reservations:
-        instances.extend(reservation.instances)
+    params = _get_bee_params(roster)
 
-    params = []
+    if bundle and roster.get('backend') == 'local':
+        # they would all be serving the bundle on the same port of the same machine
+        print 'Local beegees are trained one by one, not from a bundle.'
+        bundle = False
 
-    for i, instance in enumerate(instances):
-        params.append({
-            'i': i,
-            'instance_id': instance.id,
-            'instance_name': instance.private_dns_name if instance.public_dns_name == "" else instance.public_dns_name,
-            'username': username,
-            'key_name': key_name
-        })
-
-    pool = Pool(len(params))
-    pool.map(_init, params)
+    if bundle:
+        _init_bundle(params, fanout)
+    else:
+        _fan_out(_init, params)
 
     return
 
@@ -311,25 +1117,10 @@ def _init(params):
     print 'BeeGee %i is gon\' learn today.' % params['i']
 
     try:
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-
-        pem_path = params.get('key_name') and _get_pem_path(params['key_name']) or None
-        if not os.path.isfile(pem_path):
-            client.load_system_host_keys()
-            client.connect(params['instance_name'], username=params['username'])
-        else:
-            client.connect(
-                params['instance_name'],
-                username=params['username'],
-                key_filename=pem_path)
-
         # clone down the repo
-        init_command = 'rm -rf checkin-test && git clone https://github.com/NewSpring/ops-checkin-test checkin-test && cd checkin-test && npm i'
-        stdin, stdout, stderr = client.exec_command(init_command)
-
-        init_results = stdout.read()
-        init_error = stderr.read()
+        init_command = 'rm -rf checkin-test && git clone %s checkin-test && cd checkin-test && npm i' % CHECKIN_TEST_REPO
+        with tracer.span('init.run', params['i']):
+            init_results, init_error = _ssh_exec(params, init_command)
 
         if 'fatal' in init_error:
             print 'BeeGee %i is above this.' % params['i']
@@ -337,159 +1128,1443 @@ def _init(params):
             print 'BeeGee %i done learned.' % params['i']
 
         return init_results
-    except socket.error, e:
+    except (socket.error, paramiko.SSHException), e:
         return e
 
 
-def _wait_for_spot_request_fulfillment(conn, requests, fulfilled_requests = []):
+def _read_bundle_marker(params):
     """
-    Wait until all spot requests are fulfilled.
+    The (revision, checksum) of the bundle a beegee holds, or None.
+    """
+    try:
+        stdout, stderr = _ssh_exec(params, 'test -f %s && cat checkin-test/%s' % (BUNDLE_FILENAME, BUNDLE_MARKER))
+    except (socket.error, paramiko.SSHException):
+        return None
+
+    fields = stdout.split()
+    return tuple(fields) if len(fields) == 2 else None
+
+def _build_bundle(params, revision):
+    """
+    Install checkin-test at revision on one beegee and pack it up, node_modules and all.
+
+    Returns the checksum of the bundle, or None if the install failed.
+    """
+    print 'BeeGee %i is putting the bundle together.' % params['i']
+
+    build_command = ' && '.join([
+        'rm -rf checkin-test',
+        'git clone %s checkin-test' % CHECKIN_TEST_REPO,
+        'cd checkin-test',
+        'git checkout -q %s' % revision,
+        'npm i',
+        'cd ~',
+        'tar czf %s checkin-test' % BUNDLE_FILENAME,
+        "sha256sum %s | cut -d' ' -f1 > checksum" % BUNDLE_FILENAME,
+        'echo %s $(cat checksum) > checkin-test/%s' % (revision, BUNDLE_MARKER),
+        'cat checksum && rm checksum'])
+
+    try:
+        with tracer.span('init.build_bundle', params['i']):
+            stdout, stderr = _ssh_exec(params, build_command)
+    except (socket.error, paramiko.SSHException):
+        return None
+
+    checksum = stdout.strip().split('\n')[-1]
+    return checksum if re.match(r'^[0-9a-f]{64}$', checksum) else None
+
+def _find_revision(params):
+    """
+    The current revision of checkin-test, as the first beegee to answer sees it, or None.
+    """
+    for p in params:
+        try:
+            stdout, stderr = _ssh_exec(p, 'git ls-remote %s HEAD' % CHECKIN_TEST_REPO)
+        except (socket.error, paramiko.SSHException):
+            continue
+        return stdout.split()[0] if stdout.split() else None
+    return None
+
+def _serve_bundle(params):
+    """
+    Have a beegee serve her bundle to the rest of the swarm over HTTP.
 
-    Once all spot requests are fulfilled, return a list of corresponding spot instances.
+    Returns whether she could be told to, with her bundle there to serve.
     """
-    if len(requests) == 0:
-        reservations = conn.get_all_instances(instance_ids = [r.instance_id for r in fulfilled_requests])
-        return [r.instances[0] for r in reservations]
+    serve_command = ' && '.join([
+        'mkdir -p beegees-serve',
+        'ln -f %s beegees-serve/' % BUNDLE_FILENAME,
+        'cd beegees-serve',
+        '((nohup python3 -m http.server %i || nohup python -m SimpleHTTPServer %i) > /dev/null 2>&1 &)' % (BUNDLE_PORT, BUNDLE_PORT),
+        'echo serving'])
+    try:
+        stdout, stderr = _ssh_exec(params, serve_command)
+    except (socket.error, paramiko.SSHException):
+        return False
+    return stdout.strip().endswith('serving')
+
+def _stop_serving_bundle(params):
+    """
+    Stop a beegee serving her bundle. Returns whether she could be told to.
+    """
+    try:
+        _ssh_exec(params, "pkill -f 'http.server %i|SimpleHTTPServer %i'; rm -rf beegees-serve" % (BUNDLE_PORT, BUNDLE_PORT))
+        return True
+    except (socket.error, paramiko.SSHException):
+        return False
+
+def _fetch_bundle(params):
+    """
+    Download the bundle from the beegee in params['source'], check it and unpack it.
+    """
+    revision, checksum = params['bundle']
+    url = 'http://%s:%i/%s' % (params['source']['private_address'], BUNDLE_PORT, BUNDLE_FILENAME)
+
+    fetch_command = ' && '.join([
+        # the source may still be starting her server
+        'for attempt in 1 2 3 4 5; do curl -sf --connect-timeout %i --max-time %i %s -o %s.part && break; sleep 1; done'
+        % (BUNDLE_CONNECT_TIMEOUT, BUNDLE_FETCH_TIMEOUT, url, BUNDLE_FILENAME),
+        'echo "%s  %s.part" | sha256sum -c --quiet' % (checksum, BUNDLE_FILENAME),
+        'mv %s.part %s' % (BUNDLE_FILENAME, BUNDLE_FILENAME),
+        'rm -rf checkin-test',
+        'tar xzf %s' % BUNDLE_FILENAME,
+        'echo %s %s > checkin-test/%s' % (revision, checksum, BUNDLE_MARKER),
+        'echo fetched'])
+
+    try:
+        with tracer.span('init.fetch_bundle', params['i'], source=params['source']['i']):
+            stdout, stderr = _ssh_exec(params, fetch_command)
+    except (socket.error, paramiko.SSHException):
+        return params, False
+
+    if stdout.strip().endswith('fetched'):
+        print 'BeeGee %i learned from BeeGee %i.' % (params['i'], params['source']['i'])
+        return params, True
+
+    print 'BeeGee %i could not learn from BeeGee %i.' % (params['i'], params['source']['i'])
+    return params, False
+
+def _init_bundle(params, fanout):
+    """
+    Bring every beegee up to the current revision of checkin-test.
+
+    One beegee installs it and packs it into a checksummed bundle. Every
+    beegee that has it then serves it to up to fanout more, so the bundle
+    spreads through the swarm in a tree and never crosses the control node.
+    Beegees already holding a bundle of the current revision are left alone
+    if it is the same bundle, by checksum, as the swarm's; those that drop out
+    along the way are trained from scratch at the end.
+    """
+    revision = _find_revision(params)
+
+    if not revision:
+        print 'Could not find the current revision of checkin-test, training every beegee from scratch.'
+        _fan_out(_init, params)
+        return
+
+    markers = _fan_out(_read_bundle_marker, params)
+
+    # installs of one revision can resolve different dependencies, so the bundle most beegees hold is the swarm's
+    built = [marker[1] for marker in markers if marker and marker[0] == revision]
+    checksum = max(sorted(set(built)), key=built.count) if built else None
+
+    warm = []
+    stale = []
+
+    for p, marker in zip(params, markers):
+        if checksum and marker == (revision, checksum):
+            warm.append(p)
+        else:
+            stale.append(p)
+
+    print '%i beegees already hold the bundle of revision %s, %i have to learn it.' % (len(warm), revision[:7], len(stale))
+
+    if not stale:
+        return
+
+    if warm:
+        seed = warm[0]
     else:
-        time.sleep(10)
+        seed = stale.pop(0)
+        checksum = _build_bundle(seed, revision)
+        if not checksum:
+            print 'BeeGee %i could not build the bundle, training every beegee from scratch.' % seed['i']
+            _fan_out(_init, [seed] + stale)
+            return
+
+    sources = []
+    serving = []
+    new_sources = [seed]
+    failed = []
+
+    try:
+        while stale:
+            for source, served in zip(new_sources, _fan_out(_serve_bundle, new_sources)):
+                serving.append(source)
+                if served:
+                    sources.append(source)
+                else:
+                    print 'BeeGee %i could not serve the bundle.' % source['i']
+                    failed.append(source)
+
+            if not sources:
+                # nobody is left to learn from
+                failed.extend(stale)
+                break
+
+            # every source hands the bundle to up to fanout beegees this round
+            batch = []
+            for source in sources:
+                for _ in range(fanout):
+                    if not stale:
+                        break
+                    learner = stale.pop(0)
+                    learner['source'] = source
+                    learner['bundle'] = (revision, checksum)
+                    batch.append(learner)
+
+            new_sources = []
+            for learner, fetched in _fan_out(_fetch_bundle, batch):
+                if fetched:
+                    new_sources.append(learner)
+                else:
+                    failed.append(learner)
+    finally:
+        # servers left running would hold the port for the next init
+        for source, stopped in zip(serving, _fan_out(_stop_serving_bundle, serving)):
+            if not stopped:
+                print 'BeeGee %i could not be told to stop serving the bundle.' % source['i']
+                if source not in failed:
+                    failed.append(source)
+
+    if failed:
+        print 'Training %i beegees that could not fetch the bundle from scratch.' % len(failed)
+        _fan_out(_init, failed)
+
+def _iter_running_instances(conn, instances, interval=2, max_interval=15, backoff=1.5, arrivals=None, stop=None):
+    """
+    Yield each instance as soon as it is running.
+
+    All pending instances are polled together with one DescribeInstances call
+    per tick. The delay between ticks grows while nothing changes.
+
+    arrivals, if given, is a queue of more instances still being called up,
+    ended by None. They are picked up between ticks.
+
+    Polling ends, whatever is still pending, once stop, a threading.Event, is set.
+    """
+    pending = {}
+    incoming = list(instances)
+    delay = interval
+
+    while True:
+        for instance in incoming:
+            if instance.state == 'running':
+                yield instance
+            else:
+                pending[instance.id] = instance
+
+        incoming = []
+
+        if not pending and arrivals is None:
+            return
+
+        if arrivals is None:
+            if stop is not None:
+                stop.wait(delay)
+            else:
+                time.sleep(delay)
+        else:
+            # wait out the tick, taking in any beegees that land meanwhile
+            tick_end = time.time() + delay
+            while arrivals is not None:
+                try:
+                    instance = arrivals.get(True, max(tick_end - time.time(), 0.01))
+                except Queue.Empty:
+                    break
+                if instance is None:
+                    arrivals = None
+                else:
+                    incoming.append(instance)
+                    # with nothing to poll, she is looked at straight away
+                    if not pending:
+                        break
+
+            if not pending:
+                continue
+
+        if stop is not None and stop.is_set():
+            return
+
+        try:
+            reservations = conn.get_all_instances(instance_ids=pending.keys())
+        except boto.exception.EC2ResponseError as e:
+            # freshly launched instances can take a moment to show up in the API
+            if e.error_code != 'InvalidInstanceID.NotFound':
+                raise
+            reservations = []
+
+        progress = False
+
+        for reservation in reservations:
+            for instance in reservation.instances:
+                if instance.id not in pending:
+                    continue
+
+                if instance.state == 'running':
+                    pending[instance.id]._update(instance)
+                    progress = True
+                    yield pending.pop(instance.id)
+                elif instance.state in ('shutting-down', 'terminated', 'stopping', 'stopped'):
+                    print 'BeeGee %s went %s before joining the swarm.' % (instance.id, instance.state)
+                    del pending[instance.id]
+                    progress = True
+
+        delay = interval if progress else min(delay * backoff, max_interval)
+
+def _iter_spot_instances(conn, spot_requests, interval=10, deadline=None):
+    """
+    Yield spot instances as their requests are fulfilled, calling off the
+    requests still open once the deadline passes.
+    """
+    landed = set()
+
+    with tracer.span('ec2.spot_fulfillment', count=len(spot_requests)):
+        for instance in _iter_spot_request_fulfillment(conn, spot_requests, interval, deadline=deadline):
+            landed.add(instance.id)
+            yield instance
+
+    if len(landed) < len(spot_requests):
+        print 'Proceeding with %i of %i spot beegees, calling off the rest.' % (len(landed), len(spot_requests))
+        conn.cancel_spot_instance_requests([req.id for req in spot_requests])
+
+        # pick up any bee that landed between the last poll and the cancel so it is not orphaned
+        late_ids = [req.instance_id for req in conn.get_all_spot_instance_requests(request_ids=[req.id for req in spot_requests])
+                    if req.instance_id and req.instance_id not in landed]
+        if late_ids:
+            late = _describe_new_instances(conn, late_ids, interval)
+            if late is None:
+                print 'Spot beegees %s landed but EC2 cannot find them yet, terminate them by hand.' % ', '.join(late_ids)
+            for instance in late or []:
+                yield instance
+
+def _describe_new_instances(conn, instance_ids, interval=10, attempts=NEW_INSTANCE_ATTEMPTS):
+    """
+    Look up instances that were just launched, asking again every interval
+    seconds while EC2 does not know them yet.
+
+    Returns the instances, or None if EC2 still could not find them after attempts tries.
+    """
+    for attempt in range(attempts):
+        if attempt:
+            time.sleep(interval)
+        try:
+            reservations = conn.get_all_instances(instance_ids=instance_ids)
+        except boto.exception.EC2ResponseError as e:
+            if e.error_code != 'InvalidInstanceID.NotFound':
+                raise
+            continue
+        return [instance for reservation in reservations for instance in reservation.instances]
+    return None
+
+def _wait_for_instances(conn, instances, quorum=None, interval=2, max_interval=15, arrivals=None, connections=(), total=None):
+    """
+    Wait until all instances, or a quorum of them, are running.
+
+    Instances from several regions are polled a region at a time, all
+    regions at once.
+
+    arrivals, if given, is a queue of more instances still being called up,
+    ended by None, from conn or one of connections. total is then how many
+    instances are expected in all.
+
+    Returns the list of running instances.
+    """
+    total = total or len(instances)
+    quorum = min(int(quorum), total) if quorum else total
+
+    ready = []
+
+    groups = _group_by_connection(instances, conn)
+    queues = [None] * len(groups)
+
+    if arrivals is not None:
+        for connection in [conn] + list(connections):
+            if not any(connection is known for known, group in groups):
+                groups.append((connection, []))
+        queues = [Queue.Queue() for group in groups]
+
+        def route():
+            # each region takes in the beegees that land in it
+            try:
+                while True:
+                    instance = arrivals.get()
+                    if instance is None:
+                        return
+                    connection = getattr(instance, 'connection', None) or conn
+                    matches = [queue for (known, group), queue in zip(groups, queues) if known is connection]
+                    (matches or queues)[0].put(instance)
+            finally:
+                for queue in queues:
+                    queue.put(None)
+
+        thread = threading.Thread(target=route)
+        thread.daemon = True
+        thread.start()
+
+    # once the quorum is in, the regions still polling are told to stop
+    stop = threading.Event()
+    running = _merge([_iter_running_instances(connection, group, interval, max_interval, arrivals=queue, stop=stop)
+                      for (connection, group), queue in zip(groups, queues)], stop)
+
+    try:
+        for instance in running:
+            ready.append(instance)
+
+            print '%i/%i beegees are ready for the attack.' % (len(ready), total)
+
+            if len(ready) >= quorum:
+                break
+    finally:
+        stop.set()
+
+    return ready
+
+def _iter_spot_request_fulfillment(conn, requests, interval=10, max_interval=30, deadline=None):
+    """
+    Yield each spot instance as soon as its request is fulfilled.
+
+    Stops polling once deadline seconds have passed, leaving the remaining
+    requests open for the caller to cancel.
+    """
+    pending = set(req.id for req in requests)
+    give_up_at = time.time() + deadline if deadline else None
+    delay = interval
+
+    while pending:
+        if give_up_at is not None:
+            remaining = give_up_at - time.time()
+            if remaining <= 0:
+                return
+            time.sleep(min(delay, remaining))
+        else:
+            time.sleep(delay)
+
         print '.'
 
-    requests = conn.get_all_spot_instance_requests(request_ids=[req.id for req in requests])
-    for req in requests:
-        if req.status.code == 'fulfilled':
-            fulfilled_requests.append(req)
-            print "spot bee `{}` joined the swarm.".format(req.instance_id)
+        try:
+            requests = conn.get_all_spot_instance_requests(request_ids=list(pending))
+        except boto.exception.EC2ResponseError as e:
+            # it can take a few seconds before the spot requests are fully processed
+            if e.error_code != 'InvalidSpotInstanceRequestID.NotFound':
+                raise
+            requests = []
+
+        fulfilled = {}
+
+        for req in requests:
+            if req.status.code == 'fulfilled' and req.instance_id:
+                fulfilled[req.instance_id] = req.id
+            elif req.state in ('cancelled', 'failed', 'closed'):
+                pending.discard(req.id)
+                print "spot request `{}` {}: {}".format(req.id, req.state, req.status.code)
+
+        if fulfilled:
+            delay = interval
+            try:
+                reservations = conn.get_all_instances(instance_ids=list(fulfilled))
+            except boto.exception.EC2ResponseError as e:
+                # a fulfilled request's instance can take a moment to show up in the API, her request is asked about again
+                if e.error_code != 'InvalidInstanceID.NotFound':
+                    raise
+                reservations = []
+            for reservation in reservations:
+                for instance in reservation.instances:
+                    pending.discard(fulfilled[instance.id])
+                    print "spot bee `{}` joined the swarm.".format(instance.id)
+                    yield instance
+        else:
+            delay = min(delay * 1.5, max_interval)
+
+def _shell_arg(value):
+    """
+    Quote value for a beegee's shell, leaving a leading $HOME/ for her to expand.
+    """
+    value = str(value)
+    if value.startswith('$HOME/'):
+        return '"$HOME"/' + pipes.quote(value[len('$HOME/'):])
+    return pipes.quote(value)
 
-    return _wait_for_spot_request_fulfillment(conn, [r for r in requests if r not in fulfilled_requests], fulfilled_requests)
+def _npm_command(script, env=None, args=None):
+    """
+    Build the command that runs an npm script of checkin-test on a beegee.
+    """
+    command = 'cd checkin-test && export PATH=$PATH:/home/ubuntu/npm/bin && export NODE_PATH=$NODE_PATH:/home/ubuntu/npm/lib/node_modules'
+    for name, value in sorted((env or {}).items()):
+        command += ' && export %s=%s' % (name, _shell_arg(value))
+    command += ' && npm run %s' % script
+    if args:
+        command += ' -- ' + ' '.join(pipes.quote(arg) for arg in args)
+    return command
+
+def _engine_command(args):
+    """
+    Build the command that runs the HTTP engine on a beegee with the given arguments.
+    """
+    return '$(command -v python3 || command -v python) %s %s > %s' % (
+        ENGINE_FILENAME, ' '.join(_shell_arg(arg) for arg in args), ENGINE_RESULTS)
+
+def _live_command(live_path):
+    """
+    Build the command that follows a beegee's live snapshots until her attack ends.
+    """
+    return 'tail --pid=$(cat %s) -F -n +1 %s 2>/dev/null' % (ATTACK_PIDFILE, _shell_arg(live_path))
+
+def _upload_engine(params):
+    """
+    Copy the HTTP engine to a beegee.
+    """
+    with open(ENGINE_SOURCE, 'rb') as f:
+        source = base64.b64encode(f.read())
+    stdout, stderr = _ssh_exec(params, 'echo %s | base64 -d > %s' % (source, ENGINE_FILENAME))
+    if stderr.strip():
+        raise socket.error('could not copy the engine: %s' % stderr.strip())
+
+def _discover_scenarios(params):
+    """
+    List the test files of the checkin-test suite, as the first beegee to answer has them, or None.
+    """
+    for p in params:
+        try:
+            stdout, stderr = _ssh_exec(p, "cd checkin-test && find test -name '*.js' | sort")
+        except (socket.error, paramiko.SSHException):
+            continue
+        return [line.strip() for line in stdout.split('\n') if line.strip()]
+    return None
 
 def _attack(params):
     """
     Test the target URL with requests.
 
-    Intended for use with multiprocessing.
+    Intended for use with a worker pool.
     """
     print 'BeeGee %i is joining the swarm.' % params['i']
 
     try:
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        _ssh_sessions.get(params)
+
+        print 'BeeGee %i is firing her machine gun. Bang bang!' % params['i']
 
-        pem_path = params.get('key_name') and _get_pem_path(params['key_name']) or None
-        if not os.path.isfile(pem_path):
-            client.load_system_host_keys()
-            client.connect(params['instance_name'], username=params['username'])
+        shard = params.get('shard')
+        live = params.get('live')
+        live_env = {'BEEGEES_LIVE': params['live_path']} if live else {}
+        if params.get('engine'):
+            test_command = _engine_command(params['engine'] + (['--live', params['live_path']] if live else []))
+            details_command = 'cat %s' % ENGINE_RESULTS
+        elif shard:
+            test_command = _npm_command('attack', dict(live_env, BEEGEES_SHARD=' '.join(shard)), shard)
+            details_command = _npm_command('details')
         else:
-            client.connect(
-                params['instance_name'],
-                username=params['username'],
-                key_filename=pem_path)
+            test_command = _npm_command('attack', live_env)
+            details_command = _npm_command('details')
+
+        # the beegee notes when she really opened fire, to measure how well the swarm kept time
+        test_command = 'echo %s $(date +%%s.%%N) && %s' % (START_MARKER, test_command)
+        test_command = 'echo $$ > %s && %s' % (ATTACK_PIDFILE, test_command)
+        if live:
+            # snapshots from earlier attacks are of no use
+            test_command = 'rm -f %s && %s' % (LIVE_FILENAME.replace('$HOME', '"$HOME"').replace('%i', '*'), test_command)
+
+        # beegees that were out of reach when the swarm was armed have their clock read now
+        if params.get('clock') is None:
+            params['clock'] = _read_clock(params)
+        offset = params['clock'][0] if params['clock'] else 0.0
+
+        if params.get('start_at'):
+            time.sleep(max(params['start_at'] - time.time(), 0))
+
+        halt = params.get('halt')
+        if (live and live.aborted.is_set()) or (halt and halt.is_set()):
+            raise CalledOff('the attack was called off before she opened fire')
+
+        start = time.time()
+        deadline = start + params['deadline'] if params.get('deadline') else None
+        started = None
+        head = ''
+        with tracer.span('attack.run', params['i']):
+            test_channel = _ssh_sessions.open(params, test_command)
+            try:
+                for chunk in _iter_channel(test_channel, deadline=deadline):
+                    if started is None and len(head) < 4096:
+                        head += chunk
+                        match = re.search(START_MARKER + r' (\d+(?:\.\d+)?)', head)
+                        if match:
+                            started = float(match.group(1))
+                            if live:
+                                # she has noted the attack's pid by now, the tail ends with the attack
+                                live.watch(params['i'], _ssh_sessions.open(params, _live_command(params['live_path'])))
+            except DeadlineExceeded:
+                # closing her channel leaves what she started loading the target
+                _cease_fire(params)
+                raise
+            finally:
+                test_channel.close()
+                if live:
+                    live.unwatch(params['i'])
+        run_time = (time.time() - start) * 1000
+
+        if halt and halt.is_set():
+            raise CalledOff('the attack was called off')
+
+        with tracer.span('attack.details', params['i']) as span:
+            results_channel = _ssh_sessions.open(params, _compressed(details_command))
+            try:
+                # decompress and parse the details as they arrive rather than holding the whole document
+                details_deadline = time.time() + DETAILS_DEADLINE if deadline else None
+                chunks = _iter_channel(results_channel, stats=span, deadline=details_deadline)
+                bee = SwarmResults.from_chunks(_iter_gunzipped(chunks, span), offset)
+            except DeadlineExceeded:
+                raise DetailsDeadlineExceeded('still sending her results at the deadline')
+            finally:
+                results_channel.close()
+
+        bee.run_time = run_time
+        bee.transfer_bytes = span.get('bytes', 0)
+        bee.detail_bytes = span.get('raw_bytes', 0)
+        bee.shard = shard
+        if started and params.get('start_at'):
+            bee.start_lags.append(started - offset - params['start_at'])
+        if params['clock'] and 'covering' not in params:
+            bee.clock_offsets.append(params['clock'])
+        bee.per_bee.append(dict(history.summarize(bee), bee=params['i'], run_time=run_time,
+                                bytes=bee.transfer_bytes, raw_bytes=bee.detail_bytes))
+
+        return bee
 
-        print 'BeeGee %i is firing her machine gun. Bang bang!' % params['i']
+    except socket.error, e:
+        return e
 
-        test_command = 'cd checkin-test && export PATH=$PATH:/home/ubuntu/npm/bin && export NODE_PATH=$NODE_PATH:/home/ubuntu/npm/lib/node_modules && npm run attack'
-        stdin, stdout, stderr = client.exec_command(test_command)
 
-        test = stdout.read()
+def _read_clock(params, samples=CLOCK_SAMPLES):
+    """
+    How far a beegee's clock is ahead of this one, the way NTP tells.
 
-        results_command = 'cd checkin-test && export PATH=$PATH:/home/ubuntu/npm/bin && export NODE_PATH=$NODE_PATH:/home/ubuntu/npm/lib/node_modules && npm run details'
-        stdin, stdout, stderr = client.exec_command(results_command)
+    She is asked the time samples times over one channel. The answer that
+    came back quickest is taken to have been read halfway through its round
+    trip, so it is off by at most half of that. Returns (offset, error) in
+    seconds, or None if she could not tell the time.
+    """
+    try:
+        channel = _ssh_sessions.open(params, CLOCK_COMMAND)
+    except (socket.error, paramiko.SSHException):
+        return None
 
-        results = stdout.read()
+    try:
+        channel.settimeout(5)
+        best = None
+        buf = ''
+        for _ in range(samples):
+            sent = time.time()
+            channel.sendall('\n')
+            while '\n' not in buf:
+                chunk = channel.recv(256)
+                if not chunk:
+                    return None
+                buf += chunk
+            received = time.time()
+            line, buf = buf.split('\n', 1)
+            if best is None or received - sent < best[1] - best[0]:
+                best = (sent, received, float(line))
+    except (socket.error, paramiko.SSHException, ValueError):
+        # a beegee who cannot tell the time can still attack, only her timeline is not corrected
+        return None
+    finally:
+        channel.close()
+
+    sent, received, theirs = best
+    return theirs - (sent + received) / 2, (received - sent) / 2
+
+def _prearm(params):
+    """
+    Get a beegee's SSH session up ahead of the attack, read her clock, and
+    copy the HTTP engine over if she is to use it.
 
-        return results
+    Returns whether she could be reached, and her clock as _read_clock gives it.
+    """
+    try:
+        _ssh_sessions.get(params)
+        clock = _read_clock(params)
+        if params.get('engine'):
+            _upload_engine(params)
+        return True, clock
+    except (socket.error, paramiko.SSHException):
+        return False, None
+
+def _call_off(params):
+    """
+    Tell the beegees that are still firing to cease fire, as stopping here does not stop them.
+    """
+    if params:
+        print 'Telling %i beegees to cease fire.' % len(params)
+        _fan_out(_cease_fire, sorted(params, key=lambda p: p['i']))
 
-    except socket.error, e:
-        return e
+def _cease_fire(params):
+    """
+    Stop a beegee's attack, and everything it started, if she is still firing.
+    """
+    try:
+        _ssh_exec(params, 'kill -TERM -- -$(ps -o pgid= -p $(cat %s) | tr -d " ") 2>/dev/null; true' % ATTACK_PIDFILE)
+        return True
+    except (socket.error, paramiko.SSHException):
+        return False
 
+def _read_revision(params):
+    """
+    The revision of checkin-test a beegee has, or None.
+    """
+    try:
+        stdout, stderr = _ssh_exec(params, 'git -C checkin-test rev-parse HEAD 2>/dev/null || cut -d " " -f 1 checkin-test/%s 2>/dev/null' % BUNDLE_MARKER)
+    except (socket.error, paramiko.SSHException):
+        return None
+    return stdout.split()[0] if stdout.split() else None
 
-def attack():
+def _record_run(swarm, target, revision, label, called_off):
+    """
+    Add the attack to the run history, saying how to compare it with the one before.
+    """
+    try:
+        db = history.connect()
+        try:
+            run = history.record(db, swarm, target, revision, label, called_off)
+            previous = history.latest(db, target, before=run)
+        finally:
+            db.close()
+    except sqlite3.Error as e:
+        print 'Could not add the attack to the run history: %s' % e
+        return None
+
+    if previous:
+        print 'Recorded as run %i, see how it compares with: beegees compare %i %i' % (run, previous, run)
+    else:
+        print 'Recorded as run %i.' % run
+
+    return run
+
+def _write_timeline(swarm, timeline_path, binary_path):
+    if timeline_path:
+        swarm.timeline.write_csv(timeline_path)
+        print 'Wrote the per-second timeline to %s.' % timeline_path
+    if binary_path:
+        swarm.timeline.write_binary(binary_path)
+        print 'Wrote the per-second timeline with histograms to %s.' % binary_path
+
+def _fire(params, swarm, statuses, ramp_profile=None, deadline=None, hedge=False, durations=None, live=None):
+    """
+    Arm the beegees and have them open fire, folding their results into swarm
+    as they come back and noting each run in statuses.
+
+    Shard durations are updated in durations when given. With live, a
+    LiveView, the beegees' snapshots are followed as they fire and every
+    beegee is told to cease fire if the view calls the attack off. On a
+    KeyboardInterrupt the beegees still firing are told to cease fire and the
+    interrupt is passed on once the workers are stopped, swarm holds what
+    came back.
+    """
+    print 'Arming the swarm.'
+
+    armed = _fan_out(_prearm, params)
+    unreachable = [reached for reached, clock in armed].count(False)
+    if unreachable:
+        print '%i beegees could not be reached yet, they will try again when the attack starts.' % unreachable
+    for bee_params, (reached, clock) in zip(params, armed):
+        bee_params['clock'] = clock
+
+    # workers that are threads outlive an interrupt, this tells them to stop (processes are terminated)
+    halt = threading.Event() if _executor['kind'] == 'thread' else None
+
+    start_at = time.time() + START_LEAD
+    for bee_params, offset in zip(params, ramp.offsets(ramp_profile, len(params))):
+        bee_params['start_at'] = start_at + offset
+        bee_params['deadline'] = deadline
+        if halt is not None:
+            bee_params['halt'] = halt
+        if live is not None:
+            bee_params['live'] = live
+            bee_params['live_path'] = LIVE_FILENAME % start_at
+
+    if live is not None:
+        def call_off(reason):
+            print
+            print 'Calling off the attack: %s.' % reason
+            _fan_out(_cease_fire, params)
+
+        live.start(_print_live, call_off)
+
+    print 'Organizing the swarm.'
+
+    # every beegee gets a worker, as an attack that is held back until a
+    # worker frees up would not be an attack on the same target
+    pool = _get_pool(len(params), all_at_once=True)
+    events = Queue.Queue()
+    idle = []
+    stranded = []
+    firing = {}
+    state = {'in_flight': 0}
+
+    def submit(bee_params):
+        state['in_flight'] += 1
+        firing[bee_params['i']] = bee_params
+        pool.apply_async(_in_worker(_guarded), (_attack, bee_params),
+                         callback=lambda result: events.put((bee_params, tracer.receive(result))))
+
+    for bee_params in params:
+        submit(bee_params)
+
+    try:
+        while state['in_flight']:
+            # a timeout keeps the wait interruptible with Ctrl-C
+            try:
+                bee_params, result = events.get(True, 1)
+            except Queue.Empty:
+                continue
+
+            state['in_flight'] -= 1
+            firing.pop(bee_params['i'], None)
+
+            if isinstance(result, Exception):
+                statuses.append((bee_params, _failure_status(result, deadline)))
+                # a shard is handed on once, one that sinks every beegee it is given is not the beegee's fault
+                if hedge and bee_params.get('shard') and 'covering' not in bee_params and not (live and live.aborted.is_set()):
+                    stranded.append(bee_params)
+            else:
+                statuses.append((bee_params, None))
+                if 'covering' in bee_params:
+                    # she has been counted already, for her own shard
+                    result.bees = 0
+                swarm.merge(result)
+                if result.shard and durations is not None:
+                    shards.update_durations(durations, result.shard, result.run_time, result.shard_durations())
+                idle.append(bee_params)
+                _print_progress(swarm, len(params))
+
+            while stranded and idle:
+                lost = stranded.pop(0)
+                stand_in = dict(idle.pop(0), shard=lost['shard'], start_at=None, covering=lost['i'])
+                print 'BeeGee %i is taking over the shard of BeeGee %i.' % (stand_in['i'], lost['i'])
+                submit(stand_in)
+        pool.close()
+        pool.join()
+    except KeyboardInterrupt:
+        if halt is not None:
+            halt.set()
+        _call_off(firing.values())
+        raise
+    finally:
+        pool.terminate()
+        if live is not None:
+            live.stop()
+
+    if stranded:
+        print
+        print 'No beegee was free to take over the shards of %i beegees.' % len(stranded)
+
+def attack(refresh=False, shard=False, scenarios=None, ramp_profile=None, timeline_path=None, binary_path=None, deadline=None, hedge=False, engine=None,
+           live=False, live_port=None, abort_error_rate=None, abort_p99=None, label=None):
     """
     Test the root url of this site.
+
+    With shard set, the scenarios (by default the test files of the suite) are
+    split across the beegees, balanced by how long each took on earlier runs.
+
+    Every beegee is connected before the attack, then they all open fire at a
+    shared moment, or staggered following ramp_profile (see ramp.py).
+
+    A beegee still firing deadline seconds after she started is told to cease
+    fire and given up on, and with hedge set her shard is handed to a beegee
+    that has finished. On Ctrl-C the beegees still firing are told to cease
+    fire too. The beegees that came back are summarized whatever happened to
+    the rest.
+
+    The swarm's per-second timeline is written as CSV to timeline_path and in
+    its compact binary form to binary_path, when given.
+
+    With engine, a list of arguments for engine.py, the beegees attack with
+    the HTTP engine instead of the checkin-test suite.
+
+    With live, the swarm's snapshots (see live.py) are shown every second
+    while it attacks, and served as JSON on localhost at live_port when given.
+    Once the failure rate or p99 in milliseconds over the last few seconds
+    passes abort_error_rate or abort_p99, the attack is called off.
+
+    The results are added to the run history (see history.py) under the
+    target, the revision of checkin-test and label.
     """
-    username, key_name, zone, instance_ids = _read_server_list()
 
-    if not instance_ids:
+    roster = _get_bees(refresh)
+
+    if not roster:
         print 'No beegees are ready to attack.'
         return
 
-    print 'Connecting to the hive.'
+    print 'Assembling beegees.'
 
-    ec2_connection = boto.ec2.connect_to_region(_get_region(zone))
+    params = _get_bee_params(roster)
+    durations = None
 
-    print 'Assembling beegees.'
+    for bee_params in params:
+        bee_params['engine'] = engine
 
-    reservations = ec2_connection.get_all_instances(instance_ids=instance_ids)
+    if shard:
+        scenarios = scenarios or _discover_scenarios(params)
+        if scenarios is None:
+            print 'No beegee could be reached to list the scenarios.'
+            return
+        if not scenarios:
+            print 'No scenarios to split across the swarm.'
+            return
 
-    instances = []
+        durations = shards.load_durations()
+        plan = shards.balance(scenarios, durations, len(params))
 
-    for reservation in reservations:
-        instances.extend(reservation.instances)
+        for bee_params, (expected, bee_scenarios) in zip(params, plan):
+            bee_params['shard'] = bee_scenarios
 
-    instance_count = len(instances)
+        # with more beegees than scenarios some are left without orders
+        params = [p for p in params if p['shard']]
 
-    params = []
+        print 'Split %i scenarios across %i beegees, about %.1f seconds each.' % (len(scenarios), len(params), max(e for e, s in plan) / 1000)
 
-    for i, instance in enumerate(instances):
-        params.append({
-            'i': i,
-            'instance_id': instance.id,
-            'instance_name': instance.private_dns_name if instance.public_dns_name == "" else instance.public_dns_name,
-            'username': username,
-            'key_name': key_name
-        })
+    view = None
+    if live or live_port or abort_error_rate is not None or abort_p99 is not None:
+        if _executor['kind'] != 'thread':
+            print 'Following the attack live needs the thread executor, going ahead without.'
+        else:
+            view = LiveView(abort_error_rate, abort_p99)
+            if live_port:
+                view.serve(live_port)
+                print 'Serving the live view at http://127.0.0.1:%i/.' % live_port
 
-    print 'Organizing the swarm.'
-    # Spin up processes for connecting to EC2 instances
-    pool = Pool(len(params))
-    results = pool.map(_attack, params)
+    swarm = SwarmResults()
+    statuses = []
 
-    print 'Offensive complete.'
+    try:
+        _fire(params, swarm, statuses, ramp_profile, deadline, hedge, durations, view)
+    except KeyboardInterrupt:
+        print
+        print 'Offensive called off with %i of %i beegees back.' % (swarm.bees, len(params))
+    else:
+        print
+        print 'Offensive complete.'
+
+    if shard:
+        shards.save_durations(durations)
+
+    _print_statuses(statuses, swarm.bees, len(params))
 
-    _print_results(results)
+    _print_results(swarm)
+
+    _write_timeline(swarm, timeline_path, binary_path)
+
+    if view is not None and view.reason:
+        print 'The attack was called off early: %s.' % view.reason
+
+    if swarm.bees:
+        if engine:
+            target, revision = engine[0], None
+        else:
+            target, revision = 'checkin-test', _read_revision(params[0])
+        _record_run(swarm, target, revision, label, view.reason if view is not None else None)
 
     print 'The swarm is awaiting new orders.'
 
+    return swarm
 
-def _redirect_stdout(outfile, func, *args, **kwargs):
-    save_out = sys.stdout
-    with open(outfile, 'w') as redir_out:
-        sys.stdout = redir_out
-        func(*args, **kwargs)
-    sys.stdout = save_out
+def compare(first=None, second=None, tolerance=None):
+    """
+    Show how run second of the history differs from run first.
+
+    second defaults to the latest run and first to the run of the same
+    target before it. With tolerance, returns False if the second run is
+    worse by more than that (see history.find_regressions).
+    """
+    if not os.path.isfile(history.HISTORY_FILENAME):
+        print 'No attacks have been recorded yet.'
+        return True
+
+    db = history.connect()
+    try:
+        if second is None:
+            second = history.latest(db)
+            if second is None:
+                print 'No attacks have been recorded yet.'
+                return True
+        if first is None:
+            row = history.get_run(db, second)
+            first = row and history.latest(db, row['target'], before=second)
+            if not first:
+                print 'Run %i is the first of %s, there is nothing to compare it with.' % (second, row['target'])
+                return True
+
+        try:
+            comparison = history.compare(db, first, second)
+        except KeyError as e:
+            print e.args[0]
+            return False
+    finally:
+        db.close()
+
+    _print_comparison(comparison)
+
+    if tolerance is None:
+        return True
+
+    regressions = history.find_regressions(comparison, tolerance)
+    if regressions:
+        print
+        print bcolors.FAIL + 'Run %i is worse than run %i:' % (second, first) + bcolors.ENDC
+        for regression in regressions:
+            print '     %s' % regression
+        return False
+
+    print
+    print 'Run %i holds up against run %i.' % (second, first)
+    return True
+
+def list_runs(limit=20):
+    """
+    Show the latest runs in the history.
+    """
+    if not os.path.isfile(history.HISTORY_FILENAME):
+        print 'No attacks have been recorded yet.'
+        return
+
+    db = history.connect()
+    try:
+        rows = history.list_runs(db, limit)
+    finally:
+        db.close()
+
+    print '%6s  %-16s  %-40s  %-7s  %5s  %8s  %7s  %8s  %s' % ('run', 'when', 'target', 'rev', 'bees', 'tests', 'failed', 'p99', 'label')
+    for row in rows:
+        print '%6i  %-16s  %-40s  %-7s  %5i  %8i  %6.2f%%  %8s  %s' % (
+            row['id'], _format_time(row['started']), row['target'][:40], (row['revision'] or '-')[:7], row['bees'], row['tests'],
+            100.0 * row['failures'] / row['tests'] if row['tests'] else 0.0,
+            '-' if row['p99'] is None else '%.0f ms' % row['p99'], row['label'] or '')
+
+def _judge(swarm, bees, max_error_rate, max_p99):
+    """
+    Sum up a search round, which passes if every beegee came back and the
+    target kept its errors and p99 latency within bounds.
+    """
+    error_rate = float(swarm.failures) / swarm.tests if swarm.tests else 1.0
+    p99 = swarm.latency.percentile(99)
+
+    return {
+        'bees': bees,
+        'back': swarm.bees,
+        'tests': swarm.tests,
+        'error_rate': error_rate,
+        'p99': p99,
+        'throughput': swarm.throughput(),
+        'passed': swarm.bees == bees and error_rate <= max_error_rate and (max_p99 is None or (p99 or 0) <= max_p99),
+    }
+
+def search(most, max_error_rate=0.01, max_p99=None, call_up=None, refresh=False, ramp_profile=None, deadline=None, engine=None):
+    """
+    Find the most beegees the target holds up against with a binary search
+    over short rounds of attacks by more or fewer beegees.
+
+    A round passes if every beegee comes back, at most max_error_rate of the
+    tests fail and the p99 latency stays at or under max_p99 milliseconds.
+    When the roster is short of most beegees and call_up is given, call_up(most)
+    brings up the rest (see up()), who are trained before the first round.
+    With engine the rounds use the HTTP engine, as in attack().
+
+    Returns the rounds in the order they ran.
+    """
+    roster = _get_bees(refresh)
+
+    if call_up and (not roster or len(roster['bees']) < most):
+        known = set(bee['id'] for bee in roster['bees']) if roster else set()
+        call_up(most)
+        roster = _get_bees()
+        fresh = [p for p in _get_bee_params(roster or {'bees': []}) if p['instance_id'] not in known]
+        if fresh:
+            print 'Training %i new beegees.' % len(fresh)
+            _fan_out(_init, fresh)
+
+    if not roster:
+        print 'No beegees are ready to attack.'
+        return
+
+    params = _get_bee_params(roster)
+
+    if most > len(params):
+        print 'Only %i beegees are on the roster, searching up to that.' % len(params)
+        most = len(params)
+
+    rounds = []
+    # the most beegees known to pass and the fewest known to fail
+    passing, failing = 0, most + 1
+
+    try:
+        while failing - passing > 1:
+            bees = (passing + failing) / 2
+
+            print 'Round %i: attacking with %i beegees.' % (len(rounds) + 1, bees)
+
+            swarm = SwarmResults()
+            _fire([dict(p, engine=engine) for p in params[:bees]], swarm, [], ramp_profile, deadline)
+            print
+
+            result = _judge(swarm, bees, max_error_rate, max_p99)
+            rounds.append(result)
+            print 'Round %i: the target %s %i beegees, %.2f%% errors, p99 %s ms.' % (
+                len(rounds), 'held up against' if result['passed'] else 'gave way under', bees,
+                result['error_rate'] * 100, '-' if result['p99'] is None else '%.1f' % result['p99'])
+
+            if result['passed']:
+                passing = bees
+            else:
+                failing = bees
+    except KeyboardInterrupt:
+        print
+        print 'Search called off after %i rounds.' % len(rounds)
+
+    _print_rounds(rounds)
+
+    if passing:
+        knee = [r for r in rounds if r['bees'] == passing][0]
+        print 'The target holds up against %i beegees, %.2f tests/second.' % (passing, knee['throughput'])
+    elif rounds:
+        print 'The target did not hold up against a single beegee.'
+
+    print 'The swarm is awaiting new orders.'
 
-def _print_results(results):
-    tests = 0
-    passes = 0
-    failures = 0
-    duration = 0
+    return rounds
 
-    failed_tests = []
 
-    # for every machine in the results
-    for machine in results:
-        # remove norma output
-        machine = '\n'.join(machine.split('\n')[4:])
+def _guarded(func, params):
+    """
+    Call func, handing back any exception instead of raising it in the worker.
+    """
+    try:
+        return func(params)
+    except Exception as e:
+        return e
+
+def _arm(params, timeout=300):
+    """
+    Wait until a fresh beegee takes SSH, train her and keep her session open for the attack.
+    """
+    give_up_at = time.time() + timeout
 
-        machine = json.loads(machine)
+    with tracer.span('deploy.wait_for_ssh', params['i']):
+        while True:
+            try:
+                _ssh_sessions.get(params)
+                break
+            except (socket.error, paramiko.SSHException):
+                # sshd comes up a little while after the instance is running
+                if time.time() > give_up_at:
+                    raise
+                time.sleep(2)
 
-        # for every thread generated on that machine
-        for result in machine:
-            stats = result['stats']
+    result = _init(params)
+    if isinstance(result, Exception):
+        raise result
+
+    params['clock'] = _read_clock(params)
+
+    print 'BeeGee %i is armed.' % params['i']
+
+    return params
+
+def deploy(count, group, zone, image_id, instance_type, username, key_name, subnet, bid = None, quorum = None, spot_interval = 10, spot_deadline = None, label = None):
+    """
+    Call up, train and arm the swarm, then attack, without waiting on the whole swarm between phases.
+
+    Every beegee is trained as soon as she takes SSH and armed as soon as she
+    is trained. The attack is released once quorum beegees are armed (all of
+    them by default) and beegees armed after that join in straight away.
+
+    The attack is added to the run history with label, like attack's.
+    """
+    count, instance_ids = _muster(count, zone, username, key_name)
 
-            tests += int(stats['tests'])
-            passes += int(stats['passes'])
-            failures += int(stats['failures'])
-            duration += float(stats['duration'])
+    ec2_connection = _connect_to_hive(zone, key_name)
 
-            for failed_test in result['failures']:
-                failed_tests.append([failed_test['title'], failed_test['duration']])
+    if isinstance(ec2_connection, Exception):
+        return ec2_connection
 
-    print '     Tests ran:      %i' % tests
-    print '         Successful: %i' % passes
-    print bcolors.FAIL + '         Failed:     %i' % failures + bcolors.ENDC
-    print '         Duration:   %f seconds' % (float(duration) / 1000)
-    if len(failed_tests) > 0:
+    new_instances = []
+
+    if count:
+        new_instances = _call_up(ec2_connection, count, group, zone, image_id, instance_type, key_name, subnet, bid, spot_interval, spot_deadline)
+
+        if isinstance(new_instances, Exception):
+            return new_instances
+
+    existing_instances = []
+
+    if instance_ids:
+        for reservation in ec2_connection.get_all_instances(instance_ids=instance_ids):
+            existing_instances.extend(reservation.instances)
+
+    called_up = list(existing_instances)
+    arrivals = Queue.Queue()
+    events = Queue.Queue()
+
+    def land():
+        # spot beegees land over time, so they are handed over from a thread as they do
+        try:
+            for instance in new_instances:
+                called_up.append(instance)
+                arrivals.put(instance)
+        finally:
+            arrivals.put(None)
+
+    def provision():
+        try:
+            running = _iter_running_instances(ec2_connection, existing_instances, arrivals=arrivals)
+            for i, instance in enumerate(running):
+                print 'BeeGee %s is ready for training.' % instance.id
+                events.put(('running', _bee_to_params(i, _instance_to_bee(instance), username, key_name), None))
+        finally:
+            events.put(('provisioned', None, None))
+
+    for target in (land, provision):
+        thread = threading.Thread(target=target)
+        thread.daemon = True
+        thread.start()
+
+    print 'Training and arming each beegee as she arrives.'
+
+    # attacks overlap with arming, and no beegee should wait for a worker to open fire
+    pool = _get_pool(len(instance_ids) + count, all_at_once=True)
+    swarm = SwarmResults()
+    waiting = []
+    fired = []
+    firing = {}
+    halt = threading.Event() if _executor['kind'] == 'thread' else None
+    state = {'running': 0, 'armed': 0, 'failed': 0, 'in_flight': 0, 'provisioned': False, 'released': False}
+
+    def submit(func, params, event):
+        state['in_flight'] += 1
+        pool.apply_async(_in_worker(_guarded), (func, params),
+                         callback=lambda result: events.put((event, params, tracer.receive(result))))
+
+    try:
+        while not (state['provisioned'] and state['in_flight'] == 0 and not waiting):
+            # a timeout keeps the wait interruptible with Ctrl-C
+            try:
+                event, params, result = events.get(True, 1)
+            except Queue.Empty:
+                continue
+
+            if event == 'running':
+                state['running'] += 1
+                submit(_arm, params, 'armed')
+            elif event == 'provisioned':
+                state['provisioned'] = True
+            elif event == 'armed':
+                state['in_flight'] -= 1
+                if isinstance(result, Exception):
+                    print 'BeeGee %i could not be armed: %s' % (params['i'], result)
+                    state['failed'] += 1
+                else:
+                    state['armed'] += 1
+                    # her clock was read while arming, on a copy of params with the process executor
+                    waiting.append(result)
+            elif event == 'attacked':
+                state['in_flight'] -= 1
+                firing.pop(params['i'], None)
+                if isinstance(result, Exception):
+                    print 'BeeGee %i lost her way: %s' % (params['i'], result)
+                    state['failed'] += 1
+                else:
+                    swarm.merge(result)
+                    fired.append(params)
+                    _print_progress(swarm, state['armed'])
+
+            # hold fire until the quorum is armed, or until no more beegees can arm
+            everyone_settled = state['provisioned'] and state['armed'] + state['failed'] >= state['running']
+            if waiting and (state['released'] or state['armed'] >= (quorum or count + len(instance_ids)) or everyone_settled):
+                if not state['released']:
+                    print 'The attack is released with %i beegees armed.' % state['armed']
+                    state['released'] = True
+                for params in waiting:
+                    if halt is not None:
+                        params['halt'] = halt
+                    firing[params['i']] = params
+                    submit(_attack, params, 'attacked')
+                waiting = []
+    except KeyboardInterrupt:
+        print
+        print 'Offensive called off with %i of %i beegees back.' % (swarm.bees, state['armed'])
+        if halt is not None:
+            halt.set()
+        _call_off(firing.values())
+    else:
+        print
+        print 'Offensive complete.'
+    finally:
+        pool.terminate()
+
+        if called_up:
+            ec2_connection.create_tags([instance.id for instance in called_up], { "Name": "a bee!" })
+            _write_server_list(username, key_name, zone, called_up)
+
+    _print_results(swarm)
+
+    if fired:
+        _record_run(swarm, 'checkin-test', _read_revision(fired[0]), label, None)
+
+    print 'The swarm is awaiting new orders.'
+
+def _redirect_stdout(outfile, func, *args, **kwargs):
+    save_out = sys.stdout
+    with open(outfile, 'w') as redir_out:
+        sys.stdout = redir_out
+        func(*args, **kwargs)
+    sys.stdout = save_out
+
+def _print_progress(swarm, total):
+    line = '%i/%i beegees back: %i tests, %i passed, %i failed' % (swarm.bees, total, swarm.tests, swarm.passes, swarm.failures)
+    if sys.stdout.isatty():
+        sys.stdout.write('\r\033[K' + line)
+        sys.stdout.flush()
+    else:
+        print line
+
+def _format_bytes(size):
+    if size < 1000:
+        return '%i bytes' % size
+    for unit in ('KB', 'MB', 'GB'):
+        size /= 1000.0
+        if size < 1000 or unit == 'GB':
+            return '%.1f %s' % (size, unit)
+
+def _format_time(moment):
+    return time.strftime('%Y-%m-%d %H:%M', time.localtime(moment))
+
+def _describe_run(row):
+    details = [_format_time(row['started']), row['target']]
+    if row['revision']:
+        details.append('revision %s' % row['revision'][:7])
+    if row['label']:
+        details.append(row['label'])
+    if row['called_off']:
+        details.append('called off')
+    return 'run %i (%s)' % (row['id'], ', '.join(details))
+
+def _print_comparison(comparison):
+    first, second = comparison['first'], comparison['second']
+
+    print 'Comparing %s' % _describe_run(first)
+    print '     with %s' % _describe_run(second)
+    print
+    print '     %-14s %14s %14s %10s' % ('', 'run %i' % first['id'], 'run %i' % second['id'], 'change')
+
+    for name, before, after in comparison['metrics']:
+        if name == 'failure_rate':
+            values = ['-' if value is None else '%.2f%%' % (value * 100) for value in (before, after)]
+            change = '%+.2f pts' % ((after - before) * 100)
+        else:
+            unit = '/s' if name == 'throughput' else '' if name == 'tests' else ' ms'
+            values = ['-' if value is None else ('%i' if name == 'tests' else '%.1f') % value + unit for value in (before, after)]
+            change = '%+.1f%%' % ((after - before) * 100.0 / before) if before and after is not None else '-'
+        label = 'p99.9' if name == 'p999' else name if name in dict(history.PERCENTILES) else name.replace('_', ' ').capitalize()
+        print '     %-14s %14s %14s %10s' % (label + ':', values[0], values[1], change)
+
+    for heading, failures in (('Failing only in run %i' % second['id'], comparison['new_failures']),
+                              ('Failing only in run %i' % first['id'], comparison['fixed_failures'])):
+        if not failures:
+            continue
+        print
+        print '     %s (%i):' % (heading, len(failures))
+        for title, count in failures[:MAX_PRINTED_FAILURES]:
+            print '          %s (%i)' % (title, count)
+        if len(failures) > MAX_PRINTED_FAILURES:
+            print '          ... and %i more' % (len(failures) - MAX_PRINTED_FAILURES)
+
+def _print_live(view, second):
+    p50, p99 = [second.latency.percentile(percent) for percent in (50, 99)]
+    line = 'Live: %i tests/s, %.1f%% failed, p50 %s, p99 %s, %i beegees reporting' % (
+        second.tests, second.error_rate() * 100, '-' if p50 is None else '%.0f ms' % p50,
+        '-' if p99 is None else '%.0f ms' % p99, len(second.bees))
+    if sys.stdout.isatty():
+        sys.stdout.write('\r\033[K' + line)
+        sys.stdout.flush()
+    else:
+        print line
+
+def _failure_status(error, deadline):
+    if isinstance(error, DetailsDeadlineExceeded):
+        return 'took over %g seconds to send her results' % DETAILS_DEADLINE
+    if isinstance(error, DeadlineExceeded):
+        return 'missed the %g second deadline' % deadline
+    if isinstance(error, CalledOff):
+        return 'was called off before she opened fire'
+    return 'lost her way: %s' % (str(error) or error.__class__.__name__)
+
+def _print_statuses(statuses, back, total):
+    """
+    Say how many beegees came back and what became of the others.
+    """
+    print '     BeeGees back:   %i of %i' % (back, total)
+    for bee_params, status in statuses:
+        if 'covering' in bee_params and not status:
+            print '          BeeGee %i covered for BeeGee %i' % (bee_params['i'], bee_params['covering'])
+        elif 'covering' in bee_params:
+            print bcolors.FAIL + '          BeeGee %i %s covering for BeeGee %i' % (bee_params['i'], status, bee_params['covering']) + bcolors.ENDC
+        elif status:
+            print bcolors.FAIL + '          BeeGee %i %s' % (bee_params['i'], status) + bcolors.ENDC
+
+def _print_rounds(rounds):
+    print '%5s %8s %8s %8s %9s %10s %10s  %s' % ('round', 'beegees', 'back', 'tests', 'errors', 'p99 (ms)', 'tests/s', 'target')
+    for number, result in enumerate(rounds, 1):
+        print '%5i %8i %8i %8i %8.2f%% %10s %10.2f  %s' % (
+            number, result['bees'], result['back'], result['tests'], result['error_rate'] * 100,
+            '-' if result['p99'] is None else '%.1f' % result['p99'], result['throughput'],
+            'held' if result['passed'] else bcolors.FAIL + 'gave way' + bcolors.ENDC)
+
+def _print_results(swarm):
+    print '     Tests ran:      %i' % swarm.tests
+    print '         Successful: %i' % swarm.passes
+    print bcolors.FAIL + '         Failed:     %i' % swarm.failures + bcolors.ENDC
+    print '         Elapsed:    %f seconds' % (swarm.elapsed / 1000)
+    print '         Throughput: %.2f tests/second' % swarm.throughput()
+    peak = swarm.timeline.peak()
+    if peak:
+        print '         Peak:       %i tests/second, %i seconds in' % (peak[1], peak[0] - min(swarm.timeline.buckets))
+    if swarm.start_lags:
+        print '         Start skew: %.1f ms across %i beegees (latest %.1f ms behind schedule)' % (
+            (max(swarm.start_lags) - min(swarm.start_lags)) * 1000, len(swarm.start_lags), max(swarm.start_lags) * 1000)
+    if swarm.clock_offsets:
+        offsets = [offset for offset, error in swarm.clock_offsets]
+        print '         Clocks:     up to %.1f ms apart, lined up to within %.1f ms' % (
+            (max(offsets) - min(offsets)) * 1000, max(error for offset, error in swarm.clock_offsets) * 1000)
+    if swarm.transfer_bytes:
+        print '         Results:    %s sent for %s of details (%.1fx), at most %s from one beegee' % (
+            _format_bytes(swarm.transfer_bytes), _format_bytes(swarm.detail_bytes), float(swarm.detail_bytes) / swarm.transfer_bytes,
+            _format_bytes(max(bee['bytes'] for bee in swarm.per_bee)))
+        # a beegee without gzip sends her details as they are, which the swarm's ratio hides
+        ratios = sorted((float(bee['raw_bytes']) / bee['bytes'], bee['bee']) for bee in swarm.per_bee if bee['bytes'])
+        if len(ratios) > 1:
+            print '         Compressed: %.1fx to %.1fx per beegee (median %.1fx, least by BeeGee %i)' % (
+                ratios[0][0], ratios[-1][0], ratios[len(ratios) // 2][0], ratios[0][1])
+    if swarm.latency.count:
+        print '     Latency:'
+        for label, percent in (('p50', 50), ('p90', 90), ('p99', 99), ('p99.9', 99.9)):
+            print '         %-6s      %.1f ms' % (label + ':', swarm.latency.percentile(percent))
+        print '         max:        %.1f ms' % swarm.latency.max
+    if len(swarm.failed_tests) > 0:
         print '     ==================================='
         print '     Failures:'
-        for failed_test in failed_tests:
-            print bcolors.FAIL + '          %s' % failed_test[0] + ' [%i' % failed_test[1] + ' ms]' + bcolors.ENDC
+        # the tests that failed most often first
+        failures = sorted(swarm.failed_tests.iteritems(), key=lambda failure: (-failure[1][0], failure[0]))
+        for title, (count, duration) in failures[:MAX_PRINTED_FAILURES]:
+            print bcolors.FAIL + '          %s' % title + (' (%i times)' % count if count > 1 else '') + ' [%i ms]' % duration + bcolors.ENDC
+        if len(swarm.failed_tests) > MAX_PRINTED_FAILURES:
+            print bcolors.FAIL + '          ... and %i more' % (len(swarm.failed_tests) - MAX_PRINTED_FAILURES) + bcolors.ENDC
@@ -0,0 +1,462 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+"""
+Benchmarks for the control node, run with:
+
+    python -m beegeeswithmachineguns.bench
+
+The control suite takes a simulated swarm through up, init, attack and the
+results against fake EC2 and SSH (see fakes.py), so it costs nothing to run.
+Save a baseline with --save-baseline and check later runs against it with
+--baseline, which exits non-zero on a regression.
+
+The transfer suite parses hundreds of MB of synthetic results from one
+beegee as sent plain and gzipped, to weigh the bytes saved on the control
+node's link against the time spent decompressing.
+"""
+
+from collections import Counter
+from optparse import OptionParser, OptionGroup
+import json
+import os
+import resource
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+from beegeeswithmachineguns import beegees, engine, fakes, history
+from beegeeswithmachineguns.results import SwarmResults
+
+def _rss_kb(pid):
+    """
+    Resident set size of a process in kB, or None where /proc is unavailable.
+    """
+    try:
+        with open('/proc/%i/status' % pid) as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except IOError:
+        return None
+
+class RSSSampler(threading.Thread):
+    """
+    Samples the combined RSS of this process and its children until stopped.
+    """
+    def __init__(self, interval=0.05):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.interval = interval
+        self.peak_kb = 0
+        self.stopped = threading.Event()
+
+    def sample(self):
+        import multiprocessing
+        pids = [os.getpid()] + [child.pid for child in multiprocessing.active_children()]
+        sizes = [_rss_kb(pid) for pid in pids]
+        if None in sizes:
+            # no /proc, settle for our own high-water mark
+            total = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        else:
+            total = sum(sizes)
+        self.peak_kb = max(self.peak_kb, total)
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.sample()
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.sample()
+        return self.peak_kb
+
+def _simulated_bee(params):
+    """
+    Stand-in for _attack: hold an SSH-sized buffer and block like a remote command would.
+    """
+    buf = bytearray(params['buffer_kb'] * 1024)
+    time.sleep(params['bee_time'])
+    return len(buf)
+
+def bench_fan_out(bees, executor, workers, bee_time=0.05, buffer_kb=64):
+    """
+    Time one fan-out over simulated beegees, returns (wall seconds, peak RSS kB).
+    """
+    saved_executor = dict(beegees._executor)
+    beegees.set_executor(executor, workers)
+    params = [{'i': i, 'bee_time': bee_time, 'buffer_kb': buffer_kb} for i in range(bees)]
+
+    sampler = RSSSampler()
+    sampler.start()
+    start = time.time()
+    try:
+        beegees._fan_out(_simulated_bee, params)
+    finally:
+        wall = time.time() - start
+        peak = sampler.stop()
+        beegees.set_executor(**saved_executor)
+
+    return wall, peak
+
+def _ec2_calls(conn):
+    calls = Counter(conn.calls)
+    throttled = calls.pop('throttled', 0)
+    return sum(calls.values()), throttled
+
+def _ssh_calls(ssh):
+    return ssh.calls['connect'] + ssh.calls['exec_command']
+
+def _measure(func, *args):
+    """
+    Run func with its output thrown away, returns (result, wall seconds, peak RSS kB).
+    """
+    sampler = RSSSampler()
+    sampler.start()
+    saved_stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    start = time.time()
+    try:
+        result = func(*args)
+    finally:
+        wall = time.time() - start
+        sys.stdout.close()
+        sys.stdout = saved_stdout
+        peak = sampler.stop()
+    return result, wall, peak
+
+def bench_control_plane(bees, api_latency=0.02, throttle=None, boot_time=0, tests=100, title_size=40, workers=64):
+    """
+    Take a simulated swarm through up, init and attack and print its results.
+
+    Returns one dict per phase with its wall seconds, peak RSS kB and the EC2
+    and SSH calls it made. The beegees open fire as soon as they are armed,
+    as the lead a real attack gives them to get ready would otherwise be most
+    of the attack's time.
+    """
+    conn = fakes.FakeEC2Connection(boot_time, api_latency, throttle)
+    ssh = fakes.FakeSSH(tests=tests, title_size=title_size)
+    workdir = tempfile.mkdtemp(prefix='beegees-bench-')
+
+    saved = (beegees.STATE_FILENAME, history.HISTORY_FILENAME, beegees._connect_to_region, beegees._ssh_sessions,
+             beegees.START_LEAD)
+    saved_executor = dict(beegees._executor)
+    # what the fake EC2 told the caches must not outlive the benchmark
+    caches = (beegees._ec2_connections, beegees._security_group_ids, beegees._subnet_zones)
+    saved_caches = [dict(cache) for cache in caches]
+
+    beegees.STATE_FILENAME = os.path.join(workdir, 'roster')
+    history.HISTORY_FILENAME = os.path.join(workdir, 'history.sqlite')
+    beegees._connect_to_region = lambda zone: conn
+    beegees._ssh_sessions = beegees.SSHSessionPool(connect=ssh.connect)
+    beegees.START_LEAD = 0
+    beegees.set_executor('thread', workers)
+
+    phases = []
+
+    def phase(name, func, *args):
+        ec2_before, throttled_before = _ec2_calls(conn)
+        ssh_before = _ssh_calls(ssh)
+        result, wall, peak = _measure(func, *args)
+        ec2_after, throttled_after = _ec2_calls(conn)
+        phases.append({'phase': name, 'bees': bees, 'wall': wall, 'rss_kb': peak,
+                       'ec2_calls': ec2_after - ec2_before, 'throttled': throttled_after - throttled_before,
+                       'ssh_calls': _ssh_calls(ssh) - ssh_before})
+        return result
+
+    try:
+        phase('up', beegees.up, bees, 'default', 'us-east-1d', 'ami-11e0597a', 't2.micro', 'ubuntu', 'bench', None)
+        phase('init', beegees.init)
+        swarm = phase('attack', beegees.attack)
+        phase('results', beegees._print_results, swarm)
+    finally:
+        beegees._ssh_sessions.close()
+        (beegees.STATE_FILENAME, history.HISTORY_FILENAME, beegees._connect_to_region, beegees._ssh_sessions,
+         beegees.START_LEAD) = saved
+        beegees.set_executor(**saved_executor)
+        for cache, contents in zip(caches, saved_caches):
+            cache.clear()
+            cache.update(contents)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return phases
+
+def find_regressions(phases, baseline, tolerance=0.25, slack=0.05):
+    """
+    Compare measured phases against a baseline saved by --save-baseline.
+
+    Wall time, peak RSS and call counts may each grow by tolerance (a
+    fraction) before it counts as a regression; wall times get slack seconds
+    on top, as the fastest phases are mostly noise. Returns a description of
+    each regression.
+    """
+    regressions = []
+    for measured in phases:
+        key = '%s@%i' % (measured['phase'], measured['bees'])
+        if key not in baseline:
+            continue
+        for metric, extra in (('wall', slack), ('rss_kb', 0), ('ec2_calls', 0), ('ssh_calls', 0)):
+            limit = baseline[key][metric] * (1 + tolerance) + extra
+            if measured[metric] > limit:
+                regressions.append('%s %s went from %s to %s' % (key, metric, baseline[key][metric], measured[metric]))
+    return regressions
+
+# what the engine benchmark's target answers every request with, in one write
+_CANNED_RESPONSE = 'HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\nContent-Length: 1024\r\n\r\n' + 'x' * 1024
+
+def _answer(conn):
+    buf = ''
+    try:
+        while True:
+            chunk = conn.recv(65536)
+            if not chunk:
+                return
+            buf += chunk
+            # GETs without bodies, so every blank line ends a request
+            while '\r\n\r\n' in buf:
+                head, buf = buf.split('\r\n\r\n', 1)
+                conn.sendall(_CANNED_RESPONSE)
+    except socket.error:
+        pass
+    finally:
+        conn.close()
+
+def _serve_canned(listener):
+    """
+    A minimal keep-alive HTTP target, a thread per connection.
+    """
+    while True:
+        conn, address = listener.accept()
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        thread = threading.Thread(target=_answer, args=(conn,))
+        thread.daemon = True
+        thread.start()
+
+def bench_engine(requests, concurrency):
+    """
+    Attack a local target with the engine, which runs in this process and the
+    target in another. Returns (wall seconds, engine CPU seconds, failures).
+    """
+    import multiprocessing
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1024)
+    port = listener.getsockname()[1]
+
+    target = multiprocessing.Process(target=_serve_canned, args=(listener,))
+    target.daemon = True
+    target.start()
+    listener.close()
+
+    try:
+        request = engine.Request('http://127.0.0.1:%i/' % port)
+        with open(os.devnull, 'w') as out:
+            before = resource.getrusage(resource.RUSAGE_SELF)
+            start = time.time()
+            stats = engine.Engine(request, out, concurrency, requests=requests).run()
+            wall = time.time() - start
+            after = resource.getrusage(resource.RUSAGE_SELF)
+    finally:
+        target.terminate()
+        target.join()
+
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    return wall, cpu, stats['failures']
+
+def _iter_slices(data, size=32768):
+    """
+    data in chunks of the size _iter_channel reads.
+    """
+    for start in xrange(0, len(data), size):
+        yield data[start:start + size]
+
+def bench_transfer(size, level=1):
+    """
+    Parse size bytes of synthetic results of one beegee, as sent plain and
+    as gzipped at level. Returns a dict per way of sending with the bytes
+    sent and parsed, the tests found, the wall seconds spent decompressing
+    and parsing, the peak RSS kB beyond the payloads themselves and the
+    seconds the beegee spent compressing.
+    """
+    details = fakes.large_details(size)
+
+    start = time.time()
+    compressed = fakes.gzipped(details, level)
+    compress_time = time.time() - start
+
+    measured = []
+    for mode, sent, spent in (('plain', details, 0.0), ('gzip', compressed, compress_time)):
+        before = _rss_kb(os.getpid()) or 0
+        stats = {}
+        bee, wall, peak = _measure(lambda: SwarmResults.from_chunks(beegees._iter_gunzipped(_iter_slices(sent), stats)))
+        measured.append({'mode': mode, 'bytes': len(sent), 'raw_bytes': stats['raw_bytes'], 'tests': bee.tests,
+                         'wall': wall, 'rss_kb': max(peak - before, 0), 'compress': spent})
+
+    return measured
+
+def _run_fan_out(options):
+    print '%-8s %-8s %6s %10s %12s' % ('executor', 'workers', 'bees', 'wall (s)', 'peak RSS (MB)')
+
+    for executor in options.executors.split(','):
+        for workers in [int(w) for w in options.workers.split(',')]:
+            for bees in [int(b) for b in options.bees.split(',')]:
+                try:
+                    wall, peak = bench_fan_out(bees, executor, workers, options.bee_time)
+                except OSError as e:
+                    # forking one process per beegee is exactly what runs out of memory or fds
+                    print '%-8s %-8s %6i %10s %12s' % (executor, workers or 'all', bees, 'failed', e.strerror)
+                    continue
+                print '%-8s %-8s %6i %10.2f %12.1f' % (executor, workers or 'all', bees, wall, peak / 1024.0)
+
+def _run_engine(options):
+    print '%11s %9s %10s %12s %10s %16s' % ('concurrency', 'requests', 'wall (s)', 'requests/s', 'CPU (s)', 'requests/s/core')
+
+    for concurrency in [int(c) for c in options.engine_concurrency.split(',')]:
+        wall, cpu, failures = bench_engine(options.engine_requests, concurrency)
+        print '%11i %9i %10.2f %12.0f %10.2f %16.0f%s' % (concurrency, options.engine_requests, wall, options.engine_requests / wall,
+                                                         cpu, options.engine_requests / cpu if cpu else 0,
+                                                         '  (%i failed)' % failures if failures else '')
+
+def _run_transfer(options):
+    print 'One beegee\'s results, received over a %i Mbit/s link:' % options.link_mbps
+    print '%12s %-6s %10s %7s %10s %11s %10s %13s %11s' % ('details (MB)', 'sent', 'sent (MB)', 'ratio', 'gzip (s)', 'receive (s)',
+                                                      'parse (s)', 'parse (MB/s)', 'RSS (MB)')
+
+    for size in [int(s) for s in options.transfer_mb.split(',')]:
+        for measured in bench_transfer(size * 1000000):
+            print '%12.0f %-6s %10.1f %6.1fx %10.2f %11.2f %10.2f %13.1f %11.1f' % (
+                measured['raw_bytes'] / 1e6, measured['mode'], measured['bytes'] / 1e6, float(measured['raw_bytes']) / measured['bytes'],
+                measured['compress'], measured['bytes'] * 8 / (options.link_mbps * 1e6), measured['wall'],
+                measured['raw_bytes'] / 1e6 / measured['wall'], measured['rss_kb'] / 1024.0)
+
+def _run_control(options):
+    print '%-8s %6s %10s %14s %10s %10s %10s' % ('phase', 'bees', 'wall (s)', 'peak RSS (MB)', 'EC2 calls', 'throttled', 'SSH calls')
+
+    phases = []
+    for bees in [int(b) for b in options.bees.split(',')]:
+        for measured in bench_control_plane(bees, options.api_latency, options.throttle, options.boot_time,
+                                            options.tests, options.title_size):
+            print '%-8s %6i %10.2f %14.1f %10i %10i %10i' % (measured['phase'], bees, measured['wall'], measured['rss_kb'] / 1024.0,
+                                                         measured['ec2_calls'], measured['throttled'], measured['ssh_calls'])
+            phases.append(measured)
+
+    if options.save_baseline:
+        with open(options.save_baseline, 'w') as f:
+            json.dump(dict(('%s@%i' % (m['phase'], m['bees']), m) for m in phases), f, indent=2, sort_keys=True)
+        print 'Saved the baseline to %s.' % options.save_baseline
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            regressions = find_regressions(phases, json.load(f), options.tolerance)
+        if regressions:
+            print 'Regressions against %s:' % options.baseline
+            for regression in regressions:
+                print '  ' + regression
+            return False
+        print 'No regressions against %s.' % options.baseline
+
+    return True
+
+def main():
+    parser = OptionParser(usage="python -m beegeeswithmachineguns.bench [options]")
+    parser.add_option('--suite', dest='suite', default='fan-out,control',
+                      help="Comma separated suites to run: fan-out, control, engine, transfer (default: fan-out,control).")
+    parser.add_option('--bees', dest='bees', default='10,100,1000',
+                      help="Comma separated swarm sizes to simulate (default: 10,100,1000).")
+
+    fan_out_group = OptionGroup(parser, "fan-out", "Compares executors fanning out to beegees that just block.")
+    fan_out_group.add_option('--executors', dest='executors', default='thread,process',
+                             help="Comma separated executors to compare (default: thread,process).")
+    fan_out_group.add_option('--workers', dest='workers', default='64,0',
+                             help="Comma separated worker caps, 0 for one worker per beegee (default: 64,0).")
+    fan_out_group.add_option('--bee-time', dest='bee_time', type='float', default=0.05,
+                             help="Seconds each simulated beegee blocks for (default: 0.05).")
+    parser.add_option_group(fan_out_group)
+
+    control_group = OptionGroup(parser, "control", "Times up, init, attack and the results against fake EC2 and SSH.")
+    control_group.add_option('--api-latency', dest='api_latency', type='float', default=0.02,
+                             help="Seconds every EC2 call takes (default: 0.02).")
+    control_group.add_option('--throttle', dest='throttle', type='float', default=None,
+                             help="EC2 calls a second before RequestLimitExceeded (default: unlimited).")
+    control_group.add_option('--boot-time', dest='boot_time', type='float', default=0,
+                             help="Seconds an instance takes to boot (default: 0).")
+    control_group.add_option('--tests', dest='tests', type='int', default=100,
+                             help="Tests in each beegee's results (default: 100).")
+    control_group.add_option('--title-size', dest='title_size', type='int', default=40,
+                             help="Characters per test title, to grow the results (default: 40).")
+    control_group.add_option('--save-baseline', metavar="FILE", dest='save_baseline', default=None,
+                             help="Save the measurements to FILE as the baseline.")
+    control_group.add_option('--baseline', metavar="FILE", dest='baseline', default=None,
+                             help="Compare against the baseline in FILE and fail on a regression.")
+    control_group.add_option('--tolerance', dest='tolerance', type='float', default=0.25,
+                             help="How much worse than the baseline still passes, as a fraction (default: 0.25).")
+    parser.add_option_group(control_group)
+
+    engine_group = OptionGroup(parser, "engine", "Measures the HTTP engine's requests a second per core against a local target.")
+    engine_group.add_option('--engine-requests', dest='engine_requests', type='int', default=20000,
+                            help="Requests per run (default: 20000).")
+    engine_group.add_option('--engine-concurrency', dest='engine_concurrency', default='1,10,100',
+                            help="Comma separated connection counts to compare (default: 1,10,100).")
+    parser.add_option_group(engine_group)
+
+    transfer_group = OptionGroup(parser, "transfer", "Compares receiving a beegee's results plain and gzipped.")
+    transfer_group.add_option('--transfer-mb', dest='transfer_mb', default='100,300',
+                              help="Comma separated sizes of the results in MB (default: 100,300).")
+    transfer_group.add_option('--link-mbps', dest='link_mbps', type='int', default=1000,
+                              help="The control node's inbound bandwidth in Mbit/s, to work out receive times (default: 1000).")
+    parser.add_option_group(transfer_group)
+
+    (options, args) = parser.parse_args()
+
+    suites = options.suite.split(',')
+    ok = True
+
+    if 'fan-out' in suites:
+        _run_fan_out(options)
+    if 'control' in suites:
+        if 'fan-out' in suites:
+            print
+        ok = _run_control(options)
+    if 'engine' in suites:
+        if len(suites) > 1:
+            print
+        _run_engine(options)
+    if 'transfer' in suites:
+        if len(suites) > 1:
+            print
+        _run_transfer(options)
+
+    if not ok:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
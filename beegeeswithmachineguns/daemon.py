@@ -0,0 +1,319 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+"""
+A long-lived beegees that keeps the SSH sessions to the beegees open, and
+boto and paramiko loaded, from one command to the next. What EC2 was asked
+is forgotten between commands, as the security groups and subnets may
+have changed in the meantime.
+
+`beegees daemon` listens on a Unix socket. While it does, the beegees script
+hands every other command to it instead of starting afresh: it sends the
+arguments, working directory and whether its output is a terminal as a line
+of JSON, then copies what comes back to its own output until the exit
+status arrives. Each frame is a kind, the payload's length as 8 hex digits
+and the payload:
+
+    o  a write to stdout
+    e  a write to stderr
+    x  the exit status, as a number
+
+This module is all the client imports, so it must not import boto, paramiko
+or the rest of beegees at the top.
+"""
+
+import json
+import os
+import socket
+import sys
+import thread
+import threading
+import traceback
+
+SOCKET_FILENAME = os.path.expanduser('~/.beegees-daemon.sock')
+
+def _connect(path):
+    """
+    A socket connected to the daemon at path, or None if none is listening.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except socket.error:
+        sock.close()
+        return None
+    return sock
+
+def _send(sock, kind, payload):
+    sock.sendall('%s%08x%s' % (kind, len(payload), payload))
+
+def _read_exactly(sock, size):
+    data = ''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+def _read_frame(sock):
+    """
+    The next (kind, payload) from sock, or (None, None) if it closed.
+    """
+    header = _read_exactly(sock, 9)
+    if header is None:
+        return None, None
+    payload = _read_exactly(sock, int(header[1:], 16))
+    if payload is None:
+        return None, None
+    return header[0], payload
+
+def _read_request(sock):
+    """
+    The client's request, or None if it only checked that the daemon is there.
+    """
+    line = ''
+    while not line.endswith('\n'):
+        chunk = sock.recv(4096)
+        if not chunk:
+            if line:
+                raise socket.error('The client hung up before saying what to run.')
+            return None
+        line += chunk
+    return json.loads(line)
+
+def forward(argv, path=None):
+    """
+    Run a command on the daemon, if one is listening, and return its exit status.
+
+    Returns None when the command has to run in this process instead: there
+    is no daemon, or the command is the daemon itself.
+    """
+    if argv[:1] == ['daemon']:
+        return None
+
+    sock = _connect(path or SOCKET_FILENAME)
+    if sock is None:
+        return None
+
+    try:
+        sock.sendall(json.dumps({'argv': argv, 'cwd': os.getcwd(), 'tty': sys.stdout.isatty()}) + '\n')
+        while True:
+            kind, payload = _read_frame(sock)
+            if kind is None:
+                sys.stderr.write('The beegees daemon hung up before the command finished.\n')
+                return 1
+            if kind == 'x':
+                return int(payload)
+            stream = sys.stderr if kind == 'e' else sys.stdout
+            stream.write(payload)
+            stream.flush()
+    except KeyboardInterrupt:
+        # hanging up interrupts the command on the daemon, just as it would have here
+        return 130
+    finally:
+        sock.close()
+
+def stop(path=None):
+    """
+    Ask the daemon to shut down. Returns False if none is listening.
+    """
+    sock = _connect(path or SOCKET_FILENAME)
+    if sock is None:
+        return False
+
+    try:
+        sock.sendall(json.dumps({'stop': True}) + '\n')
+        _read_frame(sock)
+    finally:
+        sock.close()
+
+    return True
+
+class _Output(object):
+    """
+    Stands in for sys.stdout or sys.stderr while a client's command runs, passing writes on as frames.
+
+    Once the client has hung up, writes go nowhere, so an interrupted command
+    can wind down as it would after Ctrl-C, recording its run and all.
+    """
+    def __init__(self, session, kind, tty):
+        self.session = session
+        self.kind = kind
+        self.tty = tty
+
+    def write(self, data):
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        if not data or self.session.hung_up:
+            return
+        try:
+            _send(self.session.sock, self.kind, data)
+        except socket.error:
+            self.session.hang_up()
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return self.tty
+
+class _Session(object):
+    """
+    One client's command. Should the client hang up while it runs, the
+    command is interrupted as if Ctrl-C had been pressed.
+    """
+    def __init__(self, sock):
+        self.sock = sock
+        self.running = False
+        self.hung_up = False
+        self.lock = threading.Lock()
+
+    def watch(self):
+        self.running = True
+        watcher = threading.Thread(target=self._watch)
+        watcher.daemon = True
+        watcher.start()
+
+    def _watch(self):
+        # the client sends nothing after its request, so anything but blocking means it is gone
+        try:
+            self.sock.recv(1)
+        except socket.error:
+            pass
+        self.hang_up()
+
+    def hang_up(self):
+        with self.lock:
+            if self.running and not self.hung_up:
+                self.hung_up = True
+                thread.interrupt_main()
+
+    def done(self):
+        with self.lock:
+            self.running = False
+
+def _run(session, request, run_command):
+    """
+    Run the client's command with its arguments, working directory and
+    output, and send back its exit status.
+    """
+    saved = sys.stdout, sys.stderr, sys.argv, os.getcwd()
+    status = 0
+
+    session.watch()
+    try:
+        sys.stdout = _Output(session, 'o', request.get('tty', False))
+        sys.stderr = _Output(session, 'e', False)
+        sys.argv = ['beegees'] + request['argv']
+        os.chdir(request['cwd'])
+        from beegeeswithmachineguns import beegees
+        beegees.forget_ec2_state()
+        run_command()
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            status = e.code or 0
+        else:
+            print >> sys.stderr, e.code
+            status = 1
+    except KeyboardInterrupt:
+        status = 130
+    except Exception:
+        traceback.print_exc()
+        status = 1
+    finally:
+        session.done()
+        sys.stdout, sys.stderr, sys.argv = saved[:3]
+        os.chdir(saved[3])
+
+    if not session.hung_up:
+        _send(session.sock, 'x', str(status))
+
+def serve(path=None):
+    """
+    Run commands for the beegees script, one at a time, until asked to stop.
+
+    Returns False if a daemon is already listening at path.
+    """
+    from beegeeswithmachineguns import main
+
+    path = path or SOCKET_FILENAME
+
+    running = _connect(path)
+    if running is not None:
+        running.close()
+        print 'A beegees daemon is already listening on %s.' % path
+        return False
+
+    # whoever can connect can command the swarm, so only this user may
+    if os.path.exists(path):
+        os.remove(path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(077)
+    try:
+        listener.bind(path)
+    finally:
+        os.umask(umask)
+    listener.listen(16)
+
+    print 'The beegees daemon is listening on %s, stop it with: beegees daemon stop' % path
+
+    try:
+        while True:
+            sock, address = listener.accept()
+            session = _Session(sock)
+            try:
+                request = _read_request(sock)
+                if request is None:
+                    continue
+                if request.get('stop'):
+                    _send(sock, 'x', '0')
+                    break
+                # commands share the roster and the sessions, so they take turns
+                _run(session, request, main.parse_options)
+            except KeyboardInterrupt:
+                # an interrupt meant for a client's command must not stop the daemon
+                if not session.hung_up:
+                    raise
+            except (socket.error, ValueError, KeyError) as e:
+                print >> sys.stderr, 'Dropped a client: %s' % e
+            finally:
+                # wakes the session's watcher, should the client still be connected
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except socket.error:
+                    pass
+                sock.close()
+    finally:
+        listener.close()
+        os.remove(path)
+
+    print 'The beegees daemon has stood down.'
+    return True
@@ -0,0 +1,554 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+"""
+An HTTP load engine beegees can run instead of the checkin-test suite.
+
+It has no dependencies beyond the standard library and runs under Python 2
+or 3, so it can be copied onto a beegee and started there:
+
+    python beegees-engine.py http://target/ --concurrency 100 --duration 60 > results.json
+
+concurrency keep-alive connections are driven from a single poll loop, each
+sending the same prebuilt request. With --rate, requests are paced to that
+many a second across all connections. Every request is written out as it
+completes, as a test in the shape `npm run details` prints, so results are
+read back and summarized exactly like the suite's.
+
+By default a request waits for a free connection, so a target that slows
+down is sent fewer requests and the time they would have waited is never
+measured. With --open, requests are due at --rate from the start however
+far behind the target falls, and each is timed from when it was due rather
+than from when a connection got round to it. Requests still waiting for a
+connection when the attack ends count as failed.
+
+With --live PATH, a snapshot of the last second is appended to PATH as a
+line of JSON every second (see live.py). SIGTERM stops the attack early,
+with the results so far written out in full.
+"""
+
+import errno
+import json
+import math
+import optparse
+import select
+import signal
+import socket
+import ssl
+import sys
+import time
+
+try:
+    from urlparse import urlsplit
+except ImportError:
+    from urllib.parse import urlsplit
+
+# requests that get an HTTP status at or above this count as failures
+FAILURE_STATUS = 400
+# at most this many failures are listed by title, the rest are only counted
+MAX_LISTED_FAILURES = 1000
+
+# live snapshots bucket latencies like histogram.py does, so they merge with its histograms
+LIVE_GROWTH = 1.01
+LIVE_MIN = 0.001
+LIVE_INTERVAL = 1.0
+
+_RETRY = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINPROGRESS, errno.EALREADY)
+
+class Request(object):
+    """
+    A request built once and sent as is on every connection.
+    """
+    def __init__(self, url, method='GET', headers=None, body=None):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError('Only http and https URLs can be attacked, not %r' % url)
+
+        self.secure = parts.scheme == 'https'
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.secure else 80)
+        self.head = method == 'HEAD'
+
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        self.title = '%s %s' % (method, path)
+
+        body = (body or '').encode('utf-8') if not isinstance(body, bytes) else body
+        lines = ['%s %s HTTP/1.1' % (method, path), 'Host: %s' % parts.netloc, 'Connection: keep-alive']
+        lines.extend(headers or [])
+        if body:
+            lines.append('Content-Length: %i' % len(body))
+        self.data = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+def _chunked_length(buf, start):
+    """
+    Where a chunked body starting at start ends, or None if it has not all arrived.
+    """
+    pos = start
+    while True:
+        line_end = buf.find(b'\r\n', pos)
+        if line_end < 0:
+            return None
+        size = int(buf[pos:line_end].split(b';')[0], 16)
+        pos = line_end + 2
+        if size == 0:
+            # the trailer, if any, ends with an empty line
+            end = buf.find(b'\r\n\r\n', line_end) if buf[pos:pos + 2] != b'\r\n' else pos - 2
+            return end + 4 - start if end >= 0 else None
+        pos += size + 2
+        if pos > len(buf):
+            return None
+
+class Connection(object):
+    """
+    One keep-alive connection to the target, sending a request at a time.
+    """
+    def __init__(self, engine):
+        self.engine = engine
+        self.sock = None
+        self.reused = False
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def start(self, now, intended=None):
+        self.started = now
+        # when the request was due to go out, which is later than started only in open-loop runs
+        self.intended = now if intended is None else intended
+        self.sent = 0
+        self.buf = b''
+        self.header_end = None
+        self.body_length = None
+        self.chunked = False
+        self.keep_alive = True
+        self.status = None
+
+        if self.sock is not None:
+            self.reused = True
+            self.state = 'sending'
+            return
+
+        self.reused = False
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setblocking(False)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.state = 'connecting'
+        code = self.sock.connect_ex(self.engine.address)
+        if code and code not in _RETRY:
+            raise socket.error(code, 'connect failed')
+
+    def close(self):
+        if self.sock is not None:
+            self.engine.forget(self)
+            self.sock.close()
+            self.sock = None
+
+    def wants(self):
+        """
+        POLLIN or POLLOUT, whichever the connection is waiting for.
+        """
+        if self.state in ('connecting', 'sending', 'handshake-write'):
+            return select.POLLOUT
+        return select.POLLIN
+
+    def ready(self):
+        """
+        Make what progress the socket allows, returns True once the response is in.
+        """
+        if self.state == 'connecting':
+            code = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if code:
+                raise socket.error(code, 'connect failed')
+            if self.engine.request.secure:
+                self.sock = self.engine.context.wrap_socket(self.sock, server_hostname=self.engine.request.host,
+                                                            do_handshake_on_connect=False)
+                self.state = 'handshake-write'
+            else:
+                self.state = 'sending'
+
+        if self.state.startswith('handshake'):
+            try:
+                self.sock.do_handshake()
+            except ssl.SSLWantReadError:
+                self.state = 'handshake-read'
+                return False
+            except ssl.SSLWantWriteError:
+                self.state = 'handshake-write'
+                return False
+            self.state = 'sending'
+
+        if self.state == 'sending':
+            data = self.engine.request_view
+            while self.sent < len(data):
+                try:
+                    self.sent += self.sock.send(data[self.sent:])
+                except ssl.SSLWantWriteError:
+                    return False
+                except socket.error as e:
+                    if e.errno in _RETRY:
+                        return False
+                    raise
+            self.state = 'reading'
+            return False
+
+        while True:
+            try:
+                chunk = self.sock.recv(65536)
+            except (ssl.SSLWantReadError, ssl.SSLWantWriteError):
+                return False
+            except socket.error as e:
+                if e.errno in _RETRY:
+                    return False
+                raise
+            if not chunk:
+                if self.body_length is None and self.header_end is not None and not self.chunked:
+                    # a body that runs until the server hangs up
+                    self.keep_alive = False
+                    return True
+                raise socket.error(errno.ECONNRESET, 'closed by the target')
+            self.buf += chunk
+            if self._complete():
+                return True
+
+    def _complete(self):
+        if self.header_end is None:
+            end = self.buf.find(b'\r\n\r\n')
+            if end < 0:
+                return False
+            self.header_end = end + 4
+            lines = self.buf[:end].decode('latin-1').split('\r\n')
+            version, self.status = lines[0].split(' ', 2)[:2]
+            self.status = int(self.status)
+            headers = dict((name.strip().lower(), value.strip().lower())
+                           for name, _, value in (line.partition(':') for line in lines[1:]))
+            self.keep_alive = headers.get('connection', 'keep-alive' if version == 'HTTP/1.1' else 'close') != 'close'
+            if self.engine.request.head or self.status in (204, 304) or 100 <= self.status < 200:
+                self.body_length = 0
+            elif 'chunked' in headers.get('transfer-encoding', ''):
+                self.chunked = True
+            elif 'content-length' in headers:
+                self.body_length = int(headers['content-length'])
+            # the body is only counted, not kept
+            self.buf = self.buf[self.header_end:]
+            self.header_end = 0
+
+        if self.chunked:
+            length = _chunked_length(self.buf, 0)
+            return length is not None
+        if self.body_length is not None:
+            return len(self.buf) >= self.body_length
+        return False
+
+class Engine(object):
+    """
+    Drives concurrency connections against the target until duration seconds
+    have passed or requests requests have been made, writing a test per
+    request to out, and live snapshots to live when given.
+    """
+    def __init__(self, request, out, concurrency=10, rate=None, duration=None, requests=None, timeout=30, live=None, open_loop=False):
+        self.request = request
+        self.request_view = memoryview(request.data)
+        self.out = out
+        self.concurrency = concurrency
+        self.rate = rate
+        self.duration = duration
+        self.requests = requests
+        self.timeout = timeout
+        self.address = socket.getaddrinfo(request.host, request.port, socket.AF_INET, socket.SOCK_STREAM)[0][4]
+        self.context = ssl.create_default_context() if request.secure else None
+        self.poller = select.poll()
+        self.by_fd = {}
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.failures = []
+        self.first = True
+        self.live = live
+        self.open_loop = open_loop
+        self.stop_at = None
+        self._reset_snapshot()
+
+    def stop(self):
+        """
+        Start no more requests, finishing those in flight.
+        """
+        self.stop_at = time.time()
+
+    def _reset_snapshot(self):
+        self.snapshot = {'tests': 0, 'failures': 0, 'buckets': {}, 'total': 0.0, 'min': None, 'max': None}
+
+    def _snapshot_test(self, duration, failed):
+        snapshot = self.snapshot
+        index = 0 if duration <= LIVE_MIN else int(math.log(duration / LIVE_MIN) / math.log(LIVE_GROWTH)) + 1
+        snapshot['buckets'][index] = snapshot['buckets'].get(index, 0) + 1
+        snapshot['tests'] += 1
+        snapshot['failures'] += 1 if failed else 0
+        snapshot['total'] += duration
+        snapshot['min'] = duration if snapshot['min'] is None else min(snapshot['min'], duration)
+        snapshot['max'] = duration if snapshot['max'] is None else max(snapshot['max'], duration)
+
+    def _write_snapshot(self, now):
+        snapshot = self.snapshot
+        line = {
+            'time': now,
+            'tests': snapshot['tests'],
+            'failures': snapshot['failures'],
+            'latency': {'buckets': snapshot['buckets'], 'count': snapshot['tests'], 'total': snapshot['total'],
+                        'min': snapshot['min'], 'max': snapshot['max']},
+        }
+        self.live.write(json.dumps(line, separators=(',', ':')) + '\n')
+        self.live.flush()
+        self._reset_snapshot()
+
+    def forget(self, conn):
+        fd = conn.sock.fileno()
+        if self.by_fd.pop(fd, None) is not None:
+            self.poller.unregister(fd)
+
+    def _watch(self, conn):
+        fd = conn.fileno()
+        if fd in self.by_fd:
+            self.poller.modify(fd, conn.wants())
+        else:
+            self.by_fd[fd] = conn
+            self.poller.register(fd, conn.wants())
+
+    def _write_test(self, title, started, finished, error=None):
+        test = '{"title":%s,"duration":%.3f,"end":%.3f' % (self.title_json, (finished - started) * 1000, finished * 1000)
+        if error:
+            test += ',"err":{"message":%s}' % json.dumps(error)
+        self.out.write((test + '}') if self.first else (',' + test + '}'))
+        self.first = False
+
+    def _finish(self, conn, now, error=None):
+        if error is None and conn.status >= FAILURE_STATUS:
+            error = 'HTTP %i' % conn.status
+        # open-loop requests are timed from when they were due, so waiting for a connection counts
+        self._record(conn.intended if self.open_loop else conn.started, now, error)
+
+    def _record(self, started, now, error=None):
+        self.completed += 1
+        if error:
+            self.failed += 1
+            if len(self.failures) < MAX_LISTED_FAILURES:
+                self.failures.append({'title': self.request.title, 'duration': (now - started) * 1000, 'err': {'message': error}})
+        self._write_test(self.request.title, started, now, error)
+        if self.live is not None:
+            self._snapshot_test((now - started) * 1000, bool(error))
+
+    def _more(self, now):
+        """
+        Whether another request may still go out now.
+        """
+        if self.requests is not None and self.started >= self.requests:
+            return False
+        # once the attack is over only requests in flight are waited for, open-loop ones still due are missed
+        return self.stop_at is None or now < self.stop_at
+
+    def _missed(self, at):
+        """
+        Whether an open-loop request due at at was due before the end and never went out.
+        """
+        return (self.open_loop and self.stop_at is not None and at < self.stop_at and
+                (self.requests is None or self.started < self.requests))
+
+    def _next_start(self, now):
+        """
+        When the next request may go out, holding to the rate if there is one.
+        """
+        if not self.rate:
+            return now
+        # open-loop requests keep to the schedule however far behind it the target is
+        slot = self.next_slot if self.open_loop else max(self.next_slot, now)
+        self.next_slot = slot + 1.0 / self.rate
+        return slot
+
+    def _launch(self, conn, now, at=None):
+        try:
+            conn.start(now, at)
+            self._watch(conn)
+        except socket.error as e:
+            conn.close()
+            self._finish(conn, time.time(), str(e))
+            return False
+        self.started += 1
+        return True
+
+    def run(self):
+        begun = time.time()
+        if self.stop_at is None:
+            self.stop_at = begun + self.duration if self.duration else None
+        self.next_slot = begun
+        self.title_json = json.dumps(self.request.title)
+
+        self.out.write('[{"tests":[')
+
+        waiting = [(self._next_start(begun), Connection(self)) for _ in range(self.concurrency)]
+        active = set()
+        last_sweep = begun
+        last_snapshot = begun
+
+        while waiting or active:
+            now = time.time()
+
+            # send off the connections whose turn has come
+            still_waiting = []
+            for at, conn in waiting:
+                if at > now:
+                    still_waiting.append((at, conn))
+                elif self._more(now) and self._launch(conn, now, at):
+                    active.add(conn)
+                elif self._more(now):
+                    still_waiting.append((self._next_start(now), conn))
+                else:
+                    if self._missed(at):
+                        self._record(at, now, 'never sent, every connection was busy')
+                    conn.close()
+            waiting = still_waiting
+
+            wait = min([at for at, conn in waiting] or [now + 0.1]) - now
+            try:
+                events = self.poller.poll(int(max(0, min(wait, 0.1)) * 1000)) if active else []
+            except (select.error, OSError) as e:
+                # a signal, such as the SIGTERM that stops the attack
+                if e.args[0] != errno.EINTR:
+                    raise
+                events = []
+            if not active and waiting:
+                time.sleep(max(0, min(wait, 0.1)))
+
+            for fd, event in events:
+                conn = self.by_fd.get(fd)
+                if conn is None:
+                    continue
+                now = time.time()
+                try:
+                    done = conn.ready()
+                except (socket.error, ssl.SSLError, ValueError) as e:
+                    resend = conn.reused and not conn.buf and conn.header_end is None
+                    conn.close()
+                    active.discard(conn)
+                    if resend:
+                        # the target dropped an idle keep-alive connection, try again on a fresh one
+                        self.started -= 1
+                        waiting.append((conn.intended, conn))
+                    else:
+                        self._finish(conn, now, str(e) or e.__class__.__name__)
+                        waiting.append((self._next_start(now), conn))
+                    continue
+
+                if done:
+                    self._finish(conn, now)
+                    active.discard(conn)
+                    if not conn.keep_alive:
+                        conn.close()
+                    waiting.append((self._next_start(now), conn))
+                elif conn.sock is not None:
+                    self._watch(conn)
+
+            # give up on requests that are taking too long
+            now = time.time()
+            if now - last_sweep > 0.1:
+                last_sweep = now
+                for conn in [c for c in active if now - c.started > self.timeout]:
+                    conn.close()
+                    active.discard(conn)
+                    self._finish(conn, now, 'timed out after %i seconds' % self.timeout)
+                    waiting.append((self._next_start(now), conn))
+
+            if self.live is not None and now - last_snapshot >= LIVE_INTERVAL:
+                last_snapshot = now
+                self._write_snapshot(now)
+
+            # done once nothing more may start and nothing is in flight
+            now = time.time()
+            if not active and not (waiting and self._more(now)):
+                break
+
+        finished = time.time()
+        for at, conn in waiting:
+            if self._missed(at):
+                self._record(at, finished, 'never sent, every connection was busy')
+            conn.close()
+        # and the rest of the schedule, which no connection got round to
+        while self.rate and self._missed(self.next_slot):
+            self._record(self._next_start(finished), finished, 'never sent, every connection was busy')
+        if self.live is not None:
+            self._write_snapshot(finished)
+        stats = {
+            'tests': self.completed,
+            'passes': self.completed - self.failed,
+            'failures': self.failed,
+            'pending': 0,
+            'duration': (finished - begun) * 1000,
+            'start': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(begun)) + '.%03iZ' % (begun % 1 * 1000),
+        }
+        self.out.write('],"failures":%s,"stats":%s}]\n' % (json.dumps(self.failures), json.dumps(stats)))
+        self.out.flush()
+
+        return stats
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage="python beegees-engine.py URL [options]")
+    parser.add_option('-c', '--concurrency', type='int', default=10,
+                      help="Connections kept open to the target (default: 10).")
+    parser.add_option('-r', '--rate', type='float', default=None,
+                      help="Requests a second across all connections (default: as fast as the target answers).")
+    parser.add_option('-d', '--duration', type='float', default=None,
+                      help="Seconds to keep attacking for.")
+    parser.add_option('-n', '--requests', type='int', default=None,
+                      help="Requests to make in all.")
+    parser.add_option('-m', '--method', default='GET',
+                      help="HTTP method (default: GET).")
+    parser.add_option('-H', '--header', action='append', dest='headers', default=[],
+                      help="A header to send, as 'Name: value'. Can be given more than once.")
+    parser.add_option('-b', '--body', default=None,
+                      help="A request body to send.")
+    parser.add_option('-t', '--timeout', type='float', default=30,
+                      help="Seconds before a request is given up on (default: 30).")
+    parser.add_option('-l', '--live', metavar='PATH', default=None,
+                      help="Append a snapshot of the last second to PATH every second.")
+    parser.add_option('-o', '--open', action='store_true', dest='open_loop', default=False,
+                      help="With --rate, send requests when they are due however far behind the target falls, timing each from then.")
+    (options, args) = parser.parse_args(argv)
+
+    if len(args) != 1:
+        parser.error('Please give the URL to attack.')
+    if options.duration is None and options.requests is None:
+        parser.error('Please say how long to attack for with --duration or --requests.')
+    if options.open_loop and not options.rate:
+        parser.error('--open keeps to a schedule, please give its --rate.')
+
+    request = Request(args[0], options.method, options.headers, options.body)
+    live = open(options.live, 'a') if options.live else None
+    engine = Engine(request, sys.stdout, options.concurrency, options.rate, options.duration, options.requests, options.timeout, live,
+                    options.open_loop)
+    signal.signal(signal.SIGTERM, lambda signum, frame: engine.stop())
+    engine.run()
+
+if __name__ == '__main__':
+    main()
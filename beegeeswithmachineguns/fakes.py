@@ -0,0 +1,485 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+"""
+In-process stand-ins for EC2 and SSH, used to exercise the swarm offline.
+
+    conn = FakeEC2Connection(boot_time=(5, 30), api_latency=0.05)
+    reservation = conn.run_instances('ami-11e0597a', min_count=200, max_count=200)
+    beegees._wait_for_instances(conn, reservation.instances)
+    print conn.calls['get_all_instances'], conn.api_time
+
+    ssh = FakeSSH(tests=1000, run_time=0.5)
+    beegees._ssh_sessions = beegees.SSHSessionPool(connect=ssh.connect)
+"""
+
+from collections import Counter
+import datetime
+import errno
+import itertools
+import json
+import os
+import random
+import re
+import socket
+import StringIO
+import threading
+import time
+import zlib
+
+import boto.exception
+
+class FakeInstance(object):
+    """
+    An instance that is pending until its boot time has passed.
+    """
+    def __init__(self, conn, instance_id, boot_time, placement='us-east-1d'):
+        self.connection = conn
+        self.id = instance_id
+        self.placement = placement
+        self.launch_time = time.time()
+        self.boot_time = boot_time
+        self.public_dns_name = ''
+        self.private_dns_name = 'ip-10-0-%i-%i.ec2.internal' % (int(instance_id[-4:], 16) / 256, int(instance_id[-4:], 16) % 256)
+        self.private_ip_address = '10.0.%i.%i' % (int(instance_id[-4:], 16) / 256, int(instance_id[-4:], 16) % 256)
+        self.terminated = False
+
+    @property
+    def state(self):
+        if self.terminated:
+            return 'terminated'
+        if time.time() - self.launch_time >= self.boot_time:
+            return 'running'
+        return 'pending'
+
+    def _update(self, updated):
+        self.__dict__.update(updated.__dict__)
+
+    def update(self, validate=False, dry_run=False):
+        self.connection._call('describe_instances')
+        return self.state
+
+class FakeSpotStatus(object):
+    def __init__(self, code):
+        self.code = code
+
+class FakeSpotRequest(object):
+    """
+    A spot request that is fulfilled once its fulfil time has passed.
+
+    A fulfil time of None leaves the request open forever.
+    """
+    def __init__(self, conn, request_id, fulfil_time):
+        self.connection = conn
+        self.id = request_id
+        self.created = time.time()
+        self.fulfil_time = fulfil_time
+        self.cancelled = False
+        self.instance_id = None
+        self.state = 'open'
+        self.status = FakeSpotStatus('pending-evaluation')
+
+    def refresh(self):
+        if self.instance_id is None and not self.cancelled and self.fulfil_time is not None \
+                and time.time() - self.created >= self.fulfil_time:
+            self.instance_id = self.connection._launch(1)[0].id
+        if self.instance_id:
+            self.state, self.status = 'active', FakeSpotStatus('fulfilled')
+        elif self.cancelled:
+            self.state, self.status = 'cancelled', FakeSpotStatus('request-canceled-and-instance-running')
+        else:
+            self.state, self.status = 'open', FakeSpotStatus('capacity-not-available')
+        return self
+
+class FakeReservation(object):
+    def __init__(self, instances):
+        self.instances = instances
+
+class FakeEC2Connection(object):
+    """
+    Mimics the subset of boto.ec2.connection.EC2Connection the swarm uses.
+
+    boot_time is a number of seconds or a (min, max) range to draw from (it
+    also decides how long spot requests take to be fulfilled), api_latency is added to every call. Calls are counted in self.calls and
+    the time spent in them accumulated in self.api_time.
+
+    throttle, if given, is how many calls a second EC2 lets through before
+    answering RequestLimitExceeded. Like boto, throttled calls are retried
+    after a randomized exponential backoff, num_retries times before the
+    error is raised. Throttled attempts are counted in self.calls['throttled'].
+
+    capacity, if given, is how many more instances run_instances will start
+    per (zone, instance type); asking for more than are left answers
+    InsufficientInstanceCapacity. Pairs it does not name have no limit.
+
+    Like EC2, which is only eventually consistent, get_all_instances answers
+    InvalidInstanceID.NotFound for an instance launched less than
+    visible_after seconds ago.
+    """
+    def __init__(self, boot_time=0, api_latency=0, throttle=None, num_retries=5, capacity=None, visible_after=0):
+        self.boot_time = boot_time
+        self.visible_after = visible_after
+        self.capacity = capacity if capacity is not None else {}
+        self.api_latency = api_latency
+        self.throttle = throttle
+        self.num_retries = num_retries
+        self.calls = Counter()
+        self.api_time = 0.0
+        self.instances = {}
+        self.spot_requests = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        # a token bucket holding up to a second's worth of calls
+        self._tokens = throttle
+        self._refilled = time.time()
+
+    def _admit(self):
+        if not self.throttle:
+            return True
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self.throttle, self._tokens + (now - self._refilled) * self.throttle)
+            self._refilled = now
+            if self._tokens < 1:
+                self.calls['throttled'] += 1
+                return False
+            self._tokens -= 1
+            return True
+
+    def _call(self, name):
+        start = time.time()
+        with self._lock:
+            self.calls[name] += 1
+        try:
+            for attempt in range(self.num_retries + 1):
+                if self.api_latency:
+                    time.sleep(self.api_latency)
+                if self._admit():
+                    return
+                if attempt < self.num_retries:
+                    time.sleep(random.random() * (2 ** attempt))
+            raise boto.exception.EC2ResponseError(503, 'Service Unavailable',
+                '<Response><Errors><Error><Code>RequestLimitExceeded</Code>'
+                '<Message>Request limit exceeded.</Message></Error></Errors></Response>')
+        finally:
+            with self._lock:
+                self.api_time += time.time() - start
+
+    def _boot_time(self):
+        if isinstance(self.boot_time, tuple):
+            return random.uniform(*self.boot_time)
+        return self.boot_time
+
+    def _launch(self, count, placement=None):
+        instances = []
+        for i in range(count):
+            instance = FakeInstance(self, 'i-%08x' % next(self._ids), self._boot_time(), placement or 'us-east-1d')
+            self.instances[instance.id] = instance
+            instances.append(instance)
+        return instances
+
+    def run_instances(self, image_id, min_count=1, max_count=1, **kwargs):
+        self._call('run_instances')
+        key = (kwargs.get('placement'), kwargs.get('instance_type'))
+        with self._lock:
+            if key in self.capacity:
+                if self.capacity[key] < min_count:
+                    raise boto.exception.EC2ResponseError(500, 'Internal Server Error',
+                        '<Response><Errors><Error><Code>InsufficientInstanceCapacity</Code>'
+                        '<Message>We currently do not have sufficient capacity in the Availability Zone you requested.</Message>'
+                        '</Error></Errors></Response>')
+                self.capacity[key] -= max_count
+        return FakeReservation(self._launch(max_count, kwargs.get('placement')))
+
+    def get_all_instances(self, instance_ids=None):
+        self._call('get_all_instances')
+        ids = instance_ids if instance_ids is not None else self.instances.keys()
+        if any(time.time() - self.instances[instance_id].launch_time < self.visible_after for instance_id in ids):
+            raise boto.exception.EC2ResponseError(400, 'Bad Request',
+                '<Response><Errors><Error><Code>InvalidInstanceID.NotFound</Code>'
+                '<Message>The instance ID does not exist</Message></Error></Errors></Response>')
+        # the real API returns fresh objects, so hand out copies
+        reservations = []
+        for instance_id in ids:
+            copy = FakeInstance.__new__(FakeInstance)
+            copy.__dict__.update(self.instances[instance_id].__dict__)
+            reservations.append(FakeReservation([copy]))
+        return reservations
+
+    def get_all_security_groups(self):
+        self._call('get_all_security_groups')
+        return []
+
+    def create_tags(self, resource_ids, tags):
+        self._call('create_tags')
+        return True
+
+    def terminate_instances(self, instance_ids=None):
+        self._call('terminate_instances')
+        for instance_id in instance_ids:
+            self.instances[instance_id].terminated = True
+        return list(instance_ids)
+
+    def request_spot_instances(self, price, image_id, count=1, **kwargs):
+        self._call('request_spot_instances')
+        requests = []
+        for i in range(count):
+            request = FakeSpotRequest(self, 'sir-%08x' % next(self._ids), self._boot_time())
+            self.spot_requests[request.id] = request
+            requests.append(request)
+        return requests
+
+    def get_all_spot_instance_requests(self, request_ids=None):
+        self._call('get_all_spot_instance_requests')
+        ids = request_ids if request_ids is not None else self.spot_requests.keys()
+        return [self.spot_requests[request_id].refresh() for request_id in ids]
+
+    def cancel_spot_instance_requests(self, request_ids):
+        self._call('cancel_spot_instance_requests')
+        for request_id in request_ids:
+            self.spot_requests[request_id].cancelled = True
+        return request_ids
+
+def synthetic_details(threads=1, tests=100, failures=0, title_size=40, start=None):
+    """
+    `npm run details` output for threads mocha runs of tests tests each,
+    failures of which failed. Titles are padded to title_size characters to
+    set the size of the document.
+    """
+    moment = datetime.datetime.utcfromtimestamp(start or time.time())
+    started = '%s.%03iZ' % (moment.strftime('%Y-%m-%dT%H:%M:%S'), moment.microsecond / 1000)
+    records = []
+    for thread in range(threads):
+        listed = []
+        for i in range(tests):
+            test = {'title': ('test %i of thread %i ' % (i, thread)).ljust(title_size, '.'),
+                    'file': 'test/scenario-%i.js' % (i % 10),
+                    'duration': random.randint(5, 500)}
+            if i < failures:
+                test['err'] = {'message': 'expected 200, got 503'}
+            listed.append(test)
+        records.append({
+            'stats': {'tests': tests, 'passes': tests - failures, 'failures': failures,
+                      'duration': sum(test['duration'] for test in listed),
+                      'start': started},
+            'tests': listed,
+            'passes': listed[failures:],
+            'failures': listed[:failures],
+        })
+    return '> checkin-test@1.0.0 details\n> mocha-details\n\n' + json.dumps(records)
+
+def large_details(size, tests=5000, failures=0, title_size=40):
+    """
+    `npm run details` output of at least size bytes, the same thread of tests
+    tests repeated, which is much quicker to build than that many distinct ones.
+    """
+    document = synthetic_details(1, tests, failures, title_size)
+    start = document.index('[')
+    record = document[start + 1:-1]
+    return document[:start] + '[' + ','.join([record] * (size // len(record) + 1)) + ']'
+
+def gzipped(data, level=1):
+    """
+    data as `gzip -LEVEL` would print it.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+class FakeChannel(object):
+    """
+    Mimics the part of paramiko.Channel the swarm reads from.
+
+    What a command prints is decided by FakeSSH.respond.
+    """
+    def __init__(self, ssh, host):
+        self.ssh = ssh
+        self.host = host
+        self.stdout = StringIO.StringIO('')
+        self.ready_at = 0
+        self.timeout = None
+        self.closed = False
+
+    def exec_command(self, command):
+        self.ssh._count('exec_command')
+        self.ssh._log(self.host, command)
+        self.command = command
+        output, delay = self.ssh.respond(command, self.host)
+        # like the real thing the command runs in the background, the output arrives once it is done
+        self.ready_at = time.time() + delay
+        self.stdout = StringIO.StringIO(output)
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def _wait(self):
+        remaining = self.ready_at - time.time()
+        if remaining <= 0:
+            return
+        if self.timeout is not None and remaining > self.timeout:
+            time.sleep(self.timeout)
+            raise socket.timeout()
+        time.sleep(remaining)
+
+    def recv(self, size):
+        self._wait()
+        return self.stdout.read(size)
+
+    def sendall(self, data):
+        # the answer goes after whatever has not been read yet
+        position = self.stdout.tell()
+        self.stdout.seek(0, os.SEEK_END)
+        self.stdout.write(self.ssh.answer(self.command, data))
+        self.stdout.seek(position)
+
+    def recv_ready(self):
+        return time.time() >= self.ready_at
+
+    def recv_stderr_ready(self):
+        return False
+
+    def recv_stderr(self, size):
+        return ''
+
+    def recv_exit_status(self):
+        return 0
+
+    def makefile(self, mode='r', bufsize=-1):
+        self._wait()
+        return StringIO.StringIO(self.stdout.read())
+
+    def makefile_stderr(self, mode='r', bufsize=-1):
+        return StringIO.StringIO('')
+
+    def close(self):
+        self.closed = True
+
+class FakeTransport(object):
+    def __init__(self, ssh, host):
+        self.ssh = ssh
+        self.host = host
+        self.active = True
+
+    def is_active(self):
+        return self.active
+
+    def set_keepalive(self, interval):
+        pass
+
+    def open_session(self):
+        self.ssh._count('open_session')
+        return FakeChannel(self.ssh, self.host)
+
+class FakeSSHClient(object):
+    def __init__(self, ssh, host):
+        self.transport = FakeTransport(ssh, host)
+
+    def get_transport(self):
+        return self.transport
+
+    def close(self):
+        self.transport.active = False
+
+class FakeSSH(object):
+    """
+    Stands in for SSH to every beegee at once; pass its connect to beegees.SSHSessionPool.
+
+    Handshakes take handshake_time seconds, the attack run_time and an init
+    init_time. `npm run details` answers with synthetic_details for threads
+    runs of tests tests, the same document for every beegee. The beegees'
+    clocks are clock_offset seconds ahead of this one, and the hosts in
+    unreachable cannot be connected to. Connections, channels and commands
+    are counted in self.calls, and every command is kept in self.commands
+    as (host, command). The bundle marker each host holds, as init --bundle
+    writes it, is kept in self.bundles.
+    """
+    def __init__(self, threads=1, tests=100, failures=0, title_size=40,
+                 handshake_time=0, run_time=0, init_time=0, clock_offset=0, unreachable=()):
+        self.details = synthetic_details(threads, tests, failures, title_size)
+        self.gzipped_details = gzipped(self.details)
+        self.handshake_time = handshake_time
+        self.run_time = run_time
+        self.init_time = init_time
+        self.clock_offset = clock_offset
+        self.unreachable = set(unreachable)
+        self.bundles = {}
+        self.calls = Counter()
+        self.commands = []
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            self.calls[name] += 1
+
+    def _log(self, host, command):
+        with self._lock:
+            self.commands.append((host, command))
+
+    def connect(self, host, username, key_name, bee=None):
+        self._count('connect')
+        if host in self.unreachable:
+            raise socket.error(errno.EHOSTUNREACH, 'No route to host')
+        if self.handshake_time:
+            time.sleep(self.handshake_time)
+        return FakeSSHClient(self, host)
+
+    def respond(self, command, host=None):
+        """
+        Returns what command prints on host and how long it takes.
+        """
+        if 'npm run details' in command:
+            return self.gzipped_details if '| gzip' in command else self.details, 0
+        if 'npm run attack' in command:
+            match = re.search(r'echo (\S+) \$\(date', command)
+            marker = '%s %f\n' % (match.group(1), time.time() + self.clock_offset) if match else ''
+            return marker + 'attack complete\n', self.run_time
+        if 'git ls-remote' in command:
+            return '%s\tHEAD\n' % ('1' * 40), 0
+        if 'cat checkin-test/.beegees-bundle' in command:
+            return self.bundles.get(host, ''), 0
+        if 'tar czf' in command:
+            # building the bundle, which ends with its checksum
+            self.bundles[host] = '%s %s\n' % (re.search(r'git checkout -q (\S+)', command).group(1), '2' * 64)
+            return 'added 312 packages\n%s\n' % ('2' * 64), self.init_time
+        if 'curl -sf' in command:
+            self.bundles[host] = '%s %s\n' % re.search(r'echo (\S+) (\S+) > checkin-test/', command).groups()
+            return 'fetched\n', 0
+        if command.startswith('mkdir -p beegees-serve'):
+            # linking the bundle in fails where there is none
+            return ('serving\n' if host in self.bundles else ''), 0
+        if 'git clone' in command:
+            self.bundles.pop(host, None)
+            return 'added 312 packages\n', self.init_time
+        if command.startswith('cd checkin-test && find test'):
+            return '\n'.join('test/scenario-%i.js' % i for i in range(10)) + '\n', 0
+        return '', 0
+
+    def answer(self, command, data):
+        """
+        Returns what command prints when data is written to it.
+        """
+        if 'while read line' in command:
+            return '%f\n' % (time.time() + self.clock_offset) * data.count('\n')
+        return ''
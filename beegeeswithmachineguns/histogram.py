@@ -0,0 +1,118 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import math
+
+# Every bucket is 1% wider than the one before it, so any recorded value is
+# reported within 1% of the truth while a range of 1 microsecond to several
+# hours needs fewer than 2500 buckets.
+GROWTH = 1.01
+MIN_VALUE = 0.001
+
+_LOG_GROWTH = math.log(GROWTH)
+
+class LatencyHistogram(object):
+    """
+    Compact, mergeable histogram of latencies in milliseconds.
+
+    Memory depends on the spread of the values, not on how many are recorded,
+    and histograms from different beegees can be added together.
+    """
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        if value <= MIN_VALUE:
+            return 0
+        return int(math.log(value / MIN_VALUE) / _LOG_GROWTH) + 1
+
+    def _value(self, index):
+        if index == 0:
+            return MIN_VALUE
+        # geometric middle of the bucket
+        return MIN_VALUE * GROWTH ** (index - 0.5)
+
+    def record(self, value, count=1):
+        value = float(value)
+        index = self._index(value)
+        self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += count
+        self.total += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        for index, count in other.buckets.iteritems():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.count:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def percentile(self, percent):
+        """
+        The value below which percent of the recordings fall, or None if empty.
+        """
+        if not self.count:
+            return None
+
+        rank = max(1, int(math.ceil(self.count * percent / 100.0)))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                # never report beyond what was actually seen
+                return min(max(self._value(index), self.min), self.max)
+
+        return self.max
+
+    def to_dict(self):
+        return {
+            'buckets': dict((str(index), count) for index, count in self.buckets.iteritems()),
+            'count': self.count,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls()
+        histogram.buckets = dict((int(index), count) for index, count in data['buckets'].iteritems())
+        histogram.count = data['count']
+        histogram.total = data['total']
+        histogram.min = data['min']
+        histogram.max = data['max']
+        return histogram
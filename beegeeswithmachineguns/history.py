@@ -0,0 +1,249 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+"""
+Every attack's results, kept in a SQLite database so runs can be compared.
+
+A run is the swarm's merged summary with its latency histogram, a row per
+beegee that came back, and its failures counted by test title. Runs are
+indexed by target and by revision of checkin-test, and their totals and
+percentiles are columns of their own, so comparing two runs never goes
+back to the raw results.
+"""
+
+import json
+import os
+import sqlite3
+import time
+
+HISTORY_FILENAME = os.path.expanduser('~/.beegees-history.sqlite')
+
+# the latency percentiles kept for every run, and how they are labelled
+PERCENTILES = (('p50', 50), ('p90', 90), ('p99', 99), ('p999', 99.9))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    target TEXT NOT NULL,
+    revision TEXT,
+    label TEXT,
+    called_off TEXT,
+    bees INTEGER NOT NULL,
+    tests INTEGER NOT NULL,
+    passes INTEGER NOT NULL,
+    failures INTEGER NOT NULL,
+    elapsed REAL NOT NULL,
+    throughput REAL NOT NULL,
+    mean REAL,
+    p50 REAL,
+    p90 REAL,
+    p99 REAL,
+    p999 REAL,
+    max REAL,
+    latency TEXT NOT NULL,
+    bytes INTEGER,
+    raw_bytes INTEGER
+);
+CREATE INDEX IF NOT EXISTS runs_by_target ON runs (target, id);
+CREATE INDEX IF NOT EXISTS runs_by_revision ON runs (revision, id);
+CREATE TABLE IF NOT EXISTS bees (
+    run INTEGER NOT NULL REFERENCES runs (id),
+    bee INTEGER NOT NULL,
+    tests INTEGER NOT NULL,
+    passes INTEGER NOT NULL,
+    failures INTEGER NOT NULL,
+    elapsed REAL NOT NULL,
+    run_time REAL NOT NULL,
+    p50 REAL,
+    p99 REAL,
+    bytes INTEGER,
+    raw_bytes INTEGER
+);
+CREATE INDEX IF NOT EXISTS bees_by_run ON bees (run);
+CREATE TABLE IF NOT EXISTS failures (
+    run INTEGER NOT NULL REFERENCES runs (id),
+    title TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (run, title)
+);
+"""
+
+# columns added since the history was first written, which older histories gain when opened
+_ADDED_COLUMNS = [
+    ('runs', 'bytes', 'INTEGER'),
+    ('runs', 'raw_bytes', 'INTEGER'),
+    ('bees', 'bytes', 'INTEGER'),
+    ('bees', 'raw_bytes', 'INTEGER'),
+]
+
+# what is compared between two runs, and whether a higher value is better
+COMPARED = [('tests', True), ('failure_rate', False), ('throughput', True), ('mean', False)] + \
+           [(name, False) for name, percent in PERCENTILES] + [('max', False)]
+
+def connect(path=None):
+    """
+    Open the history, creating it if need be.
+    """
+    db = sqlite3.connect(path or HISTORY_FILENAME)
+    db.row_factory = sqlite3.Row
+    db.executescript(_SCHEMA)
+    for table, column, kind in _ADDED_COLUMNS:
+        if column not in [row['name'] for row in db.execute('PRAGMA table_info(%s)' % table)]:
+            db.execute('ALTER TABLE %s ADD COLUMN %s %s' % (table, column, kind))
+    return db
+
+def summarize(results):
+    """
+    The totals and latency percentiles of a SwarmResults, as a run keeps them.
+    """
+    summary = {
+        'bees': results.bees,
+        'tests': results.tests,
+        'passes': results.passes,
+        'failures': results.failures,
+        'elapsed': results.elapsed,
+        'throughput': results.throughput(),
+        'mean': results.latency.mean(),
+        'max': results.latency.max,
+    }
+    for name, percent in PERCENTILES:
+        summary[name] = results.latency.percentile(percent)
+    return summary
+
+def record(db, swarm, target, revision=None, label=None, called_off=None, started=None):
+    """
+    Add a run to the history and return its id.
+    """
+    summary = summarize(swarm)
+
+    failures = dict((title, count) for title, (count, duration) in swarm.failed_tests.iteritems())
+
+    with db:
+        cursor = db.execute(
+            'INSERT INTO runs (started, target, revision, label, called_off, bees, tests, passes, failures, elapsed,'
+            ' throughput, mean, p50, p90, p99, p999, max, latency, bytes, raw_bytes)'
+            ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (started or time.time(), target, revision, label, called_off, summary['bees'], summary['tests'], summary['passes'],
+             summary['failures'], summary['elapsed'], summary['throughput'], summary['mean'], summary['p50'], summary['p90'],
+             summary['p99'], summary['p999'], summary['max'], json.dumps(swarm.latency.to_dict()),
+             swarm.transfer_bytes, swarm.detail_bytes))
+        run = cursor.lastrowid
+
+        db.executemany('INSERT INTO bees (run, bee, tests, passes, failures, elapsed, run_time, p50, p99, bytes, raw_bytes)'
+                       ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                       [(run, bee['bee'], bee['tests'], bee['passes'], bee['failures'], bee['elapsed'], bee['run_time'], bee['p50'], bee['p99'],
+                         bee.get('bytes'), bee.get('raw_bytes'))
+                        for bee in swarm.per_bee])
+        db.executemany('INSERT INTO failures (run, title, count) VALUES (?, ?, ?)',
+                       [(run, title, count) for title, count in failures.iteritems()])
+
+    return run
+
+def get_run(db, run):
+    return db.execute('SELECT * FROM runs WHERE id = ?', (run,)).fetchone()
+
+def latest(db, target=None, before=None):
+    """
+    The id of the latest run, of target if given, before the run before if given. None if there is none.
+    """
+    query = 'SELECT id FROM runs WHERE 1'
+    args = []
+    if target is not None:
+        query += ' AND target = ?'
+        args.append(target)
+    if before is not None:
+        query += ' AND id < ?'
+        args.append(before)
+    row = db.execute(query + ' ORDER BY id DESC LIMIT 1', args).fetchone()
+    return row['id'] if row else None
+
+def list_runs(db, limit=20, target=None):
+    """
+    The latest runs, newest first.
+    """
+    if target is None:
+        return db.execute('SELECT * FROM runs ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+    return db.execute('SELECT * FROM runs WHERE target = ? ORDER BY id DESC LIMIT ?', (target, limit)).fetchall()
+
+def _failures(db, run):
+    return dict((row['title'], row['count']) for row in db.execute('SELECT title, count FROM failures WHERE run = ?', (run,)))
+
+def _metrics(row):
+    metrics = dict((name, row[name]) for name in ('tests', 'throughput', 'mean', 'max'))
+    metrics['failure_rate'] = float(row['failures']) / row['tests'] if row['tests'] else 0.0
+    for name, percent in PERCENTILES:
+        metrics[name] = row[name]
+    return metrics
+
+def compare(db, first, second):
+    """
+    How run second differs from run first.
+
+    Returns a dict with both runs, a (name, first value, second value) triple
+    per compared metric, and the failures new in the second run and those
+    it no longer has, as (title, count) pairs.
+    """
+    runs = [get_run(db, run) for run in (first, second)]
+    for run, row in zip((first, second), runs):
+        if row is None:
+            raise KeyError('There is no run %s in the history.' % run)
+
+    before, after = [_metrics(row) for row in runs]
+    failed_before, failed_after = [_failures(db, run) for run in (first, second)]
+
+    return {
+        'first': runs[0],
+        'second': runs[1],
+        'metrics': [(name, before[name], after[name]) for name, higher_is_better in COMPARED],
+        'new_failures': sorted((title, count) for title, count in failed_after.iteritems() if title not in failed_before),
+        'fixed_failures': sorted((title, count) for title, count in failed_before.iteritems() if title not in failed_after),
+    }
+
+def find_regressions(comparison, tolerance=0.1):
+    """
+    Describe each way the second run of a comparison is worse than the first
+    by more than tolerance (a fraction). The failure rate may grow by
+    tolerance percentage points, and any new failing test is a regression.
+    """
+    regressions = []
+    better = dict(COMPARED)
+
+    for name, before, after in comparison['metrics']:
+        if before is None or after is None or name == 'tests':
+            continue
+        if name == 'failure_rate':
+            if after > before + tolerance / 100.0:
+                regressions.append('the failure rate went from %.2f%% to %.2f%%' % (before * 100, after * 100))
+        elif better[name] and after < before * (1 - tolerance):
+            regressions.append('%s went down from %.1f to %.1f' % (name, before, after))
+        elif not better[name] and after > before * (1 + tolerance):
+            regressions.append('%s went up from %.1f to %.1f' % (name, before, after))
+
+    if comparison['new_failures']:
+        regressions.append('%i tests failed that did not before' % len(comparison['new_failures']))
+
+    return regressions
@@ -0,0 +1,272 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+"""
+What the swarm is doing while the attack is still going on.
+
+Beegees append a snapshot of the last second to a file of their own as a
+line of JSON. The HTTP engine does so with --live, and checkin-test can do
+the same at the path it is given in BEEGEES_LIVE:
+
+    {"time": 1760695200.5, "tests": 812, "failures": 3,
+     "latency": {"buckets": {"412": 3, ...}, "count": 812, "total": 9731.5, "min": 4.1, "max": 88.0}}
+
+latency is a histogram.py histogram of the second's tests. The control node
+tails every beegee's file over a channel of its own and merges the
+snapshots that came in each second into one view of the swarm.
+"""
+
+import BaseHTTPServer
+import collections
+import json
+import threading
+import time
+
+from beegeeswithmachineguns.histogram import LatencyHistogram
+
+# seconds of the attack kept, and how many of the latest are judged when deciding to call it off
+LIVE_HISTORY = 300
+ABORT_WINDOW = 10
+
+class Second(object):
+    """
+    The snapshots that came in from the swarm in one second.
+    """
+    def __init__(self, moment=None):
+        self.time = moment
+        self.tests = 0
+        self.failures = 0
+        self.latency = LatencyHistogram()
+        self.bees = set()
+
+    def add(self, bee, snapshot):
+        self.tests += int(snapshot['tests'])
+        self.failures += int(snapshot['failures'])
+        if snapshot.get('latency') and snapshot['latency']['count']:
+            self.latency.merge(LatencyHistogram.from_dict(snapshot['latency']))
+        self.bees.add(bee)
+
+    def merge(self, other):
+        self.tests += other.tests
+        self.failures += other.failures
+        self.latency.merge(other.latency)
+        self.bees.update(other.bees)
+        return self
+
+    def error_rate(self):
+        return float(self.failures) / self.tests if self.tests else 0.0
+
+    def to_dict(self):
+        return {
+            'time': self.time,
+            'tests': self.tests,
+            'failures': self.failures,
+            'bees': len(self.bees),
+            'mean': self.latency.mean(),
+            'p50': self.latency.percentile(50),
+            'p90': self.latency.percentile(90),
+            'p99': self.latency.percentile(99),
+            'max': self.latency.max,
+        }
+
+class LiveView(object):
+    """
+    The swarm's snapshots, merged a second at a time.
+
+    With max_error_rate or max_p99 the attack is judged every second on the
+    last ABORT_WINDOW seconds taken together, and called off once the target
+    is past either of them.
+    """
+    def __init__(self, max_error_rate=None, max_p99=None):
+        self.max_error_rate = max_error_rate
+        self.max_p99 = max_p99
+        self.lock = threading.Lock()
+        # per beegee, her channel and the start of a line not yet complete
+        self.channels = {}
+        self.current = Second()
+        self.seconds = collections.deque(maxlen=LIVE_HISTORY)
+        self.totals = Second()
+        self.aborted = threading.Event()
+        self.reason = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._server = None
+
+    def watch(self, bee, channel):
+        """
+        Take in the snapshots a beegee's channel brings from now on.
+        """
+        with self.lock:
+            self.channels[bee] = [channel, '']
+
+    def unwatch(self, bee):
+        """
+        Take in what is left on a beegee's channel and close it.
+        """
+        with self.lock:
+            entry = self.channels.pop(bee, None)
+            if entry is not None:
+                self._read(bee, entry)
+        if entry is not None:
+            entry[0].close()
+
+    def _read(self, bee, entry):
+        channel = entry[0]
+        data = ''
+        while channel.recv_ready():
+            chunk = channel.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+
+        lines = (entry[1] + data).split('\n')
+        entry[1] = lines.pop()
+
+        for line in lines:
+            try:
+                self.current.add(bee, json.loads(line))
+            except (ValueError, KeyError, TypeError):
+                # a beegee's own output is no reason to stop watching the rest
+                continue
+
+    def poll(self):
+        """
+        Take in whatever every channel has brought since the last poll.
+        """
+        with self.lock:
+            for bee, entry in self.channels.items():
+                self._read(bee, entry)
+
+    def tick(self, now):
+        """
+        Close the current second and return it.
+        """
+        with self.lock:
+            second, self.current = self.current, Second()
+            second.time = now
+            self.seconds.append(second)
+            self.totals.merge(second)
+            return second
+
+    def window(self, seconds):
+        """
+        The last seconds seconds merged into one, or None if fewer have passed.
+        """
+        with self.lock:
+            if len(self.seconds) < seconds:
+                return None
+            merged = Second()
+            for second in list(self.seconds)[-seconds:]:
+                merged.merge(second)
+            return merged
+
+    def judge(self):
+        """
+        Why the attack should be called off, or None if the target is holding up.
+        """
+        window = self.window(ABORT_WINDOW)
+        if window is None or not window.tests:
+            return None
+
+        if self.max_error_rate is not None and window.error_rate() > self.max_error_rate:
+            return '%.1f%% of tests failed over the last %i seconds' % (window.error_rate() * 100, ABORT_WINDOW)
+
+        p99 = window.latency.percentile(99)
+        if self.max_p99 is not None and p99 > self.max_p99:
+            return 'p99 was %i ms over the last %i seconds' % (p99, ABORT_WINDOW)
+
+        return None
+
+    def to_dict(self):
+        with self.lock:
+            seconds = list(self.seconds)
+            watching = len(self.channels)
+        return {
+            'firing': watching,
+            'last': seconds[-1].to_dict() if seconds else None,
+            'totals': self.totals.to_dict(),
+            'seconds': [second.to_dict() for second in seconds],
+            'aborted': self.reason,
+        }
+
+    def serve(self, port):
+        """
+        Serve the view as JSON over HTTP on localhost.
+        """
+        view = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = json.dumps(view.to_dict())
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = BaseHTTPServer.HTTPServer(('127.0.0.1', port), Handler)
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def start(self, on_tick, on_abort):
+        """
+        Merge the snapshots every second from a thread of its own, calling
+        on_tick(view, second) with each second and on_abort(reason) once when
+        the attack should be called off.
+        """
+        def run():
+            next_tick = time.time() + 1
+            while not self._stop.wait(max(next_tick - time.time(), 0)):
+                next_tick += 1
+                self.poll()
+                on_tick(self, self.tick(time.time()))
+
+                if not self.aborted.is_set():
+                    reason = self.judge()
+                    if reason:
+                        self.reason = reason
+                        self.aborted.set()
+                        on_abort(reason)
+
+        self._thread = threading.Thread(target=run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        with self.lock:
+            channels, self.channels = self.channels.values(), {}
+        for channel, partial in channels:
+            channel.close()
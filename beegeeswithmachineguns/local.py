@@ -0,0 +1,223 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+"""
+Beegees as processes on this machine, each pinned to one of its cores.
+
+Every local beegee gets a directory of her own under LOCAL_ROOT to act as
+her home, and her commands run there as if they had come in over SSH.
+"""
+
+from distutils.spawn import find_executable
+import getpass
+import multiprocessing
+import os
+import select
+import shutil
+import signal
+import socket
+import StringIO
+import subprocess
+
+LOCAL_ROOT = os.path.expanduser('~/.beegees-local')
+
+def _cores():
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+def _bee_number(host):
+    return int(host.rsplit('-', 1)[1])
+
+class LocalChannel(object):
+    """
+    Runs one command for a local beegee, mimicking the part of paramiko.Channel
+    the swarm reads from.
+    """
+    def __init__(self, home, cpu):
+        self.home = home
+        self.cpu = cpu
+        self.process = None
+        self.timeout = None
+        self.output = None
+        self.stderr_done = False
+
+    def exec_command(self, command):
+        argv = ['bash', '-c', command]
+
+        if not hasattr(os, 'sched_setaffinity') and find_executable('taskset'):
+            argv = ['taskset', '-c', str(self.cpu)] + argv
+
+        cpu = self.cpu
+
+        def prepare():
+            # a group of her own, so closing the channel takes the whole command down
+            os.setsid()
+            if hasattr(os, 'sched_setaffinity'):
+                os.sched_setaffinity(0, [cpu])
+
+        env = dict(os.environ, HOME=self.home)
+        self.process = subprocess.Popen(argv, cwd=self.home, env=env, preexec_fn=prepare,
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def sendall(self, data):
+        self.process.stdin.write(data)
+        self.process.stdin.flush()
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def _ready(self, stream, timeout):
+        return bool(select.select([stream], [], [], timeout)[0])
+
+    def recv(self, size):
+        if not self._ready(self.process.stdout, self.timeout):
+            raise socket.timeout()
+        return os.read(self.process.stdout.fileno(), size)
+
+    def recv_ready(self):
+        return self._ready(self.process.stdout, 0)
+
+    def recv_stderr_ready(self):
+        return not self.stderr_done and self._ready(self.process.stderr, 0)
+
+    def recv_stderr(self, size):
+        data = os.read(self.process.stderr.fileno(), size)
+        if not data:
+            self.stderr_done = True
+        return data
+
+    def recv_exit_status(self):
+        return self.process.wait()
+
+    def _communicate(self):
+        # read both streams together, reading one to the end first could leave the command stuck writing the other
+        if self.output is None:
+            self.output = self.process.communicate()
+        return self.output
+
+    def makefile(self, mode='r', bufsize=-1):
+        return StringIO.StringIO(self._communicate()[0])
+
+    def makefile_stderr(self, mode='r', bufsize=-1):
+        return StringIO.StringIO(self._communicate()[1])
+
+    def close(self):
+        if self.process is not None and self.process.poll() is None:
+            try:
+                os.killpg(self.process.pid, signal.SIGTERM)
+            except OSError:
+                pass
+            self.process.wait()
+
+class LocalTransport(object):
+    def __init__(self, home, cpu):
+        self.home = home
+        self.cpu = cpu
+        self.active = True
+
+    def is_active(self):
+        return self.active
+
+    def set_keepalive(self, interval):
+        pass
+
+    def open_session(self):
+        return LocalChannel(self.home, self.cpu)
+
+class LocalClient(object):
+    def __init__(self, home, cpu):
+        self.transport = LocalTransport(home, cpu)
+
+    def get_transport(self):
+        return self.transport
+
+    def close(self):
+        self.transport.active = False
+
+class LocalBackend(object):
+    """
+    Provisions, reaches and stands down beegees running on this machine.
+
+    Beegee n is pinned to core n modulo the number of cores, so a swarm as big
+    as the machine has cores gets a core per beegee.
+    """
+    name = 'local'
+
+    def __init__(self, root=LOCAL_ROOT):
+        self.root = root
+
+    def _home(self, host):
+        return os.path.join(self.root, host)
+
+    def username(self):
+        return getpass.getuser()
+
+    def launch(self, count, roster=None):
+        """
+        Add count beegees to those on the roster, returning the new beegees.
+        """
+        taken = set(bee['id'] for bee in (roster or {}).get('bees', []))
+        bees = []
+        n = 0
+        while len(bees) < count:
+            host = 'local-%i' % n
+            n += 1
+            if host in taken:
+                continue
+            if not os.path.isdir(self._home(host)):
+                os.makedirs(self._home(host))
+            bees.append({
+                'id': host,
+                'state': 'running',
+                'public_dns_name': '',
+                'private_dns_name': host,
+                'private_ip_address': '127.0.0.1',
+            })
+        return bees
+
+    def refresh(self, roster):
+        """
+        The roster's beegees, standing down any whose home has gone.
+        """
+        bees = []
+        for bee in roster['bees']:
+            bee = dict(bee)
+            bee['state'] = 'running' if os.path.isdir(self._home(bee['id'])) else 'terminated'
+            bees.append(bee)
+        return bees
+
+    def terminate(self, roster):
+        """
+        Remove the beegees' homes, returning the ids of those stood down.
+        """
+        for bee in roster['bees']:
+            shutil.rmtree(self._home(bee['id']), ignore_errors=True)
+        return [bee['id'] for bee in roster['bees']]
+
+    def connect(self, host, username, key_name, bee=None):
+        return LocalClient(self._home(host), _bee_number(host) % _cores())
@@ -25,6 +25,12 @@ THE SOFTWARE.
 """
 
 import beegees
+import daemon
+import history
+import live
+import ramp
+import sys
+from tracing import tracer
 from urlparse import urlparse
 from optparse import OptionParser, OptionGroup
 
@@ -42,9 +48,17 @@ A utility for arming (creating) many beegees (small EC2 instances) to attack
 
 commands:
   up      Start a batch of load testing servers.
+  init    Install the checkin-test suite on the load testing servers.
   attack  Begin the attack on a specific url.
+  deploy  Start, initialize and attack in one go, each server moving on as
+          soon as it is ready (takes the same options as up).
   down    Shutdown and deactivate the load testing servers.
   report  Report the status of the load testing servers.
+  history List the latest attacks kept in the run history.
+  compare Compare two attacks from the run history: compare [RUN [RUN]]
+          (default: the latest attack against the one before it).
+  daemon  Keep SSH sessions to the beegees open and run the other commands
+          in it, so they start at once; daemon stop shuts it down.
     """)
 
     up_group = OptionGroup(parser, "up",
@@ -63,25 +77,147 @@ commands:
                         help="The security group(s) to run the instances under (default: default).")
     up_group.add_option('-z', '--zone',  metavar="ZONE",  nargs=1,
                         action='store', dest='zone', type='string', default='us-east-1d',
-                        help="The availability zone to start the instances in (default: us-east-1d).")
+                        help="The availability zone(s) to start the instances in, separated by commas (default: us-east-1d).")
     up_group.add_option('-i', '--instance',  metavar="INSTANCE",  nargs=1,
                         action='store', dest='instance', type='string', default='ami-11e0597a',
-                        help="The instance-id to use for each server from (default: ami-11e0597a).")
+                        help="The instance-id to use for each server from, or REGION=AMI pairs separated by commas for zones in several regions (default: ami-11e0597a).")
     up_group.add_option('-t', '--type',  metavar="TYPE",  nargs=1,
                         action='store', dest='type', type='string', default='t2.micro',
-                        help="The instance-type to use for each server (default: t2.micro).")
+                        help="The instance-type(s) to use for each server, separated by commas in order of preference (default: t2.micro).")
     up_group.add_option('-l', '--login',  metavar="LOGIN",  nargs=1,
                         action='store', dest='login', type='string', default='ubuntu',
                         help="The ssh username name to use to connect to the new servers (default: ubuntu).")
     up_group.add_option('-v', '--subnet',  metavar="SUBNET",  nargs=1,
                         action='store', dest='subnet', type='string', default='subnet-fc8736a5',
-                        help="The vpc subnet id in which the instances should be launched. (default: subnet-fc8736a5).")
+                        help="The vpc subnet id(s) in which the instances should be launched, separated by commas, one per zone. (default: subnet-fc8736a5).")
     up_group.add_option('-b', '--bid', metavar="BID", nargs=1,
                         action='store', dest='bid', type='float', default=None,
                         help="The maximum bid price per spot instance (default: None).")
+    up_group.add_option('-q', '--quorum', metavar="QUORUM", nargs=1,
+                        action='store', dest='quorum', type='int', default=None,
+                        help="Return as soon as this many servers are running, or with deploy, attack once this many are armed (default: all of them).")
+    up_group.add_option('--spot-interval', metavar="SECONDS", nargs=1,
+                        action='store', dest='spot_interval', type='float', default=10,
+                        help="How often to poll spot requests (default: 10).")
+    up_group.add_option('--spot-deadline', metavar="SECONDS", nargs=1,
+                        action='store', dest='spot_deadline', type='float', default=None,
+                        help="Give up on unfulfilled spot requests after this many seconds and go ahead with the rest (default: wait forever).")
+    up_group.add_option('--chunk', metavar="CHUNK", nargs=1,
+                        action='store', dest='chunk', type='int', default=None,
+                        help="Call up this many servers per request, all requests at once, spread over the zones and instance types and moving on to the next where EC2 has no capacity (default: an even share per zone).")
+
+    up_group.add_option('--backend', metavar="BACKEND", nargs=1,
+                        action='store', dest='backend', type='choice', choices=sorted(beegees.BACKENDS), default='ec2',
+                        help="Where to call up the beegees: ec2, or local for processes on this machine, one per core (default: ec2).")
 
     parser.add_option_group(up_group)
 
+    init_group = OptionGroup(parser, "init",
+                             """With --bundle, checkin-test is installed on one beegee, packed up and passed from beegee to beegee over HTTP on port %i, which has to be open within the security group. Beegees that already hold the current revision are skipped.""" % beegees.BUNDLE_PORT)
+
+    init_group.add_option('--bundle', action='store_true', dest='bundle', default=False,
+                          help="Install once and share the install across the swarm instead of installing on every beegee.")
+    init_group.add_option('--fanout', metavar="FANOUT", nargs=1,
+                          action='store', dest='fanout', type='int', default=4,
+                          help="How many beegees each beegee passes the bundle on to at once (default: 4).")
+
+    parser.add_option_group(init_group)
+
+    attack_group = OptionGroup(parser, "attack",
+                               """By default every beegee runs the whole checkin-test suite. With --shard the suite's test files, or the scenarios listed in a file, are split across the beegees so each runs a part of it.""")
+
+    attack_group.add_option('--shard', action='store_true', dest='shard', default=False,
+                            help="Split the scenarios across the beegees, balanced by how long they took before.")
+    attack_group.add_option('--scenarios', metavar="FILE", nargs=1,
+                            action='store', dest='scenarios', type='string', default=None,
+                            help="A file listing one scenario (test file, URL, ...) per line to shard instead of the suite's test files.")
+
+    attack_group.add_option('--ramp', metavar="PROFILE", nargs=1,
+                            action='store', dest='ramp', type='string', default=None,
+                            help="When beegees open fire: spike (all at once), step:COUNT:SECONDS (COUNT more every SECONDS) or linear:SECONDS (spread evenly) (default: spike).")
+
+    attack_group.add_option('--timeline', metavar="FILE", nargs=1,
+                            action='store', dest='timeline', type='string', default=None,
+                            help="Write completed and failed tests and latency percentiles for every second of the attack to FILE as CSV.")
+    attack_group.add_option('--timeline-binary', metavar="FILE", nargs=1,
+                            action='store', dest='timeline_binary', type='string', default=None,
+                            help="Write the per-second timeline, full latency histograms included, to FILE in a compact binary form.")
+
+    attack_group.add_option('--deadline', metavar="SECONDS", nargs=1,
+                            action='store', dest='deadline', type='float', default=None,
+                            help="Give up on a beegee still firing this many seconds after she started, and summarize the rest without her (default: wait forever).")
+    attack_group.add_option('--hedge', action='store_true', dest='hedge', default=False,
+                            help="With --shard, hand the shard of a beegee that missed the deadline or failed to a beegee that has finished.")
+
+    attack_group.add_option('--engine', metavar="URL", nargs=1,
+                            action='store', dest='engine', type='string', default=None,
+                            help="Attack URL with the built-in HTTP engine instead of the checkin-test suite.")
+    attack_group.add_option('--concurrency', metavar="CONNECTIONS", nargs=1,
+                            action='store', dest='concurrency', type='int', default=10,
+                            help="With --engine, keep-alive connections per beegee (default: 10).")
+    attack_group.add_option('--rate', metavar="RATE", nargs=1,
+                            action='store', dest='rate', type='float', default=None,
+                            help="With --engine, requests a second per beegee (default: as fast as the target answers).")
+    attack_group.add_option('--duration', metavar="SECONDS", nargs=1,
+                            action='store', dest='duration', type='float', default=60,
+                            help="With --engine, how long each beegee attacks for (default: 60).")
+    attack_group.add_option('--header', metavar="HEADER", nargs=1,
+                            action='append', dest='headers', type='string', default=[],
+                            help="With --engine, a header to send as 'Name: value'. Can be given more than once.")
+    attack_group.add_option('--open', action='store_true', dest='open_loop', default=False,
+                            help="With --engine and --rate, keep sending at the rate however far behind the target falls, and time every request from when it was due, so waiting for a connection counts as latency.")
+
+    attack_group.add_option('--search', metavar="BEEGEES", nargs=1,
+                            action='store', dest='search', type='int', default=None,
+                            help="Binary search for the most beegees, up to BEEGEES, the target holds up against. With -k and the up options, beegees missing from the roster are called up and trained first.")
+    attack_group.add_option('--max-error-rate', metavar="RATE", nargs=1,
+                            action='store', dest='max_error_rate', type='float', default=0.01,
+                            help="With --search, the share of failed tests the target may have, from 0 to 1 (default: 0.01).")
+    attack_group.add_option('--max-p99', metavar="MILLISECONDS", nargs=1,
+                            action='store', dest='max_p99', type='float', default=None,
+                            help="With --search, the p99 latency the target has to stay under (default: no limit).")
+
+    attack_group.add_option('--live', action='store_true', dest='live', default=False,
+                            help="Show the swarm's tests, failures and latency every second while it attacks.")
+    attack_group.add_option('--live-port', metavar="PORT", nargs=1,
+                            action='store', dest='live_port', type='int', default=None,
+                            help="Serve the live view as JSON at http://127.0.0.1:PORT/ while the swarm attacks.")
+    attack_group.add_option('--abort-error-rate', metavar="RATE", nargs=1,
+                            action='store', dest='abort_error_rate', type='float', default=None,
+                            help="Call off the attack once the share of failed tests over the last %i seconds passes RATE, from 0 to 1." % live.ABORT_WINDOW)
+    attack_group.add_option('--abort-p99', metavar="MILLISECONDS", nargs=1,
+                            action='store', dest='abort_p99', type='float', default=None,
+                            help="Call off the attack once the p99 latency over the last %i seconds passes MILLISECONDS." % live.ABORT_WINDOW)
+    attack_group.add_option('--label', metavar="LABEL", nargs=1,
+                            action='store', dest='label', type='string', default=None,
+                            help="A note to keep with the attack in the run history, such as the deploy it tested.")
+
+    parser.add_option_group(attack_group)
+
+    compare_group = OptionGroup(parser, "compare",
+                                """Every attack is kept in the run history at %s. compare shows how one run differs from another, and with --tolerance exits with an error when the later run is worse, to check a deploy did not make the target slower.""" % history.HISTORY_FILENAME)
+
+    compare_group.add_option('--tolerance', metavar="TOLERANCE", nargs=1,
+                             action='store', dest='tolerance', type='float', default=None,
+                             help="How much slower the later run may be, as a fraction, before compare fails; its failure rate may grow by as many percentage points (default: report only).")
+    compare_group.add_option('--limit', metavar="RUNS", nargs=1,
+                             action='store', dest='limit', type='int', default=20,
+                             help="With history, how many of the latest runs to list (default: 20).")
+
+    parser.add_option_group(compare_group)
+
+    parser.add_option('--trace', metavar="FILE", nargs=1,
+                      action='store', dest='trace', type='string', default=None,
+                      help="Time each phase and beegee and write a Chrome trace (chrome://tracing) to FILE.")
+    parser.add_option('--refresh', action='store_true', dest='refresh', default=False,
+                      help="Ask EC2 for the beegees' hostnames and states instead of trusting the cached roster.")
+    parser.add_option('-w', '--workers', metavar="WORKERS", nargs=1,
+                      action='store', dest='workers', type='int', default=64,
+                      help="How many beegees to talk to at once, 0 for all of them (default: 64).")
+    parser.add_option('--executor', metavar="EXECUTOR", nargs=1,
+                      action='store', dest='executor', type='choice', choices=sorted(beegees.EXECUTORS), default='thread',
+                      help="Fan out to beegees with a thread or process pool (default: thread).")
+
     (options, args) = parser.parse_args()
 
     if len(args) <= 0:
@@ -89,23 +225,93 @@ commands:
 
     command = args[0]
 
-    if command == 'up':
-        if not options.key:
-            parser.error('To spin up new instances you need to specify a key-pair name with -k')
+    beegees.set_executor(options.executor, options.workers)
+
+    if options.trace:
+        tracer.start()
+
+    try:
+        with tracer.span(command):
+            if command == 'up':
+                if options.backend == 'ec2':
+                    if not options.key:
+                        parser.error('To spin up new instances you need to specify a key-pair name with -k')
+
+                    if options.group == 'default':
+                        print 'New beegees will use the "default" EC2 security group. Please note that port 22 (SSH) is not normally open on this group. You will need to use to the EC2 tools to open it before you will be able to attack.'
 
-        if options.group == 'default':
-            print 'New beegees will use the "default" EC2 security group. Please note that port 22 (SSH) is not normally open on this group. You will need to use to the EC2 tools to open it before you will be able to attack.'
+                beegees.up(options.servers, options.group, options.zone, options.instance, options.type, options.login, options.key, options.subnet, options.bid, options.quorum, options.spot_interval, options.spot_deadline, options.backend, options.chunk)
 
-        beegees.up(options.servers, options.group, options.zone, options.instance, options.type, options.login, options.key, options.subnet, options.bid)
+            elif command == 'deploy':
+                if options.backend != 'ec2':
+                    parser.error('deploy calls up EC2 instances, use up --backend %s, init and attack instead.' % options.backend)
+                if not options.key:
+                    parser.error('To spin up new instances you need to specify a key-pair name with -k')
+                if ',' in options.zone or ',' in options.type or options.chunk:
+                    parser.error('deploy calls up beegees in one zone and of one type, use up, init and attack for a fleet.')
 
-    elif command == 'init':
-        beegees.init()
-    elif command == 'attack':
-        beegees.attack()
-    elif command == 'down':
-        beegees.down()
-    elif command == 'report':
-        beegees.report()
+                beegees.deploy(options.servers, options.group, options.zone, options.instance, options.type, options.login, options.key, options.subnet, options.bid, options.quorum, options.spot_interval, options.spot_deadline, options.label)
+            elif command == 'init':
+                beegees.init(options.refresh, options.bundle, options.fanout)
+            elif command == 'attack':
+                scenarios = None
+                if options.scenarios:
+                    with open(options.scenarios) as f:
+                        scenarios = [line.strip() for line in f if line.strip()]
+                try:
+                    ramp.offsets(options.ramp, 1)
+                except ValueError as e:
+                    parser.error(str(e))
+                engine = None
+                if options.engine:
+                    if options.shard or scenarios:
+                        parser.error('--engine attacks a single URL, it cannot be combined with --shard.')
+                    engine = [options.engine, '--concurrency', options.concurrency, '--duration', options.duration]
+                    if options.rate:
+                        engine += ['--rate', options.rate]
+                    if options.open_loop:
+                        if not options.rate:
+                            parser.error('--open sends requests on a schedule, please give its --rate.')
+                        engine += ['--open']
+                    for header in options.headers:
+                        engine += ['--header', header]
+                elif options.open_loop:
+                    parser.error('--open is for the built-in engine, checkin-test sends its requests as it sees fit.')
+                if options.search:
+                    if options.shard or scenarios:
+                        parser.error('--search attacks with the whole suite on every beegee, it cannot be combined with --shard.')
+                    call_up = None
+                    if options.key:
+                        call_up = lambda count: beegees.up(count, options.group, options.zone, options.instance, options.type, options.login, options.key, options.subnet, options.bid, None, options.spot_interval, options.spot_deadline, 'ec2', options.chunk)
+                    beegees.search(options.search, options.max_error_rate, options.max_p99, call_up, options.refresh, options.ramp, options.deadline, engine)
+                else:
+                    beegees.attack(options.refresh, options.shard or bool(scenarios), scenarios, options.ramp, options.timeline, options.timeline_binary, options.deadline, options.hedge, engine,
+                                   options.live, options.live_port, options.abort_error_rate, options.abort_p99, options.label)
+            elif command == 'down':
+                beegees.down()
+            elif command == 'report':
+                beegees.report(options.refresh)
+            elif command == 'history':
+                beegees.list_runs(options.limit)
+            elif command == 'compare':
+                try:
+                    runs = [int(run) for run in args[1:3]]
+                except ValueError:
+                    parser.error('Runs are given by their number, see beegees history.')
+                if not beegees.compare(*runs, tolerance=options.tolerance):
+                    sys.exit(1)
+            elif command == 'daemon':
+                if args[1:] == ['stop']:
+                    if not daemon.stop():
+                        print 'No beegees daemon is listening on %s.' % daemon.SOCKET_FILENAME
+                elif not daemon.serve():
+                    sys.exit(1)
+    finally:
+        if options.trace:
+            tracer.write(options.trace)
+            print 'Wrote the trace of this run to %s.' % options.trace
+            tracer.print_summary()
+            tracer.stop()
 
 def main():
     parse_options()
@@ -0,0 +1,64 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+"""
+Ramp profiles: when each beegee opens fire, relative to the start of the attack.
+
+    spike               every beegee at once (the default)
+    step:COUNT:SECONDS  COUNT more beegees every SECONDS
+    linear:SECONDS      beegees spread evenly over SECONDS
+"""
+
+def _number(text, spec):
+    try:
+        value = float(text)
+    except ValueError:
+        raise ValueError('Bad ramp profile %r, expected a number instead of %r' % (spec, text))
+    if value < 0:
+        raise ValueError('Bad ramp profile %r, numbers cannot be negative' % spec)
+    return value
+
+def offsets(spec, count):
+    """
+    Seconds after the start of the attack at which each of count beegees fires.
+    """
+    parts = (spec or 'spike').split(':')
+    kind, args = parts[0], parts[1:]
+
+    if kind == 'spike' and not args:
+        return [0.0] * count
+    elif kind == 'step' and len(args) == 2:
+        size, interval = int(_number(args[0], spec)), _number(args[1], spec)
+        if size < 1:
+            raise ValueError('Bad ramp profile %r, each step needs at least one beegee' % spec)
+        return [(i // size) * interval for i in range(count)]
+    elif kind == 'linear' and len(args) == 1:
+        duration = _number(args[0], spec)
+        if count < 2:
+            return [0.0] * count
+        return [duration * i / (count - 1) for i in range(count)]
+
+    raise ValueError('Bad ramp profile %r, expected spike, step:COUNT:SECONDS or linear:SECONDS' % spec)
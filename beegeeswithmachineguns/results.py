@@ -0,0 +1,308 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import json
+import re
+
+from beegeeswithmachineguns.histogram import LatencyHistogram
+from beegeeswithmachineguns.timeline import Timeline, parse_timestamp
+
+# the details are a JSON array of per-thread results, printed after the npm preamble
+_DETAILS_START = re.compile(r'(?:^|\n)[ \t]*(\[)\s*[\{\]]')
+_WHITESPACE = re.compile(r'\s*')
+
+_decoder = json.JSONDecoder()
+
+class _ChunkReader(object):
+    """
+    Buffers just enough of a chunked stream to decode the next JSON value.
+    """
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def more(self):
+        if self.eof:
+            return False
+        try:
+            chunk = next(self.chunks)
+        except StopIteration:
+            self.eof = True
+            return False
+        # forget what has been consumed so memory stays bounded by one value
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def skip_to_start(self):
+        while True:
+            match = _DETAILS_START.search(self.buf, self.pos)
+            if match:
+                self.pos = match.start(1) + 1
+                return
+            # hold on to a tail in case the start straddles two chunks
+            self.pos = max(self.pos, len(self.buf) - 1024)
+            if not self.more():
+                raise ValueError('No JSON results found in the output')
+
+    def peek(self):
+        """
+        Skip whitespace and return the next character.
+        """
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.more():
+                raise ValueError('Results ended early')
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError('Expected %r at %r' % (char, self.buf[self.pos:self.pos + 40]))
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+                # a value running to the very end of the buffer may be cut short (e.g. a number)
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            if not self.more() and self.eof and self.pos >= len(self.buf):
+                raise ValueError('Results ended early')
+
+def iter_detail_events(chunks):
+    """
+    Incrementally parse `npm run details` output, given as an iterable of chunks.
+
+    Yields (key, value) pairs for each thread result: ('stats', stats) and one
+    pair per test in the tests, pending, failures and passes lists, followed
+    by ('end', None). Only one test is held in memory at a time.
+    """
+    reader = _ChunkReader(chunks)
+    reader.skip_to_start()
+
+    if reader.peek() == ']':
+        return
+
+    while True:
+        reader.expect('{')
+
+        if reader.peek() != '}':
+            while True:
+                key = reader.value()
+                reader.expect(':')
+
+                if reader.peek() == '[':
+                    reader.pos += 1
+                    if reader.peek() != ']':
+                        while True:
+                            yield key, reader.value()
+                            if reader.peek() != ',':
+                                break
+                            reader.pos += 1
+                    reader.expect(']')
+                else:
+                    yield key, reader.value()
+
+                if reader.peek() != ',':
+                    break
+                reader.pos += 1
+
+        reader.expect('}')
+
+        yield 'end', None
+
+        if reader.peek() != ',':
+            break
+        reader.pos += 1
+
+    reader.expect(']')
+
+class SwarmResults(object):
+    """
+    Running totals over every beegee that has reported back so far.
+
+    elapsed is the longest single run in milliseconds, which is the window the
+    swarm's tests were spread over.
+    """
+    def __init__(self):
+        self.bees = 0
+        self.tests = 0
+        self.passes = 0
+        self.failures = 0
+        self.elapsed = 0.0
+        self.latency = LatencyHistogram()
+        self.timeline = Timeline()
+        # per failing test title, how often it failed and its slowest failure, so a struggling target costs no more memory
+        self.failed_tests = {}
+        # time spent in tests per test file, where the results name the file
+        self.files = {}
+        # how long the attack command ran for, and which scenarios it was given when sharded
+        self.run_time = 0.0
+        self.shard = None
+        # seconds each beegee opened fire after she was scheduled to
+        self.start_lags = []
+        # how far each beegee's clock was ahead of the control node's, and give or take how much, in seconds
+        self.clock_offsets = []
+        # this beegee's offset, taken off the times in her results so they line up with the rest of the swarm
+        self.clock_offset = 0.0
+        # a summary per beegee run merged in, for the run history
+        self.per_bee = []
+        # bytes of results that came over the wire, and what they came to decompressed
+        self.transfer_bytes = 0
+        self.detail_bytes = 0
+        # per thread: whether it listed its tests, and if not, the latencies of its passes and failures
+        self._seen_tests = False
+        self._fallback = LatencyHistogram()
+        # when the current thread's next test started, for placing tests on the timeline,
+        # and the tests seen before the thread said when it started
+        self._clock = None
+        self._unplaced = []
+
+    def add_event(self, key, value):
+        """
+        Fold in one event from iter_detail_events.
+        """
+        if key == 'stats':
+            self.tests += int(value['tests'])
+            self.passes += int(value['passes'])
+            self.failures += int(value['failures'])
+            self.elapsed = max(self.elapsed, float(value['duration']))
+            self._clock = parse_timestamp(value['start']) - self.clock_offset if value.get('start') else None
+            unplaced, self._unplaced = self._unplaced, []
+            for test in unplaced:
+                self._record_timeline(test)
+        elif key == 'tests':
+            self._seen_tests = True
+            self._record_latency(self.latency, value)
+            self._record_timeline(value)
+            if value.get('file') and value.get('duration') is not None:
+                self.files[value['file']] = self.files.get(value['file'], 0) + value['duration']
+        elif key in ('passes', 'failures'):
+            self._record_latency(self._fallback, value)
+            if key == 'failures':
+                self._record_failure(value['title'], value.get('duration') or 0)
+        elif key == 'end':
+            # passes and failures are a subset of tests, only count them if tests were missing
+            if not self._seen_tests:
+                self.latency.merge(self._fallback)
+            self._seen_tests = False
+            self._fallback = LatencyHistogram()
+            self._clock = None
+            self._unplaced = []
+
+    def _record_timeline(self, test):
+        duration = test.get('duration')
+        if duration is None:
+            return
+
+        # tests seldom say when they ran, but a thread runs them one after the other from its start
+        finished = parse_timestamp(test['end']) if test.get('end') else None
+        if finished is not None:
+            finished -= self.clock_offset
+        else:
+            if self._clock is None:
+                self._unplaced.append({'duration': duration, 'err': test.get('err')})
+                return
+            self._clock += duration / 1000.0
+            finished = self._clock
+
+        self.timeline.record(finished, duration, failed=bool(test.get('err')))
+
+    def _record_failure(self, title, duration, count=1):
+        failed = self.failed_tests.get(title)
+        if failed is None:
+            self.failed_tests[title] = [count, duration]
+        else:
+            failed[0] += count
+            failed[1] = max(failed[1], duration)
+
+    def _record_latency(self, histogram, test):
+        # pending tests never ran and carry no duration
+        if test.get('duration') is not None:
+            histogram.record(test['duration'])
+
+    @classmethod
+    def from_chunks(cls, chunks, clock_offset=0.0):
+        """
+        Summarize the `npm run details` output of one beegee as it streams in.
+
+        clock_offset is how many seconds her clock is ahead of the control node's.
+        """
+        bee = cls()
+        bee.clock_offset = clock_offset
+
+        for key, value in iter_detail_events(chunks):
+            bee.add_event(key, value)
+
+        bee.bees = 1
+
+        return bee
+
+    def merge(self, other):
+        self.bees += other.bees
+        self.tests += other.tests
+        self.passes += other.passes
+        self.failures += other.failures
+        self.elapsed = max(self.elapsed, other.elapsed)
+        self.latency.merge(other.latency)
+        self.timeline.merge(other.timeline)
+        for title, (count, duration) in other.failed_tests.iteritems():
+            self._record_failure(title, duration, count)
+        for name, duration in other.files.iteritems():
+            self.files[name] = self.files.get(name, 0) + duration
+        self.run_time = max(self.run_time, other.run_time)
+        self.start_lags.extend(other.start_lags)
+        self.clock_offsets.extend(other.clock_offsets)
+        self.per_bee.extend(other.per_bee)
+        self.transfer_bytes += other.transfer_bytes
+        self.detail_bytes += other.detail_bytes
+        return self
+
+    def shard_durations(self):
+        """
+        Time spent in each of this beegee's scenarios that can be matched to a test file.
+        """
+        measured = {}
+        for scenario in self.shard or []:
+            matches = [duration for name, duration in self.files.iteritems() if name.endswith(scenario)]
+            if matches:
+                measured[scenario] = sum(matches)
+        return measured
+
+    def throughput(self):
+        """
+        Tests completed per second across the swarm.
+        """
+        return self.tests / (self.elapsed / 1000) if self.elapsed else 0.0
@@ -0,0 +1,109 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+"""
+Splitting the attack's scenarios across beegees so they all finish together.
+
+A scenario is anything the attack takes as an argument: a test file of the
+checkin-test suite, a target URL, and so on. How long each one took on past
+runs is kept in ~/.beegees-durations and used to balance the shards.
+"""
+
+import heapq
+import json
+import os
+
+DURATIONS_FILENAME = os.path.expanduser('~/.beegees-durations')
+
+# weight of the latest run when updating a scenario's expected duration
+SMOOTHING = 0.5
+
+def load_durations():
+    if not os.path.isfile(DURATIONS_FILENAME):
+        return {}
+
+    with open(DURATIONS_FILENAME, 'r') as f:
+        return json.load(f)
+
+def save_durations(durations):
+    temp_path = DURATIONS_FILENAME + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(durations, f, indent=1, sort_keys=True)
+    os.rename(temp_path, DURATIONS_FILENAME)
+
+def _expected(scenarios, durations):
+    known = [durations[s] for s in scenarios if s in durations]
+    # scenarios never seen before are assumed to take as long as the average one
+    default = sum(known) / len(known) if known else 1.0
+    return dict((s, durations.get(s, default)) for s in scenarios)
+
+def balance(scenarios, durations, count):
+    """
+    Split scenarios into count shards with about equal expected durations.
+
+    Longest scenarios are placed first, each on the shard with the least work
+    so far. Returns a list of (expected duration, scenarios) per shard.
+    """
+    expected = _expected(scenarios, durations)
+
+    shards = [(0.0, i, []) for i in range(count)]
+    heapq.heapify(shards)
+
+    for scenario in sorted(scenarios, key=lambda s: (-expected[s], s)):
+        total, i, shard = heapq.heappop(shards)
+        shard.append(scenario)
+        heapq.heappush(shards, (total + expected[scenario], i, shard))
+
+    return [(total, shard) for total, i, shard in sorted(shards, key=lambda s: s[1])]
+
+def update_durations(durations, shard, elapsed, measured=None):
+    """
+    Fold one beegee's run of a shard into the expected durations.
+
+    measured maps scenarios to the time their tests took, where the results
+    said which file each test came from. The rest of the shard's elapsed time
+    is shared out in proportion to what each remaining scenario was expected
+    to take.
+    """
+    measured = measured or {}
+    expected = _expected(shard, durations)
+
+    unmeasured = [s for s in shard if s not in measured]
+    leftover = max(elapsed - sum(measured.get(s, 0) for s in shard), 0)
+    weight = sum(expected[s] for s in unmeasured)
+
+    for scenario in shard:
+        if scenario in measured:
+            latest = measured[scenario]
+        else:
+            latest = leftover * expected[scenario] / weight if weight else leftover / len(unmeasured)
+
+        if scenario in durations:
+            durations[scenario] = SMOOTHING * latest + (1 - SMOOTHING) * durations[scenario]
+        else:
+            durations[scenario] = latest
+
+    return durations
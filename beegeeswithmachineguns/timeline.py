@@ -0,0 +1,155 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import calendar
+import csv
+import struct
+from datetime import datetime
+
+from beegeeswithmachineguns.histogram import LatencyHistogram
+
+BINARY_MAGIC = 'BGTL'
+BINARY_VERSION = 1
+
+def parse_timestamp(value):
+    """
+    Seconds since the epoch from mocha's ISO timestamps or a number of milliseconds.
+    """
+    if isinstance(value, (int, long, float)):
+        return value / 1000.0
+
+    for format in ('%Y-%m-%dT%H:%M:%S.%fZ', '%Y-%m-%dT%H:%M:%SZ'):
+        try:
+            moment = datetime.strptime(value, format)
+        except ValueError:
+            continue
+        return calendar.timegm(moment.timetuple()) + moment.microsecond / 1e6
+
+    return None
+
+class Timeline(object):
+    """
+    Completed and failed tests, and their latencies, for every second of a run.
+
+    Seconds are whole seconds since the epoch, so timelines from different
+    beegees line up when merged.
+    """
+    def __init__(self):
+        self.buckets = {}
+
+    def _bucket(self, second):
+        bucket = self.buckets.get(second)
+        if bucket is None:
+            bucket = self.buckets[second] = [0, 0, LatencyHistogram()]
+        return bucket
+
+    def record(self, finished, duration, failed=False):
+        """
+        Count a test that finished at the given time after taking duration milliseconds.
+        """
+        bucket = self._bucket(int(finished))
+        bucket[0] += 1
+        if failed:
+            bucket[1] += 1
+        if duration is not None:
+            bucket[2].record(duration)
+
+    def merge(self, other):
+        for second, (completed, failed, latency) in other.buckets.iteritems():
+            bucket = self._bucket(second)
+            bucket[0] += completed
+            bucket[1] += failed
+            bucket[2].merge(latency)
+        return self
+
+    def peak(self):
+        """
+        The (second, completed) with the most tests completed, or None.
+        """
+        if not self.buckets:
+            return None
+        second = max(sorted(self.buckets), key=lambda s: self.buckets[s][0])
+        return second, self.buckets[second][0]
+
+    def rows(self):
+        """
+        One row per second from the first to the last, quiet seconds included.
+        """
+        if not self.buckets:
+            return
+
+        first, last = min(self.buckets), max(self.buckets)
+        empty = [0, 0, LatencyHistogram()]
+
+        for second in xrange(first, last + 1):
+            completed, failed, latency = self.buckets.get(second, empty)
+            yield (second, second - first, completed, failed,
+                   latency.percentile(50), latency.percentile(90), latency.percentile(99), latency.max)
+
+    def write_csv(self, path):
+        with open(path, 'wb') as f:
+            writer = csv.writer(f)
+            writer.writerow(['time', 'offset', 'completed', 'failed', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms'])
+            for row in self.rows():
+                writer.writerow(['' if value is None else ('%.3f' % value if isinstance(value, float) else value) for value in row])
+
+    def write_binary(self, path):
+        """
+        Write the timeline losslessly, histograms included, in a compact form.
+
+        Header: magic, version, number of seconds. Then per second: the second,
+        completed, failed, number of histogram buckets and (index, count) per bucket.
+        """
+        with open(path, 'wb') as f:
+            f.write(struct.pack('<4sHI', BINARY_MAGIC, BINARY_VERSION, len(self.buckets)))
+            for second in sorted(self.buckets):
+                completed, failed, latency = self.buckets[second]
+                f.write(struct.pack('<qIIH', second, completed, failed, len(latency.buckets)))
+                for index in sorted(latency.buckets):
+                    f.write(struct.pack('<HI', index, latency.buckets[index]))
+
+    @classmethod
+    def read_binary(cls, path):
+        timeline = cls()
+        with open(path, 'rb') as f:
+            magic, version, seconds = struct.unpack('<4sHI', f.read(10))
+            if magic != BINARY_MAGIC or version > BINARY_VERSION:
+                raise ValueError('%s is not a beegees timeline' % path)
+            for _ in xrange(seconds):
+                second, completed, failed, count = struct.unpack('<qIIH', f.read(18))
+                bucket = timeline._bucket(second)
+                bucket[0], bucket[1] = completed, failed
+                for _ in xrange(count):
+                    index, hits = struct.unpack('<HI', f.read(6))
+                    latency = bucket[2]
+                    latency.buckets[index] = hits
+                    latency.count += hits
+                    # only the buckets survive, so min, max and mean come from them
+                    value = latency._value(index)
+                    latency.total += value * hits
+                    latency.min = value if latency.min is None else min(latency.min, value)
+                    latency.max = value if latency.max is None else max(latency.max, value)
+        return timeline
@@ -0,0 +1,166 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+"""
+Lightweight timing of the swarm's phases, written out as a Chrome trace.
+
+Load the file in chrome://tracing or https://ui.perfetto.dev to see where a
+run spent its time. Each beegee gets her own lane, the control node's own
+work is on lane 0. Spans recorded in worker processes only reach the trace
+if the work was wrapped in Traced and its result passed to Tracer.receive.
+"""
+
+from contextlib import contextmanager
+import json
+import os
+import threading
+import time
+
+class Tracer(object):
+    """
+    Records spans while enabled, and does nothing otherwise.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.lock = threading.Lock()
+        self.epoch = time.time()
+
+    def start(self):
+        self.enabled = True
+        self.events = []
+        self.epoch = time.time()
+
+    def stop(self):
+        self.enabled = False
+        self.events = []
+
+    def add(self, name, start, end, bee=None, **args):
+        """
+        Record a span that has already happened.
+        """
+        if not self.enabled:
+            return
+
+        if bee is not None:
+            args['bee'] = bee
+
+        event = {
+            'name': name,
+            'cat': name.split('.')[0],
+            'ph': 'X',
+            'ts': int((start - self.epoch) * 1e6),
+            'dur': int((end - start) * 1e6),
+            'pid': os.getpid(),
+            'tid': 0 if bee is None else bee + 1,
+            'args': args
+        }
+
+        with self.lock:
+            self.events.append(event)
+
+    @contextmanager
+    def span(self, name, bee=None, **args):
+        if not self.enabled:
+            yield args
+            return
+
+        start = time.time()
+        try:
+            # callers can add to args while the span is open, e.g. a byte count
+            yield args
+        finally:
+            self.add(name, start, time.time(), bee, **args)
+
+    def receive(self, result):
+        """
+        The result of a Traced call, with the spans it recorded added to this tracer.
+        """
+        if not isinstance(result, TracedResult):
+            return result
+
+        with self.lock:
+            self.events.extend(result.events)
+        return result.result
+
+    def write(self, path):
+        with self.lock:
+            events = list(self.events)
+
+        lanes = sorted(set((event['pid'], event['tid']) for event in events))
+        names = [{
+            'name': 'thread_name',
+            'ph': 'M',
+            'pid': pid,
+            'tid': tid,
+            'args': {'name': 'control' if tid == 0 else 'BeeGee %i' % (tid - 1)}
+        } for pid, tid in lanes]
+
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': names + events, 'displayTimeUnit': 'ms'}, f)
+
+    def summary(self):
+        """
+        Count, total, mean and max duration per span name, slowest total first.
+        """
+        totals = {}
+
+        with self.lock:
+            for event in self.events:
+                count, total, longest = totals.get(event['name'], (0, 0, 0))
+                totals[event['name']] = (count + 1, total + event['dur'], max(longest, event['dur']))
+
+        rows = [(name, count, total / 1e6, total / 1e3 / count, longest / 1e3) for name, (count, total, longest) in totals.iteritems()]
+        return sorted(rows, key=lambda row: -row[2])
+
+    def print_summary(self):
+        print '     %-24s %6s %10s %10s %10s' % ('Span', 'Count', 'Total (s)', 'Mean (ms)', 'Max (ms)')
+        for name, count, total, mean, longest in self.summary():
+            print '     %-24s %6i %10.2f %10.1f %10.1f' % (name, count, total, mean, longest)
+
+class TracedResult(object):
+    """
+    What a Traced call returned, and the spans it recorded on the way.
+    """
+    def __init__(self, result, events):
+        self.result = result
+        self.events = events
+
+class Traced(object):
+    """
+    Wraps func to run in a worker process, sending the spans it records there
+    back with its result.
+    """
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, *args):
+        # the worker was forked with the parent's tracer, and its events so far
+        before = len(tracer.events)
+        result = self.func(*args)
+        return TracedResult(result, tracer.events[before:])
+
+tracer = Tracer()
@@ -0,0 +1,401 @@
+"""
+The swarm's orchestration in beegees.py, against the fakes.
+"""
+
+from collections import Counter
+import os
+import shutil
+import StringIO
+import subprocess
+import sys
+import tempfile
+import thread
+import threading
+import time
+import unittest
+
+from beegeeswithmachineguns import beegees, fakes, history, shards
+
+class QuietTestCase(unittest.TestCase):
+    def setUp(self):
+        # the swarm reports its progress on stdout
+        self.stdout, sys.stdout = sys.stdout, StringIO.StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+
+class SwarmTestCase(QuietTestCase):
+    """
+    A swarm of fake EC2 instances reached over fake SSH, its files kept in a scratch directory.
+    """
+    def setUp(self):
+        QuietTestCase.setUp(self)
+        self.workdir = tempfile.mkdtemp()
+        self.conn = fakes.FakeEC2Connection()
+        self.ssh = fakes.FakeSSH(tests=10)
+        self.saved = (beegees.STATE_FILENAME, history.HISTORY_FILENAME, shards.DURATIONS_FILENAME,
+                      beegees._connect_to_region, beegees._ssh_sessions, beegees.START_LEAD)
+        beegees.STATE_FILENAME = os.path.join(self.workdir, 'roster')
+        history.HISTORY_FILENAME = os.path.join(self.workdir, 'history.sqlite')
+        shards.DURATIONS_FILENAME = os.path.join(self.workdir, 'durations')
+        beegees._connect_to_region = lambda zone: self.conn
+        beegees._ssh_sessions = beegees.SSHSessionPool(connect=self.ssh.connect, backoff=0.01)
+        beegees.START_LEAD = 0
+
+    def tearDown(self):
+        beegees._ssh_sessions.close()
+        (beegees.STATE_FILENAME, history.HISTORY_FILENAME, shards.DURATIONS_FILENAME,
+         beegees._connect_to_region, beegees._ssh_sessions, beegees.START_LEAD) = self.saved
+        shutil.rmtree(self.workdir)
+        QuietTestCase.tearDown(self)
+
+    def up(self, count):
+        beegees.up(count, 'default', 'us-east-1d', 'ami-11e0597a', 't2.micro', 'ubuntu', 'test', None)
+        return [beegees._get_hostname(bee) for bee in beegees._read_roster()['bees']]
+
+class AttackTest(SwarmTestCase):
+    def test_shard_lists_scenarios_on_a_beegee_that_answers(self):
+        hosts = self.up(3)
+        self.ssh.unreachable.add(hosts[0])
+
+        swarm = beegees.attack(shard=True)
+
+        self.assertEqual(swarm.bees, 2)
+        self.assertEqual([command for host, command in self.ssh.commands if 'find test' in command][:1],
+                         ["cd checkin-test && find test -name '*.js' | sort"])
+
+    def test_shard_with_no_beegee_answering(self):
+        for host in self.up(2):
+            self.ssh.unreachable.add(host)
+
+        self.assertEqual(beegees.attack(shard=True), None)
+        self.assertTrue('No beegee could be reached to list the scenarios.' in sys.stdout.getvalue())
+
+    def test_ramp_staggers_the_start_whatever_the_beegees_clocks_say(self):
+        self.up(3)
+        self.ssh.clock_offset = 5
+        fired = {}
+        respond = self.ssh.respond
+
+        def timed(command, host=None):
+            if 'npm run attack' in command:
+                fired[host] = time.time()
+            return respond(command, host)
+        self.ssh.respond = timed
+
+        swarm = beegees.attack(ramp_profile='step:1:0.3')
+
+        self.assertEqual(swarm.bees, 3)
+        starts = sorted(fired.values())
+        for gap in (starts[1] - starts[0], starts[2] - starts[1]):
+            self.assertTrue(0.25 < gap < 0.4, 'opened fire %.3f seconds apart' % gap)
+        # their five second lead is taken off when they say when they opened fire
+        self.assertEqual(len(swarm.start_lags), 3)
+        self.assertTrue(max(abs(lag) for lag in swarm.start_lags) < 0.1, swarm.start_lags)
+
+    def test_attack_deadline(self):
+        self.up(2)
+        self.ssh.run_time = 2
+
+        swarm = beegees.attack(deadline=0.5)
+
+        self.assertEqual(swarm.bees, 0)
+        self.assertEqual(sys.stdout.getvalue().count('missed the 0.5 second deadline'), 2)
+
+    def test_details_deadline_is_told_apart(self):
+        self.up(1)
+        saved, beegees.DETAILS_DEADLINE = beegees.DETAILS_DEADLINE, 0.2
+        respond = self.ssh.respond
+        self.ssh.respond = lambda command, host=None: (respond(command, host)[0], 1.5 if 'npm run details' in command else 0)
+        try:
+            swarm = beegees.attack(deadline=30)
+        finally:
+            beegees.DETAILS_DEADLINE = saved
+
+        self.assertEqual(swarm.bees, 0)
+        self.assertTrue('took over 0.2 seconds to send her results' in sys.stdout.getvalue())
+        self.assertFalse('missed the 30 second deadline' in sys.stdout.getvalue())
+
+    def test_interrupt_tells_the_beegees_to_cease_fire(self):
+        hosts = self.up(3)
+        self.ssh.run_time = 1
+        threading.Timer(0.4, thread.interrupt_main).start()
+
+        swarm = beegees.attack()
+
+        self.assertEqual(swarm.bees, 0)
+        self.assertEqual(sorted(host for host, command in self.ssh.commands if command.startswith('kill -TERM')), sorted(hosts))
+        # the workers stop too, rather than fetch results nobody is waiting for
+        time.sleep(1.5)
+        self.assertEqual([command for host, command in self.ssh.commands if 'npm run details' in command], [])
+
+class InitBundleTest(SwarmTestCase):
+    revision = '1' * 40
+
+    def _commands(self, text):
+        return sorted(host for host, command in self.ssh.commands if text in command)
+
+    def test_bundle_spreads_and_a_warm_swarm_is_left_alone(self):
+        hosts = self.up(6)
+
+        beegees.init(bundle=True, fanout=2)
+
+        self.assertEqual(self._commands('tar czf'), hosts[:1])
+        self.assertEqual(self._commands('curl -sf'), sorted(hosts[1:]))
+        self.assertEqual(self._commands('curl -sf --connect-timeout %i --max-time %i' % (beegees.BUNDLE_CONNECT_TIMEOUT, beegees.BUNDLE_FETCH_TIMEOUT)), sorted(hosts[1:]))
+        self.assertEqual(self._commands('pkill'), self._commands('mkdir -p beegees-serve'))
+
+        self.ssh.commands = []
+        beegees.init(bundle=True, fanout=2)
+
+        self.assertEqual(self._commands('curl -sf') + self._commands('git clone'), [])
+
+    def test_same_revision_with_another_bundle_is_refetched(self):
+        hosts = self.up(3)
+        self.ssh.bundles[hosts[0]] = '%s %s\n' % (self.revision, 'a' * 64)
+        self.ssh.bundles[hosts[1]] = '%s %s\n' % (self.revision, 'b' * 64)
+        self.ssh.bundles[hosts[2]] = '%s %s\n' % (self.revision, 'b' * 64)
+
+        beegees.init(bundle=True)
+
+        self.assertEqual(self._commands('tar czf'), [])
+        self.assertEqual(self._commands('curl -sf'), [hosts[0]])
+        self.assertTrue(" && echo %s %s > checkin-test/" % (self.revision, 'b' * 64) in
+                        [command for host, command in self.ssh.commands if 'curl -sf' in command][0])
+
+    def test_source_that_cannot_serve_is_not_learned_from(self):
+        hosts = self.up(3)
+        # a marker left behind without its bundle, so there is nothing to link in and serve
+        self.ssh.bundles[hosts[0]] = '%s %s\n' % (self.revision, '2' * 64)
+        respond = self.ssh.respond
+        self.ssh.respond = lambda command, host=None: ('', 0) if command.startswith('mkdir -p beegees-serve') else respond(command, host)
+
+        beegees.init(bundle=True)
+
+        self.assertEqual(self._commands('curl -sf'), [])
+        self.assertEqual(self._commands('rm -rf checkin-test && git clone'), sorted(hosts))
+
+class WaitForInstancesTest(QuietTestCase):
+    def test_pending_instances_are_polled_together(self):
+        conn = fakes.FakeEC2Connection(boot_time=0.3)
+        instances = conn.run_instances('ami-11e0597a', min_count=100, max_count=100).instances
+
+        ready = beegees._wait_for_instances(conn, instances, interval=0.05, max_interval=0.05)
+
+        self.assertEqual(len(ready), 100)
+        self.assertEqual(set(instance.state for instance in ready), set(['running']))
+        # one call per tick, not per instance
+        self.assertTrue(1 <= conn.calls['get_all_instances'] <= 12, conn.calls['get_all_instances'])
+
+    def test_polling_backs_off_while_nothing_changes(self):
+        conn = fakes.FakeEC2Connection(boot_time=1)
+        instances = conn.run_instances('ami-11e0597a', min_count=10, max_count=10).instances
+
+        beegees._wait_for_instances(conn, instances, interval=0.05, max_interval=0.4)
+
+        self.assertTrue(conn.calls['get_all_instances'] < 1 / 0.05, conn.calls['get_all_instances'])
+
+    def test_quorum_cut_off(self):
+        conn = fakes.FakeEC2Connection(boot_time=60)
+        instances = conn.run_instances('ami-11e0597a', min_count=10, max_count=10).instances
+        for instance in instances[:3]:
+            conn.instances[instance.id].boot_time = 0.1
+
+        start = time.time()
+        ready = beegees._wait_for_instances(conn, instances, quorum=3, interval=0.05, max_interval=0.05)
+
+        self.assertTrue(time.time() - start < 5)
+        self.assertEqual(sorted(instance.id for instance in ready), sorted(instance.id for instance in instances[:3]))
+
+    def test_quorum_stops_polling_the_other_regions(self):
+        fast = fakes.FakeEC2Connection(boot_time=0.1)
+        slow = fakes.FakeEC2Connection(boot_time=60)
+        instances = fast.run_instances('ami-11e0597a', min_count=3, max_count=3).instances + \
+            slow.run_instances('ami-11e0597a', min_count=3, max_count=3).instances
+
+        ready = beegees._wait_for_instances(fast, instances, quorum=3, interval=0.05, max_interval=0.05)
+        polled = slow.calls['get_all_instances']
+        time.sleep(0.3)
+
+        self.assertEqual(len(ready), 3)
+        self.assertEqual(slow.calls['get_all_instances'], polled)
+
+class SpotInstancesTest(QuietTestCase):
+    def _request(self, conn, fulfil_times):
+        requests = conn.request_spot_instances('0.01', 'ami-11e0597a', count=len(fulfil_times))
+        for request, fulfil_time in zip(requests, fulfil_times):
+            request.fulfil_time = fulfil_time
+        return requests
+
+    def test_all_fulfilled(self):
+        conn = fakes.FakeEC2Connection()
+        requests = self._request(conn, [0, 0.1, 0.2])
+
+        landed = list(beegees._iter_spot_instances(conn, requests, interval=0.05, deadline=5))
+
+        self.assertEqual(sorted(instance.id for instance in landed), sorted(request.instance_id for request in requests))
+        self.assertEqual(conn.calls['cancel_spot_instance_requests'], 0)
+
+    def test_deadline_calls_off_open_requests(self):
+        conn = fakes.FakeEC2Connection()
+        requests = self._request(conn, [0, 0, None, None])
+
+        start = time.time()
+        landed = list(beegees._iter_spot_instances(conn, requests, interval=0.05, deadline=0.3))
+
+        self.assertTrue(time.time() - start < 2)
+        self.assertEqual(sorted(instance.id for instance in landed), sorted(request.instance_id for request in requests[:2]))
+        self.assertEqual(conn.calls['cancel_spot_instance_requests'], 1)
+        self.assertTrue(all(request.cancelled for request in requests))
+        self.assertEqual([request.refresh().state for request in requests[2:]], ['cancelled', 'cancelled'])
+
+    def test_beegee_landing_at_the_deadline_is_kept(self):
+        conn = fakes.FakeEC2Connection()
+        requests = self._request(conn, [0, None])
+        # fulfilled after the last poll, before the cancel got through
+        late = conn._launch(1)[0]
+        original = conn.cancel_spot_instance_requests
+
+        def cancel(request_ids):
+            requests[1].instance_id = late.id
+            return original(request_ids)
+
+        conn.cancel_spot_instance_requests = cancel
+
+        landed = list(beegees._iter_spot_instances(conn, requests, interval=0.05, deadline=0.3))
+
+        self.assertEqual(sorted(instance.id for instance in landed), sorted([requests[0].instance_id, late.id]))
+
+    def test_fulfilled_beegees_ec2_does_not_know_yet(self):
+        conn = fakes.FakeEC2Connection(visible_after=0.2)
+        requests = self._request(conn, [0, 0.1])
+
+        landed = list(beegees._iter_spot_instances(conn, requests, interval=0.05, deadline=5))
+
+        self.assertEqual(sorted(instance.id for instance in landed), sorted(request.instance_id for request in requests))
+
+    def test_late_beegee_ec2_does_not_know_yet(self):
+        conn = fakes.FakeEC2Connection(visible_after=0.1)
+        requests = self._request(conn, [None])
+        original = conn.cancel_spot_instance_requests
+
+        def cancel(request_ids):
+            requests[0].instance_id = conn._launch(1)[0].id
+            return original(request_ids)
+
+        conn.cancel_spot_instance_requests = cancel
+
+        landed = list(beegees._iter_spot_instances(conn, requests, interval=0.05, deadline=0.2))
+
+        self.assertEqual([instance.id for instance in landed], [requests[0].instance_id])
+
+class UpTest(SwarmTestCase):
+    def test_spot_beegees_are_waited_on_as_they_land(self):
+        self.conn.visible_after = 0.1
+        request = self.conn.request_spot_instances
+
+        def staggered(*args, **kwargs):
+            requests = request(*args, **kwargs)
+            for fulfil_time, spot_request in zip([0, 1], requests):
+                spot_request.fulfil_time = fulfil_time
+            return requests
+
+        self.conn.request_spot_instances = staggered
+
+        beegees.up(2, 'default', 'us-east-1d', 'ami-11e0597a', 't2.micro', 'ubuntu', 'test', None, bid=0.01, spot_interval=0.05)
+
+        output = sys.stdout.getvalue()
+        last = sorted(self.conn.instances)[-1]
+        self.assertTrue(output.index('1/2 beegees are ready') < output.index('spot bee `%s` joined' % last), output)
+        self.assertEqual(len(beegees._read_roster()['bees']), 2)
+
+class FleetTest(SwarmTestCase):
+    """
+    Beegees called up in chunks across the zones of two regions.
+    """
+    def setUp(self):
+        SwarmTestCase.setUp(self)
+        self.regions = {'us-east-1': fakes.FakeEC2Connection(), 'us-west-2': fakes.FakeEC2Connection()}
+        beegees._connect_to_region = lambda zone: self.regions[beegees._get_region(zone)]
+        self.launches = []
+        for conn in self.regions.values():
+            conn.run_instances = self._logged(conn.run_instances)
+
+    def _logged(self, run_instances):
+        def logged(image_id, min_count=1, max_count=1, **kwargs):
+            reservation = run_instances(image_id, min_count, max_count, **kwargs)
+            self.launches.append((kwargs['placement'], kwargs['instance_type'], image_id, max_count))
+            return reservation
+        return logged
+
+    def fleet(self, count, zones, image_id, instance_types='c5.large', chunk=4):
+        beegees.up(count, 'default', zones, image_id, instance_types, 'ubuntu', 'test', None, chunk=chunk)
+        roster = beegees._read_roster()
+        return Counter(bee['zone'] for bee in roster['bees']) if roster else Counter()
+
+    def test_chunks_spread_over_the_zones_and_move_on_when_full(self):
+        self.regions['us-east-1'].capacity = {('us-east-1a', 'c5.large'): 4, ('us-east-1b', 'c5.large'): 0}
+
+        zones = self.fleet(20, 'us-east-1a,us-east-1b,us-west-2a', 'us-east-1=ami-east,us-west-2=ami-west', 'c5.large,m5.large')
+
+        self.assertEqual(zones, Counter({'us-west-2a': 16, 'us-east-1a': 4}))
+        self.assertEqual(sorted(set((zone, image_id) for zone, instance_type, image_id, count in self.launches)),
+                         [('us-east-1a', 'ami-east'), ('us-west-2a', 'ami-west')])
+        self.assertTrue('No room for 4 c5.large beegees in us-east-1b (InsufficientInstanceCapacity), trying elsewhere.'
+                        in sys.stdout.getvalue())
+
+        beegees.down()
+        self.assertEqual([sum(instance.terminated for instance in self.regions[region].instances.values())
+                          for region in ('us-east-1', 'us-west-2')], [4, 16])
+
+    def test_region_without_an_ami_is_skipped(self):
+        zones = self.fleet(8, 'us-east-1a,us-west-2a', 'us-west-2=ami-west')
+
+        self.assertEqual(zones, Counter({'us-west-2a': 8}))
+        self.assertTrue('No AMI given for us-east-1a, skipping it.' in sys.stdout.getvalue())
+
+    def test_chunks_that_landed_are_kept_when_the_rest_find_no_room(self):
+        self.regions['us-east-1'].capacity = {('us-east-1a', 'c5.large'): 4}
+
+        zones = self.fleet(8, 'us-east-1a', 'ami-east')
+
+        self.assertEqual(zones, Counter({'us-east-1a': 4}))
+        self.assertTrue('Nowhere left to call up 4 beegees.' in sys.stdout.getvalue())
+
+class LivePathTest(unittest.TestCase):
+    def setUp(self):
+        self.home = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.home, 'checkin-test'))
+        self.live_path = beegees.LIVE_FILENAME % 1760695200
+
+    def tearDown(self):
+        shutil.rmtree(self.home)
+
+    def _run(self, command):
+        # as sshd would, in her home directory
+        return subprocess.check_output(['bash', '-c', command], cwd=self.home, env=dict(os.environ, HOME=self.home))
+
+    def test_suite_and_tail_share_the_file(self):
+        command = beegees._npm_command('attack', {'BEEGEES_LIVE': self.live_path})
+        self.assertTrue(command.endswith(' && npm run attack'))
+        written = self._run(command[:-len('npm run attack')] + 'printenv BEEGEES_LIVE').strip()
+        self.assertEqual(written, os.path.join(self.home, 'beegees-live-1760695200.jsonl'))
+
+        with open(written, 'w') as f:
+            f.write('{"time": 1760695200.5, "tests": 1}\n')
+        # an attack that has finished, so the tail prints what is there and ends
+        finished = subprocess.Popen(['true'])
+        finished.wait()
+        with open(os.path.join(self.home, beegees.ATTACK_PIDFILE), 'w') as f:
+            f.write('%i\n' % finished.pid)
+
+        self.assertEqual(self._run(beegees._live_command(self.live_path)), '{"time": 1760695200.5, "tests": 1}\n')
+
+    def test_engine_writes_to_the_same_file(self):
+        engine = self._run('printf %s ' + beegees._shell_arg(self.live_path))
+        suite = self._run(beegees._npm_command('attack', {'BEEGEES_LIVE': self.live_path})[:-len('npm run attack')] + 'printenv BEEGEES_LIVE')
+        self.assertEqual(engine, suite.strip())
+        self.assertEqual(beegees._engine_command(['--live', self.live_path]).count(beegees._shell_arg(self.live_path)), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+"""
+The HTTP engine against a local target.
+"""
+
+import json
+import socket
+import threading
+import time
+import unittest
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from StringIO import StringIO
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from io import StringIO
+
+from beegeeswithmachineguns.engine import Engine, Request, _chunked_length
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.connections.add(self.client_address)
+        time.sleep(self.server.delay)
+        if self.path == '/chunked':
+            self.send_response(200)
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for chunk in (b'hello ', b'chunked ', b'world'):
+                self.wfile.write(('%x\r\n' % len(chunk)).encode('ascii') + chunk + b'\r\n')
+                self.wfile.flush()
+            self.wfile.write(b'0\r\n\r\n')
+            return
+        status = 503 if self.path == '/err' else 200
+        self.send_response(status)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+class _Target(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class EngineTest(unittest.TestCase):
+    def setUp(self):
+        self.target = _Target(('127.0.0.1', 0), _Handler)
+        self.target.delay = 0
+        self.target.connections = set()
+        thread = threading.Thread(target=self.target.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.target.shutdown()
+        self.target.server_close()
+
+    def attack(self, path='/', port=None, **options):
+        out = StringIO()
+        request = Request('http://127.0.0.1:%i%s' % (port or self.target.server_address[1], path))
+        started = time.time()
+        stats = Engine(request, out, **options).run()
+        self.elapsed = time.time() - started
+        document = json.loads(out.getvalue())
+        self.assertEqual(document[0]['stats'], stats)
+        return document[0]
+
+    def test_requests(self):
+        record = self.attack(concurrency=3, requests=10)
+
+        self.assertEqual(record['stats']['tests'], 10)
+        self.assertEqual(record['stats']['failures'], 0)
+        self.assertEqual(len(record['tests']), 10)
+
+    def test_connections_are_kept_alive(self):
+        record = self.attack(concurrency=2, requests=20)
+
+        self.assertEqual(record['stats']['passes'], 20)
+        self.assertEqual(len(self.target.connections), 2)
+
+    def test_chunked_responses(self):
+        record = self.attack('/chunked', concurrency=2, requests=6)
+
+        self.assertEqual(record['stats']['passes'], 6)
+        self.assertEqual(len(self.target.connections), 2)
+
+    def test_rate(self):
+        record = self.attack(concurrency=5, rate=20, duration=1)
+
+        self.assertTrue(18 <= record['stats']['tests'] <= 21, '%i tests' % record['stats']['tests'])
+
+    def test_refused_connections_fail(self):
+        closed = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        closed.bind(('127.0.0.1', 0))
+        port = closed.getsockname()[1]
+        closed.close()
+
+        record = self.attack(port=port, concurrency=2, requests=5)
+
+        self.assertEqual(record['stats']['tests'], 5)
+        self.assertEqual(record['stats']['failures'], 5)
+
+    def test_error_status_fails(self):
+        record = self.attack('/err', concurrency=2, requests=4)
+
+        self.assertEqual(record['stats']['failures'], 4)
+        self.assertEqual([failure['err']['message'] for failure in record['failures']], ['HTTP 503'] * 4)
+
+    def test_open_loop_misses_what_was_never_sent(self):
+        # one connection to a target taking 0.3 seconds gets round to about 4 of the 16 requests due
+        self.target.delay = 0.3
+        record = self.attack(concurrency=1, rate=16, duration=1, open_loop=True)
+
+        stats = record['stats']
+        self.assertEqual(stats['tests'], 16)
+        self.assertTrue(stats['passes'] in (3, 4), '%i passed' % stats['passes'])
+        never_sent = [failure for failure in record['failures'] if failure['err']['message'].startswith('never sent')]
+        self.assertEqual(len(never_sent), 16 - stats['passes'])
+        # the attack ends with the request in flight, without catching up on the ones still due
+        self.assertTrue(self.elapsed < 1.5, 'took %.2f seconds' % self.elapsed)
+        self.assertTrue(max(test['duration'] for test in record['tests']) < 1500)
+
+class ChunkedLengthTest(unittest.TestCase):
+    def test_complete_body(self):
+        body = b'5\r\nhello\r\n6;ext=1\r\n world\r\n0\r\n\r\n'
+        self.assertEqual(_chunked_length(body + b'HTTP/1.1 200 OK', 0), len(body))
+
+    def test_trailers(self):
+        body = b'5\r\nhello\r\n0\r\nExpires: never\r\n\r\n'
+        self.assertEqual(_chunked_length(body, 0), len(body))
+
+    def test_body_still_arriving(self):
+        body = b'5\r\nhello\r\n0\r\n\r\n'
+        for end in range(len(body)):
+            self.assertEqual(_chunked_length(body[:end], 0), None, body[:end])
+
+if __name__ == '__main__':
+    unittest.main()
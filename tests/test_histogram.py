@@ -0,0 +1,61 @@
+"""
+LatencyHistogram percentiles and merging.
+"""
+
+import unittest
+
+from beegeeswithmachineguns.histogram import GROWTH, LatencyHistogram
+
+def _histogram(values):
+    histogram = LatencyHistogram()
+    for value in values:
+        histogram.record(value)
+    return histogram
+
+class LatencyHistogramTest(unittest.TestCase):
+    def assertClose(self, value, expected):
+        self.assertTrue(abs(value - expected) <= expected * (GROWTH - 1),
+                        '%r is not within %.0f%% of %r' % (value, (GROWTH - 1) * 100, expected))
+
+    def test_percentiles(self):
+        histogram = _histogram(range(1, 1001))
+
+        self.assertClose(histogram.percentile(50), 500)
+        self.assertClose(histogram.percentile(90), 900)
+        self.assertClose(histogram.percentile(99), 990)
+        self.assertEqual(histogram.percentile(100), 1000)
+        self.assertClose(histogram.percentile(0), 1)
+        self.assertEqual(histogram.mean(), 500.5)
+
+    def test_percentiles_stay_within_what_was_seen(self):
+        histogram = _histogram([250.0] * 10)
+        self.assertEqual(histogram.percentile(1), 250.0)
+        self.assertEqual(histogram.percentile(99.9), 250.0)
+
+    def test_empty(self):
+        histogram = LatencyHistogram()
+        self.assertEqual(histogram.percentile(50), None)
+        self.assertEqual(histogram.mean(), None)
+
+    def test_merge_matches_recording_everything_in_one(self):
+        merged = _histogram(range(1, 501)).merge(_histogram(range(501, 1001)))
+        whole = _histogram(range(1, 1001))
+
+        self.assertEqual(merged.to_dict(), whole.to_dict())
+        for percent in (50, 90, 99, 99.9):
+            self.assertEqual(merged.percentile(percent), whole.percentile(percent))
+
+    def test_merge_empty(self):
+        histogram = _histogram([5, 10])
+        histogram.merge(LatencyHistogram())
+        self.assertEqual((histogram.count, histogram.min, histogram.max), (2, 5, 10))
+
+        empty = LatencyHistogram().merge(histogram)
+        self.assertEqual((empty.count, empty.min, empty.max), (2, 5, 10))
+
+    def test_dict_round_trip(self):
+        histogram = _histogram([0.0005, 1, 42, 3600000])
+        self.assertEqual(LatencyHistogram.from_dict(histogram.to_dict()).to_dict(), histogram.to_dict())
+
+if __name__ == '__main__':
+    unittest.main()
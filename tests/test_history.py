@@ -0,0 +1,131 @@
+"""
+The run history and comparing runs from it.
+"""
+
+import json
+import os
+import re
+import shutil
+import sqlite3
+import StringIO
+import sys
+import tempfile
+import unittest
+
+from beegeeswithmachineguns import beegees, history
+from beegeeswithmachineguns.histogram import LatencyHistogram
+from beegeeswithmachineguns.results import SwarmResults
+
+def _swarm(durations, failed=()):
+    swarm = SwarmResults()
+    swarm.bees = 1
+    swarm.tests = len(durations)
+    swarm.failures = len(failed)
+    swarm.passes = swarm.tests - swarm.failures
+    swarm.elapsed = 1000.0
+    for duration in durations:
+        swarm.latency.record(duration)
+    for title in failed:
+        swarm.failed_tests[title] = [1, 10]
+    swarm.per_bee.append(dict(history.summarize(swarm), bee=0, run_time=1200.0, bytes=100, raw_bytes=800))
+    return swarm
+
+class HistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.workdir, 'history.sqlite')
+        self.db = history.connect(self.path)
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.workdir)
+
+    def test_record_and_read_back(self):
+        swarm = _swarm(range(1, 101), ['GET /slow'])
+        run = history.record(self.db, swarm, 'https://example.com', 'abc123', label='nightly')
+
+        row = history.get_run(self.db, run)
+        self.assertEqual((row['target'], row['revision'], row['label']), ('https://example.com', 'abc123', 'nightly'))
+        self.assertEqual((row['tests'], row['passes'], row['failures']), (100, 99, 1))
+        self.assertEqual(row['p99'], swarm.latency.percentile(99))
+        self.assertEqual(LatencyHistogram.from_dict(json.loads(row['latency'])).to_dict(), swarm.latency.to_dict())
+        self.assertEqual([tuple(bee) for bee in self.db.execute('SELECT bee, run_time, bytes, raw_bytes FROM bees WHERE run = ?', (run,))],
+                         [(0, 1200.0, 100, 800)])
+
+    def test_latest(self):
+        first = history.record(self.db, _swarm([10]), 'a')
+        second = history.record(self.db, _swarm([10]), 'b')
+        third = history.record(self.db, _swarm([10]), 'a')
+
+        self.assertEqual(history.latest(self.db), third)
+        self.assertEqual(history.latest(self.db, 'b'), second)
+        self.assertEqual(history.latest(self.db, 'a', before=third), first)
+        self.assertEqual(history.latest(self.db, 'a', before=first), None)
+        self.assertEqual([row['id'] for row in history.list_runs(self.db, 2)], [third, second])
+        self.assertEqual([row['id'] for row in history.list_runs(self.db, target='a')], [third, first])
+
+    def test_compare(self):
+        first = history.record(self.db, _swarm(range(1, 101), ['GET /a', 'GET /b']), 'a')
+        second = history.record(self.db, _swarm(range(1, 201), ['GET /b', 'GET /c']), 'a')
+
+        comparison = history.compare(self.db, first, second)
+
+        metrics = dict((name, (before, after)) for name, before, after in comparison['metrics'])
+        self.assertEqual(metrics['tests'], (100, 200))
+        self.assertEqual(metrics['failure_rate'], (0.02, 0.01))
+        self.assertEqual(comparison['new_failures'], [('GET /c', 1)])
+        self.assertEqual(comparison['fixed_failures'], [('GET /a', 1)])
+        self.assertRaises(KeyError, history.compare, self.db, first, 99)
+
+    def test_find_regressions(self):
+        first = history.record(self.db, _swarm([100] * 100), 'a')
+        slightly = history.record(self.db, _swarm([105] * 100), 'a')
+        slower = history.record(self.db, _swarm([150] * 100, ['GET /new']), 'a')
+
+        self.assertEqual(history.find_regressions(history.compare(self.db, first, slightly), 0.1), [])
+
+        regressions = history.find_regressions(history.compare(self.db, first, slower), 0.1)
+        self.assertTrue('p99 went up from 100.0 to 150.0' in regressions, regressions)
+        self.assertTrue('the failure rate went from 0.00% to 1.00%' in regressions, regressions)
+        self.assertTrue('1 tests failed that did not before' in regressions, regressions)
+
+    def test_older_history_gains_the_new_columns(self):
+        self.db.close()
+        os.remove(self.path)
+        old = sqlite3.connect(self.path)
+        old.executescript(re.sub(r',\s*bytes INTEGER,\s*raw_bytes INTEGER', '', history._SCHEMA))
+        old.close()
+
+        self.db = history.connect(self.path)
+        row = history.get_run(self.db, history.record(self.db, _swarm([10]), 'a'))
+        self.assertEqual((row['bytes'], row['raw_bytes']), (0, 0))
+
+class CompareCommandTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.saved = history.HISTORY_FILENAME
+        history.HISTORY_FILENAME = os.path.join(self.workdir, 'history.sqlite')
+        self.stdout, sys.stdout = sys.stdout, StringIO.StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        history.HISTORY_FILENAME = self.saved
+        shutil.rmtree(self.workdir)
+
+    def test_latest_against_the_one_before_on_the_same_target(self):
+        db = history.connect()
+        history.record(db, _swarm([100] * 10), 'a')
+        history.record(db, _swarm([100] * 10), 'b')
+        history.record(db, _swarm([300] * 10), 'a')
+        db.close()
+
+        self.assertEqual(beegees.compare(tolerance=0.1), False)
+        self.assertTrue('Run 3 is worse than run 1:' in sys.stdout.getvalue())
+        self.assertEqual(beegees.compare(1, 2, tolerance=0.1), True)
+
+    def test_nothing_recorded(self):
+        self.assertEqual(beegees.compare(), True)
+        self.assertTrue('No attacks have been recorded yet.' in sys.stdout.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+"""
+Beegees as processes on this machine.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from beegeeswithmachineguns import local
+
+class LocalBackendTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.backend = local.LocalBackend(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def run_command(self, host, command, data=None):
+        channel = self.backend.connect(host, 'ubuntu', 'test').get_transport().open_session()
+        try:
+            channel.exec_command(command)
+            if data is not None:
+                channel.sendall(data)
+            return channel.makefile().read(), channel.makefile_stderr().read(), channel.recv_exit_status()
+        finally:
+            channel.close()
+
+    def test_launch_adds_to_the_roster(self):
+        bees = self.backend.launch(2)
+        self.assertEqual([bee['id'] for bee in bees], ['local-0', 'local-1'])
+        self.assertTrue(all(os.path.isdir(os.path.join(self.root, bee['id'])) for bee in bees))
+
+        more = self.backend.launch(2, {'bees': [{'id': 'local-0'}, {'id': 'local-2'}]})
+        self.assertEqual([bee['id'] for bee in more], ['local-1', 'local-3'])
+
+    def test_refresh_and_terminate(self):
+        roster = {'bees': self.backend.launch(3)}
+        shutil.rmtree(os.path.join(self.root, 'local-1'))
+
+        self.assertEqual([bee['state'] for bee in self.backend.refresh(roster)], ['running', 'terminated', 'running'])
+
+        self.assertEqual(self.backend.terminate(roster), ['local-0', 'local-1', 'local-2'])
+        self.assertEqual(os.listdir(self.root), [])
+
+    def test_commands_run_at_home_on_her_core(self):
+        self.backend.launch(4)
+        home = os.path.join(self.root, 'local-3')
+
+        output, errors, status = self.run_command('local-3', 'echo $HOME; pwd; grep Cpus_allowed_list /proc/self/status; echo oops >&2; exit 3')
+
+        lines = output.splitlines()
+        self.assertEqual(lines[:2], [home, os.path.realpath(home)])
+        if len(lines) > 2:
+            self.assertEqual(lines[2].split()[1], str(3 % local._cores()))
+        self.assertEqual((errors, status), ('oops\n', 3))
+
+    def test_input(self):
+        self.backend.launch(1)
+        output, errors, status = self.run_command('local-0', 'while read line; do echo "got $line"; done', 'one\ntwo\n')
+        self.assertEqual(output, 'got one\ngot two\n')
+
+    def test_closing_takes_the_whole_command_down(self):
+        self.backend.launch(1)
+        channel = self.backend.connect('local-0', 'ubuntu', 'test').get_transport().open_session()
+        channel.exec_command('sleep 30 & echo $!; wait')
+        channel.settimeout(5)
+        child = int(channel.recv(64))
+
+        channel.close()
+
+        for attempt in range(50):
+            if not os.path.exists('/proc/%i' % child) or 'State:\tZ' in open('/proc/%i/status' % child).read():
+                break
+            time.sleep(0.1)
+        else:
+            self.fail('the command left sleep %i running' % child)
+
+if __name__ == '__main__':
+    unittest.main()
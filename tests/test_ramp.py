@@ -0,0 +1,28 @@
+"""
+Ramp profiles.
+"""
+
+import unittest
+
+from beegeeswithmachineguns import ramp
+
+class OffsetsTest(unittest.TestCase):
+    def test_spike(self):
+        self.assertEqual(ramp.offsets(None, 3), [0.0, 0.0, 0.0])
+        self.assertEqual(ramp.offsets('spike', 2), [0.0, 0.0])
+
+    def test_step(self):
+        self.assertEqual(ramp.offsets('step:2:5', 5), [0.0, 0.0, 5.0, 5.0, 10.0])
+        self.assertEqual(ramp.offsets('step:1:0.5', 3), [0.0, 0.5, 1.0])
+
+    def test_linear(self):
+        self.assertEqual(ramp.offsets('linear:10', 5), [0.0, 2.5, 5.0, 7.5, 10.0])
+        self.assertEqual(ramp.offsets('linear:10', 1), [0.0])
+        self.assertEqual(ramp.offsets('linear:10', 0), [])
+
+    def test_bad_profiles(self):
+        for spec in ('wave', 'spike:3', 'step:2', 'step:0:5', 'step:x:5', 'linear', 'linear:-1', 'linear:soon'):
+            self.assertRaises(ValueError, ramp.offsets, spec, 4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+"""
+Parsing `npm run details` output as it streams in, and summarizing it.
+"""
+
+import json
+import StringIO
+import sys
+import unittest
+
+from beegeeswithmachineguns import beegees, fakes
+from beegeeswithmachineguns.histogram import LatencyHistogram
+from beegeeswithmachineguns.results import SwarmResults, iter_detail_events
+
+class IterDetailEventsTest(unittest.TestCase):
+    def setUp(self):
+        self.document = fakes.synthetic_details(threads=3, tests=20, failures=2)
+
+    def test_one_byte_chunks_match_one_chunk(self):
+        whole = list(iter_detail_events([self.document]))
+        self.assertEqual(list(iter_detail_events(list(self.document))), whole)
+
+    def test_events_follow_the_document(self):
+        records = json.loads(self.document[self.document.index('['):])
+        events = list(iter_detail_events(list(self.document)))
+
+        self.assertEqual([value for key, value in events if key == 'stats'], [record['stats'] for record in records])
+        self.assertEqual([value for key, value in events if key == 'tests'], sum([record['tests'] for record in records], []))
+        self.assertEqual([value for key, value in events if key == 'failures'], sum([record['failures'] for record in records], []))
+        self.assertEqual([key for key, value in events].count('end'), 3)
+
+    def test_preamble_with_brackets_is_skipped(self):
+        preamble = 'npm WARN [deprecated] mocha-details@0.1: use [mocha --reporter json]\n'
+        events = list(iter_detail_events(list(preamble + self.document)))
+        self.assertEqual(events, list(iter_detail_events([self.document])))
+
+    def test_empty_array(self):
+        self.assertEqual(list(iter_detail_events(list('> details\n\n[]'))), [])
+
+    def test_awkward_titles_split_anywhere(self):
+        titles = [u'says "hi"', u'back\\slash \\', u'ends ]} early', u'caf\u00e9 \u2603', u'two\nlines']
+        records = [{'stats': {'tests': len(titles)}, 'tests': [{'title': title, 'duration': 5} for title in titles]}]
+        document = '> details\n' + json.dumps(records)
+
+        tests = [value['title'] for key, value in iter_detail_events(list(document)) if key == 'tests']
+        self.assertEqual(tests, titles)
+
+    def test_reads_no_further_than_it_has_to(self):
+        document = fakes.large_details(1024 * 1024)
+        chunks = [document[i:i + 4096] for i in range(0, len(document), 4096)]
+        read = []
+
+        def stream():
+            for chunk in chunks:
+                read.append(chunk)
+                yield chunk
+
+        next(iter_detail_events(stream()))
+        self.assertTrue(len(read) <= 2, '%i of %i chunks read for the first event' % (len(read), len(chunks)))
+
+    def test_missing_document(self):
+        chunks = list('> checkin-test@1.0.0 details\nnpm ERR! missing script: details\n')
+        with self.assertRaises(ValueError):
+            list(iter_detail_events(chunks))
+
+    def test_truncated_document(self):
+        with self.assertRaises(ValueError):
+            list(iter_detail_events(list(self.document[:-100])))
+
+class SwarmResultsTest(unittest.TestCase):
+    def test_from_chunks_totals(self):
+        bee = SwarmResults.from_chunks(list(fakes.synthetic_details(threads=2, tests=10, failures=3)))
+
+        self.assertEqual(bee.bees, 1)
+        self.assertEqual(bee.tests, 20)
+        self.assertEqual(bee.passes, 14)
+        self.assertEqual(bee.failures, 6)
+        self.assertEqual(bee.latency.count, 20)
+        self.assertEqual(sorted(count for count, duration in bee.failed_tests.values()), [1] * 6)
+
+    def test_merge_counts_failures_per_title(self):
+        swarm = SwarmResults()
+        for i in range(3):
+            swarm.merge(SwarmResults.from_chunks([fakes.synthetic_details(tests=10, failures=2)]))
+
+        self.assertEqual(swarm.bees, 3)
+        self.assertEqual(swarm.failures, 6)
+        self.assertEqual(len(swarm.failed_tests), 2)
+        self.assertEqual([count for count, duration in swarm.failed_tests.values()], [3, 3])
+
+class PrintResultsTest(unittest.TestCase):
+    def _printed(self, swarm):
+        saved_stdout, sys.stdout = sys.stdout, StringIO.StringIO()
+        try:
+            beegees._print_results(swarm)
+            return sys.stdout.getvalue()
+        finally:
+            sys.stdout = saved_stdout
+
+    def test_percentiles_over_every_beegee(self):
+        documents = [fakes.synthetic_details(threads=2, tests=50) for i in range(4)]
+        swarm = SwarmResults()
+        for document in documents:
+            swarm.merge(SwarmResults.from_chunks([document]))
+
+        # the percentiles are those of every test in the swarm, not an average of each beegee's
+        whole = LatencyHistogram()
+        for document in documents:
+            for record in json.loads(document[document.index('['):]):
+                for test in record['tests']:
+                    whole.record(test['duration'])
+
+        printed = self._printed(swarm)
+        for label, percent in (('p50', 50), ('p90', 90), ('p99', 99), ('p99.9', 99.9)):
+            self.assertTrue('%-6s      %.1f ms' % (label + ':', whole.percentile(percent)) in printed, label)
+        self.assertTrue('max:        %.1f ms' % whole.max in printed)
+
+    def test_compression_per_beegee(self):
+        swarm = SwarmResults()
+        # BeeGee 1 has no gzip and sends her details as they are
+        for i, (sent, details) in enumerate([(1000, 8000), (6000, 6000), (2000, 10000)]):
+            bee = SwarmResults()
+            bee.transfer_bytes, bee.detail_bytes = sent, details
+            bee.per_bee.append({'bee': i, 'bytes': sent, 'raw_bytes': details})
+            swarm.merge(bee)
+
+        printed = self._printed(swarm)
+        self.assertTrue('(2.7x), at most 6.0 KB from one beegee' in printed, printed)
+        self.assertTrue('Compressed: 1.0x to 8.0x per beegee (median 5.0x, least by BeeGee 1)' in printed, printed)
+
+    def test_compression_of_a_lone_beegee_is_the_swarm_ratio(self):
+        bee = SwarmResults()
+        bee.transfer_bytes, bee.detail_bytes = 1000, 8000
+        bee.per_bee.append({'bee': 0, 'bytes': 1000, 'raw_bytes': 8000})
+
+        self.assertFalse('Compressed:' in self._printed(bee))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+"""
+Balancing scenarios across beegees.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from beegeeswithmachineguns import shards
+
+class BalanceTest(unittest.TestCase):
+    def test_longest_first_onto_the_least_loaded_shard(self):
+        durations = {'a': 8, 'b': 7, 'c': 6, 'd': 5, 'e': 4, 'f': 3}
+        balanced = shards.balance(sorted(durations), durations, 3)
+
+        self.assertEqual(balanced, [(11.0, ['a', 'f']), (11.0, ['b', 'e']), (11.0, ['c', 'd'])])
+
+    def test_every_scenario_once(self):
+        scenarios = ['test/%i.js' % i for i in range(17)]
+        durations = dict((scenario, i % 5 + 1) for i, scenario in enumerate(scenarios))
+        balanced = shards.balance(scenarios, durations, 4)
+
+        self.assertEqual(len(balanced), 4)
+        self.assertEqual(sorted(sum([shard for total, shard in balanced], [])), sorted(scenarios))
+        totals = [total for total, shard in balanced]
+        self.assertTrue(max(totals) - min(totals) <= max(durations.values()))
+
+    def test_unknown_scenarios_take_the_average(self):
+        balanced = shards.balance(['a', 'b', 'new'], {'a': 2, 'b': 4}, 3)
+        self.assertEqual(sorted(total for total, shard in balanced), [2.0, 3.0, 4.0])
+
+    def test_nothing_known(self):
+        balanced = shards.balance(['a', 'b', 'c', 'd'], {}, 2)
+        self.assertEqual([total for total, shard in balanced], [2.0, 2.0])
+
+    def test_more_beegees_than_scenarios(self):
+        balanced = shards.balance(['a'], {}, 3)
+        self.assertEqual(balanced, [(1.0, ['a']), (0.0, []), (0.0, [])])
+
+class UpdateDurationsTest(unittest.TestCase):
+    def test_measured_scenarios_are_smoothed(self):
+        durations = shards.update_durations({'a': 10.0}, ['a', 'b'], 30.0, {'a': 20.0, 'b': 5.0})
+        self.assertEqual(durations, {'a': 15.0, 'b': 5.0})
+
+    def test_unmeasured_share_the_rest_by_what_they_were_expected_to_take(self):
+        durations = shards.update_durations({'a': 2.0, 'b': 6.0}, ['a', 'b', 'c'], 25.0, {'c': 5.0})
+        # 20 seconds left over, split 1:3 between a and b, then smoothed
+        self.assertEqual(durations, {'a': 3.5, 'b': 10.5, 'c': 5.0})
+
+    def test_nothing_known_splits_evenly(self):
+        self.assertEqual(shards.update_durations({}, ['a', 'b'], 8.0), {'a': 4.0, 'b': 4.0})
+
+    def test_saved_and_loaded(self):
+        workdir = tempfile.mkdtemp()
+        saved = shards.DURATIONS_FILENAME
+        shards.DURATIONS_FILENAME = os.path.join(workdir, 'durations')
+        try:
+            self.assertEqual(shards.load_durations(), {})
+            shards.save_durations({'test/a.js': 1.5})
+            self.assertEqual(shards.load_durations(), {'test/a.js': 1.5})
+        finally:
+            shards.DURATIONS_FILENAME = saved
+            shutil.rmtree(workdir)
+
+if __name__ == '__main__':
+    unittest.main()
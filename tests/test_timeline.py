@@ -0,0 +1,86 @@
+"""
+The per-second timeline and its CSV and binary forms.
+"""
+
+import csv
+import os
+import shutil
+import tempfile
+import unittest
+
+from beegeeswithmachineguns.histogram import GROWTH
+from beegeeswithmachineguns.timeline import Timeline, parse_timestamp
+
+def _timeline():
+    timeline = Timeline()
+    for i in range(100):
+        timeline.record(1000.25 + i / 100.0, 10 + i, failed=i % 10 == 0)
+    timeline.record(1003.5, 2500)
+    return timeline
+
+class TimelineTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_rows_cover_quiet_seconds(self):
+        rows = list(_timeline().rows())
+
+        self.assertEqual([row[:4] for row in rows], [(1000, 0, 75, 8), (1001, 1, 25, 2), (1002, 2, 0, 0), (1003, 3, 1, 0)])
+        self.assertEqual(rows[2][4:], (None, None, None, None))
+        self.assertEqual(rows[3][7], 2500)
+
+    def test_merge_lines_up_the_seconds(self):
+        other = Timeline()
+        other.record(1001.9, 5, failed=True)
+        merged = _timeline().merge(other)
+
+        self.assertEqual(merged.buckets[1001][:2], [26, 3])
+        self.assertEqual(merged.buckets[1001][2].min, 5)
+        self.assertEqual(merged.peak(), (1000, 75))
+
+    def test_csv(self):
+        path = os.path.join(self.workdir, 'timeline.csv')
+        _timeline().write_csv(path)
+
+        with open(path, 'rb') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0], ['time', 'offset', 'completed', 'failed', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms'])
+        self.assertEqual(rows[3], ['1002', '2', '0', '0', '', '', '', ''])
+
+    def test_binary_round_trip(self):
+        timeline = _timeline()
+        path = os.path.join(self.workdir, 'timeline.bin')
+        timeline.write_binary(path)
+
+        read = Timeline.read_binary(path)
+
+        self.assertEqual(sorted(read.buckets), sorted(timeline.buckets))
+        buckets = 0
+        for second, (completed, failed, latency) in timeline.buckets.items():
+            read_completed, read_failed, read_latency = read.buckets[second]
+            self.assertEqual((read_completed, read_failed), (completed, failed))
+            self.assertEqual(read_latency.buckets, latency.buckets)
+            self.assertEqual(read_latency.count, latency.count)
+            for percent in (50, 99, 100):
+                self.assertTrue(abs(read_latency.percentile(percent) - latency.percentile(percent)) <= latency.percentile(percent) * (GROWTH - 1))
+            buckets += len(latency.buckets)
+        # a header, then each second and each of its histogram buckets
+        self.assertEqual(os.path.getsize(path), 10 + 18 * len(timeline.buckets) + 6 * buckets)
+
+    def test_binary_rejects_other_files(self):
+        path = os.path.join(self.workdir, 'timeline.csv')
+        _timeline().write_csv(path)
+        self.assertRaises(ValueError, Timeline.read_binary, path)
+
+class ParseTimestampTest(unittest.TestCase):
+    def test_formats(self):
+        self.assertEqual(parse_timestamp('2015-06-01T12:00:00.250Z'), 1433160000.25)
+        self.assertEqual(parse_timestamp('2015-06-01T12:00:00Z'), 1433160000)
+        self.assertEqual(parse_timestamp(1433160000250), 1433160000.25)
+        self.assertEqual(parse_timestamp('yesterday'), None)
+
+if __name__ == '__main__':
+    unittest.main()
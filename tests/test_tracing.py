@@ -0,0 +1,45 @@
+"""
+Tracing spans, including those recorded in worker processes.
+"""
+
+import os
+import unittest
+
+from beegeeswithmachineguns import beegees
+from beegeeswithmachineguns.tracing import tracer
+
+def _work(i):
+    with tracer.span('work', i):
+        return os.getpid()
+
+class TracerTest(unittest.TestCase):
+    def setUp(self):
+        tracer.start()
+
+    def tearDown(self):
+        tracer.stop()
+        beegees.set_executor()
+
+    def test_spans_summed_per_name(self):
+        tracer.add('ssh.exec', 1.0, 1.5, 0)
+        tracer.add('ssh.exec', 2.0, 2.25, 1)
+        tracer.add('ec2.describe_instances', 1.0, 1.1)
+
+        self.assertEqual([row[:3] for row in tracer.summary()], [('ssh.exec', 2, 0.75), ('ec2.describe_instances', 1, 0.1)])
+
+    def test_nothing_recorded_while_stopped(self):
+        tracer.stop()
+        with tracer.span('work', 0):
+            pass
+        self.assertEqual(tracer.events, [])
+
+    def test_spans_come_home_from_worker_processes(self):
+        beegees.set_executor('process', 2)
+        pids = beegees._fan_out(_work, range(4))
+
+        self.assertTrue(os.getpid() not in pids)
+        self.assertEqual(sorted(event['args']['bee'] for event in tracer.events), [0, 1, 2, 3])
+        self.assertEqual(sorted(event['pid'] for event in tracer.events), sorted(pids))
+
+if __name__ == '__main__':
+    unittest.main()